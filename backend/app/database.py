@@ -1,7 +1,8 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, Date, UniqueConstraint, Index, text
-from datetime import datetime
+from sqlalchemy.orm import declarative_base, sessionmaker, make_transient_to_detached
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, Date, UniqueConstraint, Index, text, event, and_, literal_column, select, update, delete
+from sqlalchemy import inspect as sa_inspect
+from datetime import datetime, date, timedelta
 import os
 from pathlib import Path
 import ssl as ssl_module
@@ -270,6 +271,10 @@ class Trade(Base):
         Index('idx_user_open_time', 'user_id', 'is_deleted', 'open_time'),
         Index('idx_user_strategy_open_time', 'user_id', 'strategy_id', 'is_deleted', 'open_time'),
         Index('idx_trades_open_trade_id', 'user_id', 'strategy_id', 'open_trade_id'),
+        Index('idx_trades_user_open_date_bj', 'user_id', 'is_deleted', 'open_date_bj'),
+        Index('idx_trades_user_close_date_bj', 'user_id', 'is_deleted', 'close_date_bj'),
+        Index('idx_trades_strategy_open_date_bj', 'user_id', 'strategy_id', 'is_deleted', 'open_date_bj'),
+        Index('idx_trades_strategy_close_date_bj', 'user_id', 'strategy_id', 'is_deleted', 'close_date_bj'),
     )
     
     id = Column(Integer, primary_key=True, index=True)
@@ -280,6 +285,8 @@ class Trade(Base):
     stock_name = Column(String)
     open_time = Column(DateTime, nullable=False, index=True)
     close_time = Column(DateTime)
+    open_date_bj = Column(Date, nullable=True)  # 开仓日期（北京时间，写入时维护）
+    close_date_bj = Column(Date, nullable=True)  # 平仓日期（北京时间，写入时维护）
     shares = Column(Integer, nullable=False)
     commission = Column(Float, default=0)  # 总手续费（兼容旧数据，等于buy_commission + sell_commission）
     buy_commission = Column(Float, default=0)  # 买入手续费
@@ -319,6 +326,23 @@ class Strategy(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class Symbol(Base):
+    """股票代码表（代码 → 名称），由后台刷新任务批量维护"""
+    __tablename__ = "symbols"
+
+    id = Column(Integer, primary_key=True, index=True)
+    code = Column(String, nullable=False, unique=True, index=True)  # 与交易记录一致的代码（如 600000）
+    exchange = Column(String, nullable=True)  # sh / sz
+    name = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SchemaMigration(Base):
+    """已执行的一次性数据迁移（按名称记录）"""
+    __tablename__ = "schema_migrations"
+
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
 class StrategyCapitalHistory(Base):
     __tablename__ = "strategy_capital_history"
     __table_args__ = (
@@ -359,6 +383,8 @@ class ForexTrade(Base):
     __table_args__ = (
         Index('idx_forex_user_open_time', 'user_id', 'is_deleted', 'open_time'),
         Index('idx_forex_user_strategy_open_time', 'user_id', 'strategy_id', 'is_deleted', 'open_time'),
+        Index('idx_forex_strategy_open_date_bj', 'user_id', 'strategy_id', 'is_deleted', 'open_date_bj'),
+        Index('idx_forex_strategy_close_date_bj', 'user_id', 'strategy_id', 'is_deleted', 'close_date_bj'),
     )
     
     id = Column(Integer, primary_key=True, index=True)
@@ -369,6 +395,8 @@ class ForexTrade(Base):
     lots = Column(Float, nullable=False)
     open_time = Column(DateTime, nullable=False, index=True)
     close_time = Column(DateTime)
+    open_date_bj = Column(Date, nullable=True)  # 开仓日期（北京时间，写入时维护）
+    close_date_bj = Column(Date, nullable=True)  # 平仓日期（北京时间，写入时维护）
     open_price = Column(Float, nullable=False)
     close_price = Column(Float)
     sl = Column(Float)
@@ -383,6 +411,140 @@ class ForexTrade(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+def dialect_insert(db):
+    """返回当前连接方言的 insert 构造函数（支持 on_conflict_do_update），不支持时返回 None
+    db 可以是会话或连接"""
+    bind = db.get_bind() if hasattr(db, "get_bind") else db
+    dialect = bind.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+async def migration_applied(db, name: str) -> bool:
+    """一次性迁移是否已执行（db 可以是会话或连接）"""
+    result = await db.execute(select(SchemaMigration.name).where(SchemaMigration.name == name))
+    return result.first() is not None
+
+async def mark_migration_applied(db, name: str) -> None:
+    """记录一次性迁移已执行（多进程同时记录时忽略冲突）"""
+    insert = dialect_insert(db)
+    values = {"name": name, "applied_at": datetime.utcnow()}
+    if insert is None:
+        if not await migration_applied(db, name):
+            await db.execute(SchemaMigration.__table__.insert().values(**values))
+        return
+    await db.execute(insert(SchemaMigration).values(**values).on_conflict_do_nothing(index_elements=["name"]))
+
+async def claim_migration(db, name: str, lease: timedelta) -> bool:
+    """抢占一次性迁移的执行权，多进程同时启动时只有一个返回 True
+    认领记录（name:claim）与完成标记分开保存；认领超过 lease 仍未完成视为执行者已退出，可被重新认领
+    认领会立即提交，调用方完成后写入 mark_migration_applied 并 release_migration"""
+    claim = f"{name}:claim"
+    now = datetime.utcnow()
+    insert = dialect_insert(db)
+    if insert is None:
+        claimed = not await migration_applied(db, claim)
+        if claimed:
+            await db.execute(SchemaMigration.__table__.insert().values(name=claim, applied_at=now))
+    else:
+        result = await db.execute(
+            insert(SchemaMigration).values(name=claim, applied_at=now).on_conflict_do_nothing(index_elements=["name"])
+        )
+        claimed = result.rowcount == 1
+    if not claimed:
+        result = await db.execute(
+            update(SchemaMigration)
+            .where(SchemaMigration.name == claim, SchemaMigration.applied_at < now - lease)
+            .values(applied_at=now)
+        )
+        claimed = result.rowcount == 1
+    await db.commit()
+    return claimed
+
+async def release_migration(db, name: str) -> None:
+    """释放 claim_migration 的认领（完成或失败后调用，失败时下次启动可立即重试）"""
+    await db.execute(delete(SchemaMigration).where(SchemaMigration.name == f"{name}:claim"))
+    await db.commit()
+
+def detached_snapshot(instance):
+    """复制列值生成独立的 detached 实例（可跨会话缓存，用 session.merge(load=False) 并入会话）"""
+    model = type(instance)
+    snapshot = model(**{attr.key: getattr(instance, attr.key) for attr in sa_inspect(model).column_attrs})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+# 交易时间按UTC存储，日历/资金曲线按北京时间日期分组
+BEIJING_OFFSET = timedelta(hours=8)
+
+def beijing_date(dt: datetime | None) -> date | None:
+    """UTC时间对应的北京时间日期"""
+    if dt is None:
+        return None
+    return (dt + BEIJING_OFFSET).date()
+
+def _sync_trade_dates_bj(mapper, connection, target) -> None:
+    target.open_date_bj = beijing_date(target.open_time)
+    target.close_date_bj = beijing_date(target.close_time)
+
+for _trade_model in (Trade, ForexTrade):
+    event.listen(_trade_model, "before_insert", _sync_trade_dates_bj)
+    event.listen(_trade_model, "before_update", _sync_trade_dates_bj)
+
+_TRADE_DATE_BJ_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_trades_user_open_date_bj ON trades(user_id, is_deleted, open_date_bj)",
+    "CREATE INDEX IF NOT EXISTS idx_trades_user_close_date_bj ON trades(user_id, is_deleted, close_date_bj)",
+    "CREATE INDEX IF NOT EXISTS idx_trades_strategy_open_date_bj ON trades(user_id, strategy_id, is_deleted, open_date_bj)",
+    "CREATE INDEX IF NOT EXISTS idx_trades_strategy_close_date_bj ON trades(user_id, strategy_id, is_deleted, close_date_bj)",
+    "CREATE INDEX IF NOT EXISTS idx_forex_strategy_open_date_bj ON forex_trades(user_id, strategy_id, is_deleted, open_date_bj)",
+    "CREATE INDEX IF NOT EXISTS idx_forex_strategy_close_date_bj ON forex_trades(user_id, strategy_id, is_deleted, close_date_bj)",
+)
+
+def open_position_filter(model):
+    """未平仓且未删除的过滤条件，与部分索引 WHERE 一致
+    status 以字面量渲染（绑定参数无法匹配 SQLite 部分索引）"""
+    return and_(model.status == literal_column("'open'"), model.is_deleted == False)
+
+async def _create_open_position_indexes(conn, db_type: str) -> None:
+    """未平仓持仓部分索引：已平仓历史再多，持仓查询也只扫描未平仓行"""
+    predicate = "status = 'open' AND is_deleted = 0" if db_type == "SQLite" else "status = 'open' AND NOT is_deleted"
+    await conn.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS idx_trades_open_positions ON trades(user_id, strategy_id) WHERE {predicate}"
+    )
+    # 闹铃监控全量扫描所有未平仓持仓
+    await conn.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS idx_trades_open_positions_all ON trades(stock_code) WHERE {predicate}"
+    )
+    await conn.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS idx_forex_trades_open_positions ON forex_trades(user_id, strategy_id) WHERE {predicate}"
+    )
+
+TRADE_DATES_BJ_MIGRATION = "trade_dates_bj"
+
+async def _backfill_trade_dates_bj(conn, db_type: str) -> None:
+    """为旧数据补齐北京时间日期列（一次性迁移，之后的写入由 ORM 事件维护）"""
+    if await migration_applied(conn, TRADE_DATES_BJ_MIGRATION):
+        return
+    if db_type == "SQLite":
+        open_expr = "DATE(open_time, '+8 hours')"
+        close_expr = "DATE(close_time, '+8 hours')"
+    else:
+        open_expr = "CAST(open_time + INTERVAL '8 hours' AS DATE)"
+        close_expr = "CAST(close_time + INTERVAL '8 hours' AS DATE)"
+    for table in ("trades", "forex_trades"):
+        await conn.exec_driver_sql(
+            f"UPDATE {table} SET open_date_bj = {open_expr} WHERE open_date_bj IS NULL AND open_time IS NOT NULL"
+        )
+        await conn.exec_driver_sql(
+            f"UPDATE {table} SET close_date_bj = {close_expr} WHERE close_date_bj IS NULL AND close_time IS NOT NULL"
+        )
+    for statement in _TRADE_DATE_BJ_INDEXES:
+        await conn.exec_driver_sql(statement)
+    await mark_migration_applied(conn, TRADE_DATES_BJ_MIGRATION)
+
 async def _init_schema(conn, db_type: str) -> None:
     await conn.run_sync(Base.metadata.create_all)
     if db_type == "SQLite":
@@ -409,6 +571,10 @@ async def _init_schema(conn, db_type: str) -> None:
             await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN client_request_id VARCHAR")
         if "open_trade_id" not in cols:
             await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN open_trade_id INTEGER")
+        if "open_date_bj" not in cols:
+            await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN open_date_bj DATE")
+        if "close_date_bj" not in cols:
+            await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN close_date_bj DATE")
         await conn.exec_driver_sql(
             "CREATE UNIQUE INDEX IF NOT EXISTS uq_trades_user_client_request_id ON trades(user_id, client_request_id) WHERE client_request_id IS NOT NULL"
         )
@@ -423,6 +589,12 @@ async def _init_schema(conn, db_type: str) -> None:
             await conn.exec_driver_sql("ALTER TABLE forex_trades ADD COLUMN strategy_id INTEGER")
         if "client_request_id" not in cols:
             await conn.exec_driver_sql("ALTER TABLE forex_trades ADD COLUMN client_request_id VARCHAR")
+        if "open_date_bj" not in cols:
+            await conn.exec_driver_sql("ALTER TABLE forex_trades ADD COLUMN open_date_bj DATE")
+        if "close_date_bj" not in cols:
+            await conn.exec_driver_sql("ALTER TABLE forex_trades ADD COLUMN close_date_bj DATE")
+        await _backfill_trade_dates_bj(conn, db_type)
+        await _create_open_position_indexes(conn, db_type)
         await conn.exec_driver_sql(
             "CREATE UNIQUE INDEX IF NOT EXISTS uq_forex_trades_user_client_request_id ON forex_trades(user_id, client_request_id) WHERE client_request_id IS NOT NULL"
         )
@@ -448,6 +620,12 @@ async def _init_schema(conn, db_type: str) -> None:
     await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN IF NOT EXISTS client_request_id VARCHAR")
     await conn.exec_driver_sql("ALTER TABLE forex_trades ADD COLUMN IF NOT EXISTS client_request_id VARCHAR")
     await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN IF NOT EXISTS open_trade_id INTEGER")
+    await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN IF NOT EXISTS open_date_bj DATE")
+    await conn.exec_driver_sql("ALTER TABLE trades ADD COLUMN IF NOT EXISTS close_date_bj DATE")
+    await conn.exec_driver_sql("ALTER TABLE forex_trades ADD COLUMN IF NOT EXISTS open_date_bj DATE")
+    await conn.exec_driver_sql("ALTER TABLE forex_trades ADD COLUMN IF NOT EXISTS close_date_bj DATE")
+    await _backfill_trade_dates_bj(conn, db_type)
+    await _create_open_position_indexes(conn, db_type)
     await conn.exec_driver_sql(
         "CREATE UNIQUE INDEX IF NOT EXISTS uq_trades_user_client_request_id ON trades(user_id, client_request_id) WHERE client_request_id IS NOT NULL"
     )
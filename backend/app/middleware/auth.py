@@ -4,9 +4,11 @@ from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+from collections import OrderedDict
 import asyncio
+import time
 
-from app.database import get_db, User
+from app.database import get_db, User, detached_snapshot
 import os
 from datetime import date, datetime, timedelta
 
@@ -31,6 +33,72 @@ ALGORITHM = "HS256"
 
 security = HTTPBearer()
 
+
+class AuthUserCache:
+    """已认证用户缓存：按 user_id 保存脱离会话的用户快照（LRU + 短 TTL）
+    修改用户字段的路径（登录、计费、邮箱提醒、初始资金、后台管理）需调用 invalidate"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))
+        self.max_entries = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+        self._entries: "OrderedDict[int, tuple[float, User]]" = OrderedDict()
+
+    def get(self, user_id: int) -> User | None:
+        cached = self._entries.get(user_id)
+        if cached is None:
+            return None
+        expires_at, snapshot = cached
+        if expires_at <= time.monotonic():
+            self._entries.pop(user_id, None)
+            return None
+        self._entries.move_to_end(user_id)
+        return snapshot
+
+    def put(self, user: User):
+        if self.ttl <= 0:
+            return
+        # 独立的 detached 快照，不与任何请求会话共享状态
+        self._entries[user.id] = (time.monotonic() + self.ttl, detached_snapshot(user))
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+
+# 全局认证用户缓存
+auth_user_cache = AuthUserCache()
+
+
+async def _load_user(db: AsyncSession, user_id: int) -> User | None:
+    """按 id 获取用户：命中缓存时把快照并入当前会话（不查询数据库），否则查询并缓存"""
+    cached = auth_user_cache.get(user_id)
+    if cached is not None:
+        # load=False：不发 SELECT，返回的实例归属当前会话，路由中的修改可以正常提交
+        return await db.merge(cached, load=False)
+
+    db_timeout_s = float(os.getenv("DB_QUERY_TIMEOUT", "8"))
+    try:
+        result = await asyncio.wait_for(db.execute(select(User).where(User.id == user_id)), timeout=db_timeout_s)
+    except (asyncio.TimeoutError, TimeoutError, SQLAlchemyError):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="数据库暂不可用，请稍后重试")
+    user = result.scalar_one_or_none()
+    if user is not None:
+        auth_user_cache.put(user)
+    return user
+
+async def authenticate_token(db: AsyncSession, token: str) -> User | None:
+    """校验 JWT 并返回对应用户（用于无法使用 Bearer 依赖的场景，如 WebSocket），失败返回 None"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id = payload.get("userId")
+    if user_id is None:
+        return None
+    return await _load_user(db, user_id)
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
@@ -50,12 +118,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    db_timeout_s = float(os.getenv("DB_QUERY_TIMEOUT", "8"))
-    try:
-        result = await asyncio.wait_for(db.execute(select(User).where(User.id == user_id)), timeout=db_timeout_s)
-    except (asyncio.TimeoutError, TimeoutError, SQLAlchemyError):
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="数据库暂不可用，请稍后重试")
-    user = result.scalar_one_or_none()
+    user = await _load_user(db, user_id)
     if user is None:
         raise credentials_exception
     
@@ -84,12 +147,7 @@ async def get_current_admin(
     except JWTError:
         raise credentials_exception
 
-    db_timeout_s = float(os.getenv("DB_QUERY_TIMEOUT", "8"))
-    try:
-        result = await asyncio.wait_for(db.execute(select(User).where(User.id == user_id)), timeout=db_timeout_s)
-    except (asyncio.TimeoutError, TimeoutError, SQLAlchemyError):
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="数据库暂不可用，请稍后重试")
-    user = result.scalar_one_or_none()
+    user = await _load_user(db, user_id)
     if user is None:
         raise credentials_exception
 
@@ -74,6 +74,7 @@ class PaginatedAdminUserResponse(BaseModel):
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None  # 游标分页续页令牌
 
 class AdminUserUpdate(BaseModel):
     is_paid: Optional[bool] = None
@@ -148,6 +149,7 @@ class PaginatedPaymentOrderResponse(BaseModel):
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None  # 游标分页续页令牌
 
 
 class PaymentQrConfigResponse(BaseModel):
@@ -292,6 +294,7 @@ class PaginatedTradeResponse(BaseModel):
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None  # 游标分页续页令牌
 
 # 持仓相关
 class PositionUpdate(BaseModel):
@@ -426,6 +429,7 @@ class ForexPaginatedTradeResponse(BaseModel):
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None  # 游标分页续页令牌
 
 class ForexCapitalPoint(BaseModel):
     date: date
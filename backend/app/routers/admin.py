@@ -3,14 +3,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, or_, and_, String, cast
 from datetime import datetime, timedelta, date
 from jose import jwt
-from passlib.context import CryptContext
 import os
 import secrets
 from typing import Optional
 from pathlib import Path
 
 from app.database import get_db, User, Trade, ForexTrade, PaymentOrder, BillingPlanPrice
-from app.middleware.auth import get_current_admin, user_has_active_subscription
+from app.middleware.auth import get_current_admin, user_has_active_subscription, auth_user_cache
+from app.services.pagination import count_cache, keyset_before, next_cursor
+from app.services.password_hasher import password_hasher
 from app.models import (
     AdminLogin,
     AdminTokenResponse,
@@ -28,7 +29,6 @@ from app.models import (
 )
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -135,7 +135,7 @@ async def admin_login(payload: AdminLogin):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误")
 
     if admin_password_hash:
-        ok = pwd_context.verify(payload.password, admin_password_hash)
+        ok = await password_hasher.verify(payload.password, admin_password_hash)
     else:
         ok = secrets.compare_digest(str(payload.password), str(admin_password or ""))
 
@@ -256,6 +256,7 @@ async def list_users(
     query: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
+    cursor: Optional[str] = None,
     _: dict = Depends(get_current_admin),
     db: AsyncSession = Depends(get_db),
 ):
@@ -271,15 +272,16 @@ async def list_users(
         stmt = stmt.where(filter_expr)
         count_stmt = count_stmt.where(filter_expr)
 
-    total = (await db.execute(count_stmt)).scalar_one()
+    total = await count_cache.count(db, ("admin_users", query or ""), count_stmt)
     total_pages = max(1, (int(total or 0) + page_size - 1) // page_size)
-    page = min(page, total_pages)
 
-    result = await db.execute(
-        stmt.order_by(User.created_at.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-    )
+    stmt = stmt.order_by(User.created_at.desc(), User.id.desc()).limit(page_size)
+    if cursor:
+        stmt = stmt.where(keyset_before(User.created_at, User.id, cursor))
+    else:
+        page = min(page, total_pages)
+        stmt = stmt.offset((page - 1) * page_size)
+    result = await db.execute(stmt)
     users = result.scalars().all()
 
     items = [
@@ -303,6 +305,7 @@ async def list_users(
         page=page,
         page_size=page_size,
         total_pages=total_pages,
+        next_cursor=next_cursor(users, page_size, "created_at"),
     )
 
 
@@ -331,6 +334,7 @@ async def update_user(
         user.total_paid = float(payload.total_paid)
 
     await db.commit()
+    auth_user_cache.invalidate(user.id)
     await db.refresh(user)
 
     return AdminUserListItem(
@@ -352,6 +356,7 @@ async def list_payment_orders(
     status: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
+    cursor: Optional[str] = None,
     admin: dict = Depends(get_current_admin),
     db: AsyncSession = Depends(get_db),
 ):
@@ -373,15 +378,16 @@ async def list_payment_orders(
         stmt = stmt.where(cond)
         count_stmt = count_stmt.where(cond)
 
-    total = int((await db.execute(count_stmt)).scalar_one() or 0)
+    total = await count_cache.count(db, ("payment_orders", query or "", status or ""), count_stmt)
     total_pages = max(1, (total + page_size - 1) // page_size)
-    page = min(page, total_pages)
 
-    result = await db.execute(
-        stmt.order_by(PaymentOrder.created_at.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-    )
+    stmt = stmt.order_by(PaymentOrder.created_at.desc(), PaymentOrder.id.desc()).limit(page_size)
+    if cursor:
+        stmt = stmt.where(keyset_before(PaymentOrder.created_at, PaymentOrder.id, cursor))
+    else:
+        page = min(page, total_pages)
+        stmt = stmt.offset((page - 1) * page_size)
+    result = await db.execute(stmt)
     orders = result.scalars().all()
 
     items = [
@@ -409,6 +415,7 @@ async def list_payment_orders(
         page=page,
         page_size=page_size,
         total_pages=total_pages,
+        next_cursor=next_cursor(orders, page_size, "created_at"),
     )
 
 
@@ -448,6 +455,8 @@ async def approve_payment_order(
     order.approved_at = now
 
     await db.commit()
+    auth_user_cache.invalidate(user.id)
+    count_cache.invalidate("payment_orders")
     await db.refresh(order)
 
     return PaymentOrderItem(
@@ -486,6 +495,7 @@ async def cancel_payment_order(
     order.approved_at = datetime.utcnow()
 
     await db.commit()
+    count_cache.invalidate("payment_orders")
     await db.refresh(order)
 
     return PaymentOrderItem(
@@ -2,12 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text
 from sqlalchemy.exc import SQLAlchemyError
-from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta
 import asyncio
 
 from app.database import get_db, User, CapitalHistory
+from app.middleware.auth import auth_user_cache
+from app.services.password_hasher import password_hasher
 from app.models import UserRegister, UserLogin, TokenResponse, UserResponse
 import os
 import logging
@@ -15,8 +16,6 @@ import logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-# 使用pbkdf2_sha256作为密码加密方案（更兼容，无bcrypt版本问题）
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -93,7 +92,7 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
         )
     
     # 创建用户
-    password_hash = pwd_context.hash(user_data.password)
+    password_hash = await password_hasher.hash(user_data.password)
     pro_until = (datetime.utcnow() + timedelta(days=365)).date()
     new_user = User(
         username=user_data.username,
@@ -213,14 +212,19 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
             detail="用户名或密码错误"
         )
     
-    if not pwd_context.verify(user_data.password, user.password_hash):
+    ok, new_hash = await password_hasher.verify_and_update(user_data.password, user.password_hash)
+    if not ok:
         logger.warning(f"❌ [登录失败] 密码错误: {user_data.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误"
         )
     
+    if new_hash:
+        # 哈希参数已变更，登录成功时透明升级
+        user.password_hash = new_hash
     user.last_login_at = datetime.utcnow()
+    auth_user_cache.invalidate(user.id)
     try:
         await asyncio.wait_for(db.commit(), timeout=3.0)
     except Exception as e:
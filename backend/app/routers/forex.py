@@ -3,13 +3,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, update, and_, or_
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, date, timezone, timedelta
-import asyncio
 import time
 import aiohttp
 
-from app.database import get_db, User, ForexAccount, ForexTrade, Strategy, AsyncSessionLocal
+from app.database import get_db, User, ForexAccount, ForexTrade, Strategy, open_position_filter
 from app.middleware.auth import get_current_user, billing_enabled, user_has_active_subscription
 from app.routers.user import _get_forex_strategy
+from app.services.recompute_scheduler import recompute_scheduler
+from app.services.pagination import count_cache, keyset_before, next_cursor
+from app.services.strategy_directory import strategy_directory
 from app.models import (
     ForexAccountResponse,
     ForexAccountUpdate,
@@ -150,6 +152,7 @@ async def _recalculate_account(db: AsyncSession, user_id: int, strategy_id: int
             ForexTrade.status == "closed",
             ForexTrade.close_time.isnot(None),
             ForexTrade.strategy_id == strategy_id if strategy_id is not None else True,
+            ForexTrade.close_date_bj >= anchor_date if anchor_date is not None else True,
         )
         .order_by(ForexTrade.close_time.asc())
     )
@@ -160,8 +163,6 @@ async def _recalculate_account(db: AsyncSession, user_id: int, strategy_id: int
     max_drawdown = 0.0
 
     for t in closed:
-        if anchor_date is not None and t.close_time is not None and t.close_time.date() < anchor_date:
-            continue
         if t.profit is None and t.close_price is not None:
             gross = _calc_profit(t.symbol, t.side, t.lots, t.open_price, t.close_price)
             t.profit = float(gross) - float(t.commission or 0) - float(t.swap or 0)
@@ -173,8 +174,7 @@ async def _recalculate_account(db: AsyncSession, user_id: int, strategy_id: int
     open_result = await db.execute(
         select(ForexTrade).where(
             ForexTrade.user_id == user_id,
-            ForexTrade.is_deleted == False,
-            ForexTrade.status == "open",
+            open_position_filter(ForexTrade),
             ForexTrade.strategy_id == strategy_id if strategy_id is not None else True,
         )
     )
@@ -204,6 +204,20 @@ async def _recalculate_account(db: AsyncSession, user_id: int, strategy_id: int
     await db.refresh(account)
     return account
 
+# 未指定策略时按账户整体重算，调度键中用 0 表示
+_ACCOUNT_SCOPE = 0
+
+async def _recompute_forex_strategy(db: AsyncSession, user_id: int, strategy_id: int, start_date: date | None):
+    await _recalculate_account(db, user_id, strategy_id or None)
+
+recompute_scheduler.register("forex", _recompute_forex_strategy)
+
+async def _recompute_account(db: AsyncSession, user_id: int, strategy_id: int | None) -> ForexAccount:
+    """经调度器重算账户（与后台重算同键串行），返回刷新后的账户"""
+    await recompute_scheduler.run("forex", user_id, strategy_id or _ACCOUNT_SCOPE)
+    account = await _get_or_create_account(db, user_id)
+    await db.refresh(account)
+    return account
 
 def _to_account_response(account: ForexAccount) -> ForexAccountResponse:
     return ForexAccountResponse(
@@ -286,7 +300,7 @@ async def get_account(
     db: AsyncSession = Depends(get_db),
 ):
     strategy = await _get_forex_strategy(db, current_user, strategy_id)
-    account = await _recalculate_account(db, current_user.id, strategy.id)
+    account = await _recompute_account(db, current_user.id, strategy.id)
     return _to_account_response(account)
 
 
@@ -346,7 +360,7 @@ async def update_account(
         account.free_margin = payload.balance
         account.peak_equity = max(account.peak_equity or payload.balance, payload.balance)
     await db.commit()
-    account = await _recalculate_account(db, current_user.id, strategy_id)
+    account = await _recompute_account(db, current_user.id, strategy_id)
     return _to_account_response(account)
 
 
@@ -363,6 +377,7 @@ async def set_initial_capital(
         if payload.initial_date is not None:
             strategy.initial_date = payload.initial_date
         await db.commit()
+        strategy_directory.invalidate(current_user.id)
     else:
         account = await _get_or_create_account(db, current_user.id)
         account.initial_balance = payload.initial_balance
@@ -370,8 +385,7 @@ async def set_initial_capital(
             account.initial_date = payload.initial_date
         await db.commit()
 
-    await _recalculate_account(db, current_user.id, strategy_id)
-    account = await _get_or_create_account(db, current_user.id)
+    account = await _recompute_account(db, current_user.id, strategy_id)
     return _to_account_response(account)
 
 @router.post("/account/reset", response_model=ForexAccountResponse, summary="重置外汇账户与交易数据")
@@ -410,12 +424,13 @@ async def reset_account(
             .values(is_deleted=True, updated_at=now)
         )
         await db.commit()
-        await db.refresh(account)
-        account = await _recalculate_account(db, current_user.id, strategy_id)
+        count_cache.invalidate("forex_trades", current_user.id)
+        account = await _recompute_account(db, current_user.id, strategy_id)
         return _to_account_response(account)
 
     await db.execute(ForexTrade.__table__.delete().where(ForexTrade.user_id == current_user.id))
     await db.commit()
+    count_cache.invalidate("forex_trades", current_user.id)
     await db.refresh(account)
     return _to_account_response(account)
 
@@ -432,8 +447,7 @@ async def get_positions(
         .where(
             ForexTrade.user_id == current_user.id,
             ForexTrade.strategy_id == strategy.id,
-            ForexTrade.status == "open",
-            ForexTrade.is_deleted == False,
+            open_position_filter(ForexTrade),
         )
         .order_by(ForexTrade.open_time.desc())
     )
@@ -446,32 +460,32 @@ async def get_trades(
     page: int = 1,
     page_size: int = 50,
     strategy_id: int | None = None,
+    cursor: str | None = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     strategy = await _get_forex_strategy(db, current_user, strategy_id)
-    count_result = await db.execute(
-        select(func.count())
-        .select_from(ForexTrade)
-        .where(
-            ForexTrade.user_id == current_user.id,
-            ForexTrade.strategy_id == strategy.id,
-            ForexTrade.is_deleted == False,
-        )
+    filters = [
+        ForexTrade.user_id == current_user.id,
+        ForexTrade.strategy_id == strategy.id,
+        ForexTrade.is_deleted == False,
+    ]
+    total = await count_cache.count(
+        db,
+        ("forex_trades", current_user.id, strategy.id),
+        select(func.count()).select_from(ForexTrade).where(*filters),
     )
-    total = int(count_result.scalar() or 0)
-    offset = (page - 1) * page_size
-    result = await db.execute(
+    stmt = (
         select(ForexTrade)
-        .where(
-            ForexTrade.user_id == current_user.id,
-            ForexTrade.strategy_id == strategy.id,
-            ForexTrade.is_deleted == False,
-        )
-        .order_by(ForexTrade.open_time.desc())
-        .offset(offset)
+        .where(*filters)
+        .order_by(ForexTrade.open_time.desc(), ForexTrade.id.desc())
         .limit(page_size)
     )
+    if cursor:
+        stmt = stmt.where(keyset_before(ForexTrade.open_time, ForexTrade.id, cursor))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+    result = await db.execute(stmt)
     items = result.scalars().all()
     total_pages = max(1, (total + page_size - 1) // page_size) if total else 0
     return ForexPaginatedTradeResponse(
@@ -480,6 +494,7 @@ async def get_trades(
         page=page,
         page_size=page_size,
         total_pages=total_pages,
+        next_cursor=next_cursor(items, page_size, "open_time"),
     )
 
 @router.get("/trades/dates", response_model=list[str], summary="获取外汇有交易记录的日期列表")
@@ -490,22 +505,17 @@ async def get_trade_dates(
 ):
     strategy = await _get_forex_strategy(db, current_user, strategy_id)
     result = await db.execute(
-        select(ForexTrade.open_time)
+        select(ForexTrade.open_date_bj)
         .where(
             ForexTrade.user_id == current_user.id,
             ForexTrade.strategy_id == strategy.id,
             ForexTrade.is_deleted == False,
+            ForexTrade.open_date_bj.isnot(None),
         )
-        .order_by(ForexTrade.open_time.asc())
+        .distinct()
+        .order_by(ForexTrade.open_date_bj.asc())
     )
-    trade_times = result.scalars().all()
-    date_set: set[date] = set()
-    for trade_time in trade_times:
-        if trade_time:
-            beijing_time = trade_time + timedelta(hours=8)
-            date_set.add(beijing_time.date())
-
-    return [d.isoformat() for d in sorted(date_set)]
+    return [d.isoformat() for d in result.scalars().all()]
 
 
 @router.post("/trades", response_model=ForexTradeResponse, status_code=status.HTTP_201_CREATED, summary="创建外汇开仓记录")
@@ -515,13 +525,6 @@ async def create_trade(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    async def _recalculate_account_async(user_id: int, strategy_id_value: int):
-        try:
-            async with AsyncSessionLocal() as session:
-                await _recalculate_account(session, user_id, strategy_id_value)
-        except Exception:
-            pass
-
     if billing_enabled() and not user_has_active_subscription(current_user):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -583,7 +586,8 @@ async def create_trade(
         raise HTTPException(status_code=409, detail=f"重复提交: {str(e)}")
 
     await db.refresh(trade)
-    asyncio.create_task(_recalculate_account_async(current_user.id, strategy.id))
+    count_cache.invalidate("forex_trades", current_user.id)
+    recompute_scheduler.schedule("forex", current_user.id, strategy.id)
     return _to_trade_response(trade)
 
 @router.delete("/trades/clear-all", summary="清空外汇交易记录（软删除）")
@@ -604,7 +608,8 @@ async def clear_all_trades(
         .values(is_deleted=True, updated_at=now)
     )
     await db.commit()
-    await _recalculate_account(db, current_user.id, strategy.id)
+    count_cache.invalidate("forex_trades", current_user.id)
+    await _recompute_account(db, current_user.id, strategy.id)
     deleted_count = int(getattr(result, "rowcount", 0) or 0)
     return {"message": "清空成功", "deleted_count": deleted_count}
 
@@ -684,7 +689,7 @@ async def close_trade(
 
     await db.commit()
     await db.refresh(trade)
-    await _recalculate_account(db, current_user.id, strategy.id)
+    await _recompute_account(db, current_user.id, strategy.id)
     return _to_trade_response(trade)
 
 
@@ -709,7 +714,8 @@ async def delete_trade(
         raise HTTPException(status_code=404, detail="Trade not found")
     trade.is_deleted = True
     await db.commit()
-    await _recalculate_account(db, current_user.id, strategy.id)
+    count_cache.invalidate("forex_trades", current_user.id)
+    await _recompute_account(db, current_user.id, strategy.id)
     return
 
 
@@ -735,11 +741,11 @@ async def get_capital_history(
             ForexTrade.strategy_id == strategy.id,
             ForexTrade.is_deleted == False,
             or_(
-                func.date(ForexTrade.open_time) >= anchor_date,
+                ForexTrade.open_date_bj >= anchor_date,
                 and_(
                     ForexTrade.status == "closed",
                     ForexTrade.close_time.isnot(None),
-                    func.date(ForexTrade.close_time) >= anchor_date,
+                    ForexTrade.close_date_bj >= anchor_date,
                 ),
             ),
         )
@@ -747,21 +753,19 @@ async def get_capital_history(
     )
     trades = result.scalars().all()
 
-    events: list[tuple[datetime, str, ForexTrade]] = []
+    events: list[tuple[datetime, date, str, ForexTrade]] = []
     for t in trades:
-        if t.open_time is not None and t.open_time.date() >= anchor_date:
-            events.append((t.open_time, "open", t))
-        if t.status == "closed" and t.close_time is not None and t.close_time.date() >= anchor_date:
-            events.append((t.close_time, "close", t))
+        if t.open_time is not None and t.open_date_bj is not None and t.open_date_bj >= anchor_date:
+            events.append((t.open_time, t.open_date_bj, "open", t))
+        if t.status == "closed" and t.close_time is not None and t.close_date_bj is not None and t.close_date_bj >= anchor_date:
+            events.append((t.close_time, t.close_date_bj, "close", t))
     events.sort(key=lambda x: x[0])
 
     points_by_date: dict[date, float] = {}
     running = baseline
     points_by_date[anchor_date] = running
 
-    for t_time, t_type, t in events:
-        beijing_dt = t_time + timedelta(hours=8)
-        d = beijing_dt.date()
+    for t_time, d, t_type, t in events:
         if end_date is not None and d > end_date:
             break
         if d < anchor_date:
@@ -1,15 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, tuple_
+from sqlalchemy import select, tuple_, update
 from datetime import datetime, date, timedelta
 from zoneinfo import ZoneInfo
 
-from app.database import get_db, Trade, CapitalHistory
+from app.database import get_db, Trade, CapitalHistory, beijing_date, open_position_filter
 from app.middleware.auth import get_current_user
 from app.models import PositionUpdate, TakeProfitRequest, StopLossRequest, TradeResponse
 from app.database import User
 from app.services.commission_calculator import default_calculator
-from app.routers.user import recalculate_strategy_capital_history, _get_stock_strategy
+from app.services.alert_monitor import alert_monitor
+from app.services.recompute_scheduler import recompute_scheduler
+from app.routers.user import _get_stock_strategy
+from app.services.serialization import FastJSONResponse, TRADE_COLUMNS, trade_item, fill_trade_names
+
+# 持仓列表中部分平仓明细所需的列
+_PARTIAL_CLOSE_COLUMNS = (
+    Trade.id,
+    Trade.open_trade_id,
+    Trade.close_time,
+    Trade.shares,
+    Trade.sell_price,
+    Trade.order_result,
+    Trade.profit_loss,
+    Trade.commission,
+)
 
 router = APIRouter()
 
@@ -108,67 +123,62 @@ async def get_positions(
 ):
     strategy = await _get_stock_strategy(db, current_user, strategy_id)
     result = await db.execute(
-        select(Trade)
+        select(*TRADE_COLUMNS)
         .where(
             Trade.user_id == current_user.id,
             Trade.strategy_id == strategy.id,
-            Trade.status == "open",
-            Trade.is_deleted == False  # 排除已删除的记录
+            open_position_filter(Trade)  # 未平仓且未删除（走部分索引）
         )
         .order_by(Trade.open_time.desc())
     )
-    positions = result.scalars().all()
+    # 按列投影构建响应（含风险回报比），不加载 ORM 对象
+    items = [trade_item(row) for row in result.all()]
     
     from app.services.price_monitor import price_monitor
 
-    for position in positions:
-        if position.open_time:
-            days = (datetime.utcnow() - position.open_time).days
-            position.holding_days = days
+    now = datetime.utcnow()
+    for position in items:
+        if position["open_time"]:
+            position["holding_days"] = (now - position["open_time"]).days
         
-        if position.stock_code:
-            cached_price, cached_source = price_monitor.get_current_price(position.stock_code)
+        if position["stock_code"]:
+            cached_price, cached_source = price_monitor.get_current_price(position["stock_code"])
             if cached_price is not None:
-                position.current_price = float(cached_price)
-                position.price_source = cached_source or "缓存"
+                position["current_price"] = float(cached_price)
+                position["price_source"] = cached_source or "缓存"
             else:
-                position.current_price = position.buy_price
-                position.price_source = "成本价"
-
-    stock_codes_to_fetch: dict[str, list[Trade]] = {}
-    for position in positions:
-        if (not position.stock_name or position.stock_name.strip() == "") and position.stock_code:
-            stock_codes_to_fetch.setdefault(position.stock_code, []).append(position)
-
-    for stock_code, positions_list in stock_codes_to_fetch.items():
-        fetched_name = await price_monitor.fetch_stock_name(stock_code)
-        if fetched_name:
-            for position in positions_list:
-                position.stock_name = fetched_name
+                position["current_price"] = position["buy_price"]
+                position["price_source"] = "成本价"
 
-    if stock_codes_to_fetch:
-        await db.commit()
+    needs_commit = await fill_trade_names(db, items)
     
     open_ids: list[int] = []
     key_to_open_ids: dict[tuple[str, datetime, float], list[int]] = {}
-    needs_backfill = False
-
-    for pos in positions:
-        if pos.id is None:
-            continue
-        if pos.open_trade_id is None:
-            pos.open_trade_id = pos.id
-            needs_backfill = True
-        open_id = int(pos.open_trade_id or pos.id)
+    missing_open_ids: list[int] = []
+
+    for pos in items:
+        if pos["open_trade_id"] is None:
+            pos["open_trade_id"] = pos["id"]
+            missing_open_ids.append(pos["id"])
+        open_id = int(pos["open_trade_id"])
         open_ids.append(open_id)
-        if pos.stock_code and pos.open_time and pos.buy_price is not None:
-            key = (pos.stock_code, pos.open_time, float(pos.buy_price))
+        if pos["stock_code"] and pos["open_time"] and pos["buy_price"] is not None:
+            key = (pos["stock_code"], pos["open_time"], float(pos["buy_price"]))
             key_to_open_ids.setdefault(key, []).append(open_id)
 
-    partial_close_groups: dict[int, list[Trade]] = {}
+    if missing_open_ids:
+        await db.execute(
+            update(Trade)
+            .where(Trade.id.in_(missing_open_ids))
+            .values(open_trade_id=Trade.id)
+            .execution_options(synchronize_session=False)
+        )
+        needs_commit = True
+
+    partial_close_groups: dict[int, list] = {}
     if open_ids:
         closed_result = await db.execute(
-            select(Trade)
+            select(*_PARTIAL_CLOSE_COLUMNS)
             .where(
                 Trade.user_id == current_user.id,
                 Trade.strategy_id == strategy.id,
@@ -178,8 +188,7 @@ async def get_positions(
             )
             .order_by(Trade.close_time.asc())
         )
-        closed_trades = closed_result.scalars().all()
-        for t in closed_trades:
+        for t in closed_result.all():
             if t.open_trade_id is None:
                 continue
             partial_close_groups.setdefault(int(t.open_trade_id), []).append(t)
@@ -187,7 +196,7 @@ async def get_positions(
     if key_to_open_ids:
         position_keys = list(key_to_open_ids.keys())
         legacy_result = await db.execute(
-            select(Trade)
+            select(*_PARTIAL_CLOSE_COLUMNS, Trade.stock_code, Trade.open_time, Trade.buy_price)
             .where(
                 Trade.user_id == current_user.id,
                 Trade.strategy_id == strategy.id,
@@ -198,8 +207,8 @@ async def get_positions(
             )
             .order_by(Trade.close_time.asc())
         )
-        legacy_trades = legacy_result.scalars().all()
-        for t in legacy_trades:
+        legacy_backfill: dict[int, list[int]] = {}
+        for t in legacy_result.all():
             if not (t.stock_code and t.open_time and t.buy_price is not None):
                 continue
             key = (t.stock_code, t.open_time, float(t.buy_price))
@@ -208,25 +217,28 @@ async def get_positions(
                 continue
             open_id = open_id_candidates[0]
             if t.open_trade_id != open_id:
-                t.open_trade_id = open_id
-                needs_backfill = True
+                legacy_backfill.setdefault(open_id, []).append(t.id)
             partial_close_groups.setdefault(open_id, []).append(t)
+        for open_id, trade_ids in legacy_backfill.items():
+            await db.execute(
+                update(Trade)
+                .where(Trade.id.in_(trade_ids))
+                .values(open_trade_id=open_id)
+                .execution_options(synchronize_session=False)
+            )
+            needs_commit = True
 
-    if needs_backfill:
+    if needs_commit:
         await db.commit()
 
-    items: list[TradeResponse] = []
-    for pos in positions:
-        open_id = int(pos.open_trade_id or pos.id)
-        partial_closes = partial_close_groups.get(open_id, [])
+    for pos in items:
+        partial_closes = partial_close_groups.get(int(pos["open_trade_id"]), [])
         closed_shares = sum(int(t.shares or 0) for t in partial_closes)
-        opened_shares = int(pos.shares or 0) + closed_shares
+        opened_shares = int(pos["shares"] or 0) + closed_shares
 
-        pos_dict = pos.__dict__.copy()
-        pos_dict["price_source"] = getattr(pos, "price_source", None)
-        pos_dict["opened_shares"] = opened_shares if opened_shares > 0 else None
-        pos_dict["closed_shares"] = closed_shares if closed_shares > 0 else 0
-        pos_dict["partial_closes"] = [
+        pos["opened_shares"] = opened_shares if opened_shares > 0 else None
+        pos["closed_shares"] = closed_shares if closed_shares > 0 else 0
+        pos["partial_closes"] = [
             {
                 "id": t.id,
                 "close_time": t.close_time,
@@ -239,9 +251,8 @@ async def get_positions(
             for t in partial_closes
             if t.close_time is not None
         ]
-        items.append(TradeResponse(**pos_dict))
 
-    return items
+    return FastJSONResponse(items)
 
 @router.put("/{position_id}", response_model=TradeResponse)
 async def update_position(
@@ -276,6 +287,7 @@ async def update_position(
     
     await db.commit()
     await db.refresh(position)
+    alert_monitor.sync_trade(position)
     
     # 计算风险回报比
     pos_dict = position.__dict__.copy()
@@ -383,10 +395,11 @@ async def take_profit(
 
         await db.commit()
         await db.refresh(position)
+        alert_monitor.remove_trade(position.id)
 
         strategy = await _get_stock_strategy(db, current_user, position.strategy_id)
-        start_date = position.open_time.date() if position.open_time else close_time.date()
-        await recalculate_strategy_capital_history(db, current_user.id, strategy.id, start_date)
+        start_date = beijing_date(position.open_time or close_time)
+        await recompute_scheduler.run("stock", current_user.id, strategy.id, start_date)
 
         pos_dict = position.__dict__.copy()
         if position.buy_price and position.stop_loss_price and position.take_profit_price:
@@ -440,10 +453,11 @@ async def take_profit(
 
     await db.commit()
     await db.refresh(closed_trade)
+    alert_monitor.sync_trade(position)
     
     strategy = await _get_stock_strategy(db, current_user, position.strategy_id)
-    start_date = position.open_time.date() if position.open_time else close_time.date()
-    await recalculate_strategy_capital_history(db, current_user.id, strategy.id, start_date)
+    start_date = beijing_date(position.open_time or close_time)
+    await recompute_scheduler.run("stock", current_user.id, strategy.id, start_date)
     
     trade_dict = closed_trade.__dict__.copy()
     trade_dict['risk_reward_ratio'] = closed_trade.theoretical_risk_reward_ratio
@@ -544,10 +558,11 @@ async def stop_loss(
 
         await db.commit()
         await db.refresh(position)
+        alert_monitor.remove_trade(position.id)
 
         strategy = await _get_stock_strategy(db, current_user, position.strategy_id)
-        start_date = position.open_time.date() if position.open_time else close_time.date()
-        await recalculate_strategy_capital_history(db, current_user.id, strategy.id, start_date)
+        start_date = beijing_date(position.open_time or close_time)
+        await recompute_scheduler.run("stock", current_user.id, strategy.id, start_date)
 
         pos_dict = position.__dict__.copy()
         pos_dict['risk_reward_ratio'] = position.theoretical_risk_reward_ratio
@@ -595,10 +610,11 @@ async def stop_loss(
 
     await db.commit()
     await db.refresh(closed_trade)
+    alert_monitor.sync_trade(position)
     
     strategy = await _get_stock_strategy(db, current_user, position.strategy_id)
-    start_date = position.open_time.date() if position.open_time else close_time.date()
-    await recalculate_strategy_capital_history(db, current_user.id, strategy.id, start_date)
+    start_date = beijing_date(position.open_time or close_time)
+    await recompute_scheduler.run("stock", current_user.id, strategy.id, start_date)
     
     trade_dict = closed_trade.__dict__.copy()
     trade_dict['risk_reward_ratio'] = closed_trade.theoretical_risk_reward_ratio
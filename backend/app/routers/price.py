@@ -6,7 +6,7 @@ from pydantic import BaseModel
 from app.database import get_db
 from app.middleware.auth import get_current_user
 from app.database import User
-from app.services.price_monitor import price_monitor
+from app.services.price_monitor import price_monitor, api_performance
 
 router = APIRouter()
 
@@ -76,7 +76,7 @@ async def get_batch_prices(
 @router.get(
     "/performance",
     summary="获取API性能统计",
-    description="获取各API的性能统计信息，包括平均响应时间、成功率等"
+    description="获取各API的性能统计信息，包括最近窗口的平均/分位数响应时间、成功率等"
 )
 async def get_api_performance(
     current_user: User = Depends(get_current_user)
@@ -93,6 +93,9 @@ async def get_api_performance(
             "失败次数": data['fail_count'],
             "成功率": f"{(data['success_count'] / data['count'] * 100):.1f}%" if data['count'] > 0 else "0%",
             "平均延迟": f"{data['avg_time']*1000:.1f}ms",
+            "P50延迟": f"{data['p50']*1000:.1f}ms" if data['p50'] is not None else "N/A",
+            "P95延迟": f"{data['p95']*1000:.1f}ms" if data['p95'] is not None else "N/A",
+            "P99延迟": f"{data['p99']*1000:.1f}ms" if data['p99'] is not None else "N/A",
             "最小延迟": f"{data['min_time']*1000:.1f}ms" if data['min_time'] != float('inf') else "N/A",
             "最大延迟": f"{data['max_time']*1000:.1f}ms"
         }
@@ -102,5 +105,6 @@ async def get_api_performance(
     return {
         "statistics": formatted_stats,
         "best_api": best_api,
-        "recommendation": f"当前推荐使用: {best_api}" if best_api else "暂无统计数据"
+        "recommendation": f"当前推荐使用: {best_api}" if best_api else "暂无统计数据",
+        "polling": price_monitor.scheduler.get_stats()
     }
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import json
+import logging
+
+from app.database import get_db
+from app.middleware.auth import authenticate_token
+from app.services.push_hub import push_hub
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 认证失败的关闭码（4000-4999 为应用自定义）
+WS_CLOSE_UNAUTHORIZED = 4401
+
+
+@router.websocket("/ws")
+async def realtime_push(websocket: WebSocket, token: str | None = None):
+    """实时推送通道
+
+    连接：`ws(s)://<host>/api/realtime/ws?token=<JWT>`（浏览器 WebSocket 无法设置请求头，token 放在查询参数中）
+
+    客户端消息：
+    - `{"type": "subscribe", "codes": ["600000", ...]}` 替换订阅的股票代码（持仓涉及的代码自动订阅）
+    - `{"type": "ping"}` 心跳，返回 `{"type": "pong"}`
+
+    服务端消息：
+    - `{"type": "tick", "quotes": {code: {price, source}}, "positions": [{id, stock_code, current_price, market_value, profit_loss}]}`
+      每轮行情只包含变化的报价和受影响的持仓
+    - `{"type": "alert", ...}` 止损/止盈闹铃通知
+    """
+    user = None
+    if token:
+        async for db in get_db():
+            user = await authenticate_token(db, token)
+            break
+    if user is None:
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED)
+        return
+
+    await websocket.accept()
+    conn = None
+    try:
+        conn = await push_hub.connect(websocket, user.id)
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except (ValueError, TypeError):
+                continue
+            if not isinstance(message, dict):
+                continue
+            message_type = message.get("type")
+            if message_type == "subscribe" and isinstance(message.get("codes"), list):
+                push_hub.set_codes(conn, message["codes"])
+            elif message_type == "ping":
+                # 所有下行消息都由连接的发送任务写出
+                push_hub.pong(conn)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.info(f"推送连接 {conn.id if conn is not None else '-'} 异常断开: {e}")
+    finally:
+        if conn is not None:
+            await push_hub.disconnect(conn)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
@@ -8,13 +8,17 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-from app.database import get_db, Trade, CapitalHistory, AsyncSessionLocal
+from app.database import get_db, Trade, CapitalHistory, beijing_date
 from app.middleware.auth import get_current_user, billing_enabled, user_has_active_subscription
 from app.models import TradeCreate, TradeUpdate, TradeResponse, PaginatedTradeResponse, TakeProfitRequest, StopLossRequest
 from app.database import User
-from app.routers.user import recalculate_capital_history, recalculate_strategy_capital_history, _get_stock_strategy
+from app.routers.user import recalculate_capital_history, _get_stock_strategy
 from app.services.commission_calculator import default_calculator
-from app.services.price_monitor import price_monitor
+from app.services.symbol_directory import symbol_directory
+from app.services.serialization import FastJSONResponse, TRADE_COLUMNS, trade_item, fill_trade_names
+from app.services.alert_monitor import alert_monitor
+from app.services.recompute_scheduler import recompute_scheduler
+from app.services.pagination import count_cache, keyset_before, next_cursor
 from app.routers.positions import take_profit as take_profit_position, stop_loss as stop_loss_position
 
 router = APIRouter()
@@ -27,6 +31,7 @@ router = APIRouter()
     获取当前用户的所有交易记录（历史订单）。
     
     支持分页查询，默认返回第1页，每页50条。
+    也支持游标分页：传入上一页返回的 next_cursor 作为 cursor 参数获取下一页（深翻页不变慢）。
     返回所有交易记录的列表，按开仓时间倒序排列。
     包括已平仓和未平仓的所有交易记录。
     **不包含已删除的记录**。
@@ -39,84 +44,47 @@ async def get_all_trades(
     page: int = 1,
     page_size: int = 50,
     strategy_id: int | None = None,
+    cursor: str | None = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     strategy = await _get_stock_strategy(db, current_user, strategy_id)
-    # 计算总数
-    count_result = await db.execute(
-        select(func.count())
-        .select_from(Trade)
-        .where(
-            Trade.user_id == current_user.id,
-            Trade.strategy_id == strategy.id,
-            Trade.is_deleted == False,
-        )
+    filters = [
+        Trade.user_id == current_user.id,
+        Trade.strategy_id == strategy.id,
+        Trade.is_deleted == False,
+    ]
+    # 计算总数（缓存，交易写入时失效）
+    total = await count_cache.count(
+        db,
+        ("trades", current_user.id, strategy.id),
+        select(func.count()).select_from(Trade).where(*filters),
     )
-    total = count_result.scalar()
     
-    # 计算偏移量
-    offset = (page - 1) * page_size
-    
-    # 查询数据
-    result = await db.execute(
-        select(Trade)
-        .where(
-            Trade.user_id == current_user.id,
-            Trade.strategy_id == strategy.id,
-            Trade.is_deleted == False,
-        )
-        .order_by(Trade.open_time.desc())
-        .offset(offset)
-        .limit(page_size)
-    )
-    trades = result.scalars().all()
-    
-    # 收集需要获取名称的股票代码（批量处理，避免重复API调用）
-    stock_codes_to_fetch = {}
-    for trade in trades:
-        if (not trade.stock_name or trade.stock_name.strip() == "") and trade.stock_code:
-            if trade.stock_code not in stock_codes_to_fetch:
-                stock_codes_to_fetch[trade.stock_code] = []
-            stock_codes_to_fetch[trade.stock_code].append(trade)
-    
-    # 批量获取股票名称
-    for stock_code, trades_list in stock_codes_to_fetch.items():
-        fetched_name = await price_monitor.fetch_stock_name(stock_code)
-        if fetched_name:
-            for trade in trades_list:
-                trade.stock_name = fetched_name
-            logger.info(f"✅ 自动更新股票 {stock_code} 名称为: {fetched_name}")
+    # 查询数据：有游标时按 (open_time, id) 续页，否则按页码偏移
+    stmt = select(*TRADE_COLUMNS).where(*filters).order_by(Trade.open_time.desc(), Trade.id.desc()).limit(page_size)
+    if cursor:
+        stmt = stmt.where(keyset_before(Trade.open_time, Trade.id, cursor))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+    result = await db.execute(stmt)
+    trades = result.all()
     
-    # 如果有更新，提交到数据库
-    if stock_codes_to_fetch:
+    # 按列投影构建响应（含风险回报比），并从股票代码表补全缺失的名称
+    trade_responses = [trade_item(row) for row in trades]
+    if await fill_trade_names(db, trade_responses):
         await db.commit()
     
-    # 计算风险回报比并构建响应
-    trade_responses = []
-    for trade in trades:
-        trade_dict = trade.__dict__.copy()
-        # 计算风险回报比：(止盈价-买入价)/(买入价-止损价)
-        if trade.buy_price and trade.stop_loss_price and trade.take_profit_price:
-            risk = trade.buy_price - trade.stop_loss_price  # 止损距离（风险）
-            reward = trade.take_profit_price - trade.buy_price  # 止盈距离（回报）
-            if risk > 0:
-                trade_dict['risk_reward_ratio'] = round(reward / risk, 2)
-            else:
-                trade_dict['risk_reward_ratio'] = None
-        else:
-            trade_dict['risk_reward_ratio'] = None
-        trade_responses.append(TradeResponse(**trade_dict))
-    
     total_pages = (total + page_size - 1) // page_size if page_size > 0 else 0
     
-    return {
+    return FastJSONResponse({
         "items": trade_responses,
         "total": total,
         "page": page,
         "page_size": page_size,
-        "total_pages": total_pages
-    }
+        "total_pages": total_pages,
+        "next_cursor": next_cursor(trades, page_size, "open_time")
+    })
 
 @router.get(
     "/date/{trade_date}",
@@ -145,69 +113,26 @@ async def get_trades_by_date(
     except ValueError:
         raise HTTPException(status_code=400, detail="日期格式错误，请使用 YYYY-MM-DD")
     
-    # 使用日期范围查询，确保与日历标记逻辑一致
-    # 用户选择的是北京时间日期，需要查询该日期对应的UTC时间范围
-    # 北京时间 00:00:00 = UTC时间 前一天的 16:00:00
-    # 北京时间 23:59:59 = UTC时间 当天的 15:59:59
-    # 所以查询范围：UTC时间从 (date_obj - 1天) 16:00:00 到 date_obj 16:00:00
-    beijing_start = datetime.combine(date_obj, datetime.min.time())
-    beijing_end = datetime.combine(date_obj, datetime.max.time()) + timedelta(days=1)
-    
-    # 转换为UTC时间范围（北京时间 - 8小时）
-    start_datetime = beijing_start - timedelta(hours=8)
-    end_datetime = beijing_end - timedelta(hours=8)
-    
+    # 用户选择的是北京时间日期，按已落库的北京时间开仓日期查询（与日历标记逻辑一致，走索引）
     strategy = await _get_stock_strategy(db, current_user, strategy_id)
     result = await db.execute(
-        select(Trade)
+        select(*TRADE_COLUMNS)
         .where(
             Trade.user_id == current_user.id,
             Trade.strategy_id == strategy.id,
-            Trade.open_time >= start_datetime,
-            Trade.open_time < end_datetime,
+            Trade.open_date_bj == date_obj,
             Trade.is_deleted == False  # 排除已删除的记录
         )
         .order_by(Trade.open_time.desc())
     )
-    trades = result.scalars().all()
+    trades = result.all()
     
-    # 收集需要获取名称的股票代码（批量处理，避免重复API调用）
-    stock_codes_to_fetch = {}
-    for trade in trades:
-        if (not trade.stock_name or trade.stock_name.strip() == "") and trade.stock_code:
-            if trade.stock_code not in stock_codes_to_fetch:
-                stock_codes_to_fetch[trade.stock_code] = []
-            stock_codes_to_fetch[trade.stock_code].append(trade)
-    
-    # 批量获取股票名称
-    for stock_code, trades_list in stock_codes_to_fetch.items():
-        fetched_name = await price_monitor.fetch_stock_name(stock_code)
-        if fetched_name:
-            for trade in trades_list:
-                trade.stock_name = fetched_name
-            logger.info(f"✅ 自动更新股票 {stock_code} 名称为: {fetched_name}")
-    
-    # 如果有更新，提交到数据库
-    if stock_codes_to_fetch:
+    # 按列投影构建响应（含风险回报比），并从股票代码表补全缺失的名称
+    trade_responses = [trade_item(row) for row in trades]
+    if await fill_trade_names(db, trade_responses):
         await db.commit()
     
-    # 计算风险回报比并构建响应
-    trade_responses = []
-    for trade in trades:
-        trade_dict = trade.__dict__.copy()
-        # 计算风险回报比：(止盈价-买入价)/(买入价-止损价)
-        if trade.buy_price and trade.stop_loss_price and trade.take_profit_price:
-            risk = trade.buy_price - trade.stop_loss_price  # 止损距离（风险）
-            reward = trade.take_profit_price - trade.buy_price  # 止盈距离（回报）
-            if risk > 0:
-                trade_dict['risk_reward_ratio'] = round(reward / risk, 2)
-            else:
-                trade_dict['risk_reward_ratio'] = None
-        else:
-            trade_dict['risk_reward_ratio'] = None
-        trade_responses.append(TradeResponse(**trade_dict))
-    
-    return trade_responses
+    return FastJSONResponse(trade_responses)
 
 @router.post(
     "",
@@ -242,13 +167,6 @@ async def create_trade(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    async def _recalculate_strategy_capital_history_async(user_id: int, strategy_id: int, start_date: date):
-        try:
-            async with AsyncSessionLocal() as session:
-                await recalculate_strategy_capital_history(session, user_id, strategy_id, start_date)
-        except Exception:
-            logger.exception("recalculate_strategy_capital_history failed")
-
     if billing_enabled() and not user_has_active_subscription(current_user):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -282,7 +200,7 @@ async def create_trade(
                 stock_name = right.strip()
             stock_code = left.strip()
     if (not stock_name or stock_name.strip() == "") and stock_code:
-        fetched_name = await price_monitor.fetch_stock_name(stock_code)
+        fetched_name = symbol_directory.get_name(stock_code)
         if fetched_name:
             stock_name = fetched_name
 
@@ -397,6 +315,7 @@ async def create_trade(
         if new_trade.open_trade_id is None and new_trade.id is not None:
             new_trade.open_trade_id = new_trade.id
         await db.commit()
+        count_cache.invalidate("trades", current_user.id)
     except IntegrityError as e:
         await db.rollback()
         if trade_data.client_request_id:
@@ -414,7 +333,9 @@ async def create_trade(
         raise HTTPException(status_code=409, detail=f"重复提交: {str(e)}")
 
     await db.refresh(new_trade)
-    asyncio.create_task(_recalculate_strategy_capital_history_async(current_user.id, strategy.id, open_time.date()))
+    alert_monitor.sync_trade(new_trade)
+    # 后台防抖重算：连续导入的多笔交易合并为一次，从最早开仓日开始
+    recompute_scheduler.schedule("stock", current_user.id, strategy.id, beijing_date(open_time))
     
     # 准备返回数据（保持兼容性）
     trade_dict = new_trade.__dict__.copy()
@@ -498,6 +419,7 @@ async def update_trade(
         old_profit_loss = trade.profit_loss
         old_close_time = trade.close_time
         old_strategy_id = trade.strategy_id
+        old_open_time = trade.open_time
         
         # 更新交易记录字段
         update_data = trade_data.model_dump(exclude_unset=True)
@@ -642,9 +564,11 @@ async def update_trade(
         sell_price_changed = trade.sell_price != old_sell_price
         sell_commission_changed = trade.sell_commission != old_sell_commission
         close_time_changed = trade.close_time != old_close_time
+        open_time_changed = trade.open_time != old_open_time
         
         await db.commit()
         await db.refresh(trade)
+        alert_monitor.sync_trade(trade)
         
         strategy_changed = trade.strategy_id != old_strategy_id
         if (
@@ -654,6 +578,7 @@ async def update_trade(
             or sell_price_changed
             or sell_commission_changed
             or close_time_changed
+            or open_time_changed
             or strategy_changed
         ):
             strategy_ids: set[int] = set()
@@ -662,9 +587,12 @@ async def update_trade(
             if trade.strategy_id is not None:
                 strategy_ids.add(int(trade.strategy_id))
 
-            for sid in strategy_ids:
-                anchor = trade.open_time.date() if trade.open_time is not None else date.min
-                await recalculate_strategy_capital_history(db, current_user.id, sid, anchor)
+            # 增量重算的起点取修改前后开仓日期中较早者
+            open_dates = [beijing_date(dt) for dt in (old_open_time, trade.open_time) if dt is not None]
+            anchor = min(open_dates) if open_dates else date.min
+            await asyncio.gather(*(
+                recompute_scheduler.run("stock", current_user.id, sid, anchor) for sid in strategy_ids
+            ))
         
         # 计算风险回报比
         trade_dict = trade.__dict__.copy()
@@ -712,9 +640,11 @@ async def clear_all_trades(
         for t in trades:
             t.is_deleted = True
             t.updated_at = datetime.utcnow()
+            alert_monitor.remove_trade(t.id)
 
         await db.commit()
-        await recalculate_strategy_capital_history(db, current_user.id, strategy.id, date.min)
+        count_cache.invalidate("trades", current_user.id)
+        await recompute_scheduler.run("stock", current_user.id, strategy.id)
         return {"message": "清空成功，资金曲线已重新计算", "deleted_count": len(trades)}
 
     result = await db.execute(
@@ -724,8 +654,10 @@ async def clear_all_trades(
     for t in trades:
         t.is_deleted = True
         t.updated_at = datetime.utcnow()
+        alert_monitor.remove_trade(t.id)
 
     await db.commit()
+    count_cache.invalidate("trades", current_user.id)
 
     start_date = getattr(current_user, "initial_capital_date", None)
     if start_date is None:
@@ -739,8 +671,9 @@ async def clear_all_trades(
         )
     )
     strategy_ids = [row[0] for row in strat_result.fetchall() if row[0] is not None]
-    for sid in strategy_ids:
-        await recalculate_strategy_capital_history(db, current_user.id, int(sid), date.min)
+    await asyncio.gather(*(
+        recompute_scheduler.run("stock", current_user.id, int(sid)) for sid in strategy_ids
+    ))
 
     return {"message": "清空成功，资金曲线已重新计算", "deleted_count": len(trades)}
 
@@ -774,11 +707,13 @@ async def delete_trade(
     trade.updated_at = datetime.utcnow()
     await db.commit()
     await db.refresh(trade)
+    alert_monitor.remove_trade(trade.id)
+    count_cache.invalidate("trades", current_user.id)
     
     if trade.strategy_id is not None:
         strategy = await _get_stock_strategy(db, current_user, trade.strategy_id)
-        anchor = trade.open_time.date() if trade.open_time is not None else date.today()
-        await recalculate_strategy_capital_history(db, current_user.id, strategy.id, anchor)
+        anchor = beijing_date(trade.open_time) if trade.open_time is not None else date.today()
+        await recompute_scheduler.run("stock", current_user.id, strategy.id, anchor)
     else:
         anchor = getattr(current_user, "initial_capital_date", None) or date.today()
         await recalculate_capital_history(db, current_user.id, anchor)
@@ -806,31 +741,21 @@ async def get_trade_dates(
 ):
     try:
         strategy = await _get_stock_strategy(db, current_user, strategy_id)
-        # 获取所有交易记录，然后提取日期（转换为北京时间后提取日期）
-        # 确保用户在某个日期开仓，日历就在对应日期做标记
+        # 按北京时间开仓日期去重（索引扫描），确保用户在某个日期开仓，日历就在对应日期做标记
         result = await db.execute(
-            select(Trade.open_time)
+            select(Trade.open_date_bj)
             .where(
                 Trade.user_id == current_user.id,
                 Trade.strategy_id == strategy.id,
-                Trade.is_deleted == False  # 排除已删除的记录
+                Trade.is_deleted == False,  # 排除已删除的记录
+                Trade.open_date_bj.isnot(None)
             )
-            .order_by(Trade.open_time.asc())
+            .distinct()
+            .order_by(Trade.open_date_bj.asc())
         )
-        trade_times = result.scalars().all()
         
-        # 提取唯一的日期（转换为北京时间后提取日期）
-        # 北京时间 = UTC时间 + 8小时
-        date_set = set()
-        for trade_time in trade_times:
-            if trade_time:
-                # 将UTC时间转换为北京时间（+8小时），然后提取日期
-                beijing_time = trade_time + timedelta(hours=8)
-                date_set.add(beijing_time.date())
-        
-        # 转换为字符串格式 YYYY-MM-DD，并排序
-        date_list = sorted([d.strftime("%Y-%m-%d") for d in date_set])
-        return date_list
+        # 转换为字符串格式 YYYY-MM-DD
+        return [d.strftime("%Y-%m-%d") for d in result.scalars().all()]
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -922,7 +847,7 @@ async def get_trades_by_stock_code(
         strategy = await _get_stock_strategy(db, current_user, strategy_id)
         # 获取该股票的所有交易记录
         result = await db.execute(
-            select(Trade)
+            select(*TRADE_COLUMNS)
             .where(
                 Trade.user_id == current_user.id,
                 Trade.strategy_id == strategy.id,
@@ -931,49 +856,31 @@ async def get_trades_by_stock_code(
             )
             .order_by(Trade.open_time.desc())
         )
-        trades = result.scalars().all()
+        trades = result.all()
         
         if not trades:
             raise HTTPException(status_code=404, detail=f"未找到股票代码 {stock_code} 的交易记录")
 
-        if any((not t.stock_name or t.stock_name.strip() == "") and t.stock_code for t in trades):
-            fetched_name = await price_monitor.fetch_stock_name(stock_code)
-            if fetched_name:
-                for t in trades:
-                    t.stock_name = fetched_name
-                await db.commit()
+        # 按列投影构建响应（含风险回报比），并从股票代码表补全缺失的名称
+        trade_responses = [trade_item(row) for row in trades]
+        if await fill_trade_names(db, trade_responses):
+            await db.commit()
         
-        # 计算风险回报比并构建响应
-        trade_responses = []
         total_profit_loss = 0.0
         theoretical_risk_reward_ratios = []
         
-        for trade in trades:
-            trade_dict = trade.__dict__.copy()
-            
-            # 计算风险回报比
-            if trade.buy_price and trade.stop_loss_price and trade.take_profit_price:
-                risk = trade.buy_price - trade.stop_loss_price
-                reward = trade.take_profit_price - trade.buy_price
-                if risk > 0:
-                    ratio = round(reward / risk, 2)
-                    trade_dict['risk_reward_ratio'] = ratio
-                    theoretical_risk_reward_ratios.append(ratio)
-                else:
-                    trade_dict['risk_reward_ratio'] = None
-            else:
-                trade_dict['risk_reward_ratio'] = None
+        for trade in trade_responses:
+            if trade["risk_reward_ratio"] is not None:
+                theoretical_risk_reward_ratios.append(trade["risk_reward_ratio"])
             
             # 累计盈亏（如果有profit_loss字段）
-            if hasattr(trade, 'profit_loss') and trade.profit_loss is not None:
-                total_profit_loss += trade.profit_loss
-            elif trade.sell_price and trade.buy_price:
+            if trade["profit_loss"] is not None:
+                total_profit_loss += trade["profit_loss"]
+            elif trade["sell_price"] and trade["buy_price"]:
                 # 手动计算盈亏：(卖出价 - 买入价) * 手数 - 手续费
-                profit = (trade.sell_price - trade.buy_price) * trade.shares
-                commission = trade.commission or 0
+                profit = (trade["sell_price"] - trade["buy_price"]) * trade["shares"]
+                commission = trade["commission"] or 0
                 total_profit_loss += (profit - commission)
-            
-            trade_responses.append(TradeResponse(**trade_dict))
         
         # 计算平均理论风险回报比
         avg_theoretical_risk_reward_ratio = None
@@ -983,14 +890,14 @@ async def get_trades_by_stock_code(
                 2
             )
         
-        return {
+        return FastJSONResponse({
             "trades": trade_responses,
             "statistics": {
                 "total_profit_loss": round(total_profit_loss, 2),
                 "average_theoretical_risk_reward_ratio": avg_theoretical_risk_reward_ratio,
                 "trade_count": len(trades)
             }
-        }
+        })
     except HTTPException:
         raise
     except Exception as e:
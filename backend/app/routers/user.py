@@ -15,8 +15,14 @@ from app.database import (
     ForexAccount,
     PaymentOrder,
     BillingPlanPrice,
+    beijing_date,
+    open_position_filter,
+    migration_applied,
+    mark_migration_applied,
+    claim_migration,
+    release_migration,
 )
-from app.middleware.auth import get_current_user, billing_enabled, user_has_active_subscription
+from app.middleware.auth import get_current_user, billing_enabled, user_has_active_subscription, auth_user_cache
 from app.models import (
     CapitalUpdate,
     CapitalHistoryItem,
@@ -33,9 +39,25 @@ from app.models import (
 )
 from app.services.commission_calculator import default_calculator
 from app.services.email_service import default_email_service
+from app.services.capital_curve import rebuild_strategy_capital_history
+from app.services.capital_history_store import (
+    delete_capital_history,
+    delete_strategy_capital_history,
+    diff_points,
+    load_capital_points,
+    upsert_capital_history,
+    upsert_strategy_capital_history,
+)
+from app.services.recompute_scheduler import recompute_scheduler
+from app.services.pagination import count_cache
+from app.services.strategy_directory import strategy_directory
+from app.services.alert_monitor import alert_monitor
+import logging
 import os
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
@@ -94,16 +116,13 @@ def _resolve_payment_qr_urls() -> tuple[str | None, str | None, str | None]:
     return wechat, alipay, receiver_note
 
 async def _ensure_default_stock_strategy(db: AsyncSession, user: User) -> Strategy:
-    result = await db.execute(
-        select(Strategy)
-        .where(Strategy.user_id == user.id, Strategy.market == "stock")
-        .order_by(Strategy.id.asc())
-        .limit(1)
-    )
-    existing = result.scalar_one_or_none()
+    default_id = await strategy_directory.default_strategy_id(db, user.id, "stock")
+    existing = await strategy_directory.get(db, user.id, default_id, "stock") if default_id is not None else None
     if not existing:
         raise HTTPException(status_code=404, detail="请先创建策略")
-    await _migrate_legacy_stock_data_to_strategy(db, user, existing)
+    # 旧数据迁移检查每次目录加载只执行一次
+    if await strategy_directory.needs_legacy_migration(db, user.id, "stock"):
+        await _migrate_legacy_stock_data_to_strategy(db, user, existing)
     return existing
 
 async def _migrate_legacy_stock_data_to_strategy(db: AsyncSession, user: User, strategy: Strategy) -> None:
@@ -170,14 +189,7 @@ async def _get_stock_strategy(db: AsyncSession, user: User, strategy_id: int | N
     if strategy_id is None:
         raise HTTPException(status_code=400, detail="请先选择策略")
 
-    result = await db.execute(
-        select(Strategy).where(
-            Strategy.id == strategy_id,
-            Strategy.user_id == user.id,
-            Strategy.market == "stock",
-        )
-    )
-    strategy = result.scalar_one_or_none()
+    strategy = await strategy_directory.get(db, user.id, strategy_id, "stock")
     if not strategy:
         raise HTTPException(status_code=404, detail="策略不存在")
     return strategy
@@ -186,14 +198,7 @@ async def _get_forex_strategy(db: AsyncSession, user: User, strategy_id: int | N
     if strategy_id is None:
         raise HTTPException(status_code=400, detail="请先选择策略")
 
-    result = await db.execute(
-        select(Strategy).where(
-            Strategy.id == strategy_id,
-            Strategy.user_id == user.id,
-            Strategy.market == "forex",
-        )
-    )
-    strategy = result.scalar_one_or_none()
+    strategy = await strategy_directory.get(db, user.id, strategy_id, "forex")
     if not strategy:
         raise HTTPException(status_code=404, detail="策略不存在")
     return strategy
@@ -288,6 +293,7 @@ async def create_payment_order(
     )
     db.add(order)
     await db.commit()
+    count_cache.invalidate("payment_orders")
     await db.refresh(order)
 
     wechat_pay_qr_url, alipay_pay_qr_url, receiver_note = _resolve_payment_qr_urls()
@@ -446,6 +452,8 @@ async def update_email_alerts(
     current_user.email_alerts_enabled = enabled
     await db.commit()
     await db.refresh(current_user)
+    auth_user_cache.invalidate(current_user.id)
+    alert_monitor.invalidate_user(current_user.id)
     
     return UserResponse(
         id=current_user.id,
@@ -569,7 +577,7 @@ async def recalculate_capital_history_endpoint(
 
     strategy = await _get_stock_strategy(db, current_user, strategy_id)
     anchor = start_date or getattr(strategy, "initial_date", None) or getattr(current_user, "initial_capital_date", None) or date.today()
-    await recalculate_strategy_capital_history(db, current_user.id, strategy.id, anchor)
+    await recompute_scheduler.run("stock", current_user.id, strategy.id, anchor)
     return {"message": "资金曲线已重算", "strategy_id": strategy.id, "start_date": str(anchor)}
 
 @router.post(
@@ -618,53 +626,18 @@ async def update_capital(
         update_date = capital_data.date
     
     if strategy_id is None:
-        result = await db.execute(
-            select(CapitalHistory).where(
-                CapitalHistory.user_id == current_user.id,
-                CapitalHistory.date >= update_date
-            )
-        )
-        old_records = result.scalars().all()
-        for record in old_records:
-            await db.delete(record)
-        
-        result = await db.execute(
-            select(CapitalHistory).where(
-                CapitalHistory.user_id == current_user.id,
-                CapitalHistory.date < update_date
-            )
-        )
-        old_before_records = result.scalars().all()
-        for record in old_before_records:
-            await db.delete(record)
-        
+        # 清空旧的资金历史，写入新的初始资金日点（集合删除 + 批量 upsert）
+        await delete_capital_history(db, current_user.id)
         current_user.initial_capital = capital_data.capital
         current_user.initial_capital_date = update_date
-
-        result = await db.execute(
-            select(CapitalHistory).where(
-                CapitalHistory.user_id == current_user.id,
-                CapitalHistory.date == update_date
-            )
+        await upsert_capital_history(
+            db,
+            current_user.id,
+            {update_date: (capital_data.capital, 0.0, capital_data.capital)},
         )
-        existing = result.scalar_one_or_none()
-        
-        if existing:
-            existing.capital = capital_data.capital
-            existing.available_funds = capital_data.capital
-            existing.position_value = 0.0
-        else:
-            db.add(
-                CapitalHistory(
-                    user_id=current_user.id,
-                    date=update_date,
-                    capital=capital_data.capital,
-                    available_funds=capital_data.capital,
-                    position_value=0.0
-                )
-            )
         
         await db.commit()
+        auth_user_cache.invalidate(current_user.id)
         await recalculate_capital_history(db, current_user.id, update_date)
         return {"message": "初始资金设置成功，资金曲线已重新计算"}
 
@@ -672,40 +645,12 @@ async def update_capital(
     strategy.initial_capital = float(capital_data.capital)
     strategy.initial_date = update_date
 
-    result = await db.execute(
-        select(StrategyCapitalHistory).where(
-            StrategyCapitalHistory.user_id == current_user.id,
-            StrategyCapitalHistory.strategy_id == strategy.id,
-            StrategyCapitalHistory.date >= update_date,
-        )
-    )
-    old_records = result.scalars().all()
-    for record in old_records:
-        await db.delete(record)
-
-    result = await db.execute(
-        select(StrategyCapitalHistory).where(
-            StrategyCapitalHistory.user_id == current_user.id,
-            StrategyCapitalHistory.strategy_id == strategy.id,
-            StrategyCapitalHistory.date < update_date,
-        )
-    )
-    old_before_records = result.scalars().all()
-    for record in old_before_records:
-        await db.delete(record)
-
-    db.add(
-        StrategyCapitalHistory(
-            user_id=current_user.id,
-            strategy_id=strategy.id,
-            date=update_date,
-            capital=float(capital_data.capital),
-            available_funds=float(capital_data.capital),
-            position_value=0.0,
-        )
-    )
+    await delete_strategy_capital_history(db, current_user.id, [strategy.id])
+    capital = float(capital_data.capital)
+    await upsert_strategy_capital_history(db, current_user.id, strategy.id, {update_date: (capital, 0.0, capital)})
     await db.commit()
-    await recalculate_strategy_capital_history(db, current_user.id, strategy.id, update_date)
+    strategy_directory.invalidate(current_user.id)
+    await recompute_scheduler.run("stock", current_user.id, strategy.id, update_date)
     return {"message": "初始资金设置成功，资金曲线已重新计算"}
 
 async def get_current_total_assets(db: AsyncSession, user_id: int, strategy_id: int | None = None):
@@ -750,10 +695,9 @@ async def get_current_total_assets(db: AsyncSession, user_id: int, strategy_id:
             select(Trade)
             .where(
                 Trade.user_id == user_id,
-                Trade.status == "open",
+                open_position_filter(Trade),
                 Trade.close_time.is_(None),
-                Trade.sell_price.is_(None),
-                Trade.is_deleted == False
+                Trade.sell_price.is_(None)
             )
         )
     else:
@@ -762,10 +706,9 @@ async def get_current_total_assets(db: AsyncSession, user_id: int, strategy_id:
             .where(
                 Trade.user_id == user_id,
                 Trade.strategy_id == strategy_id,
-                Trade.status == "open",
+                open_position_filter(Trade),
                 Trade.close_time.is_(None),
-                Trade.sell_price.is_(None),
-                Trade.is_deleted == False
+                Trade.sell_price.is_(None)
             )
         )
     open_positions = result.scalars().all()
@@ -846,7 +789,8 @@ async def recalculate_strategy_capital_history(db: AsyncSession, user_id: int, s
     if not strategy:
         raise HTTPException(status_code=404, detail="策略不存在")
 
-    if strategy.initial_date is None:
+    initial_date_resolved = strategy.initial_date is None
+    if initial_date_resolved:
         user_result = await db.execute(select(User).where(User.id == user_id))
         user = user_result.scalar_one_or_none()
 
@@ -869,7 +813,7 @@ async def recalculate_strategy_capital_history(db: AsyncSession, user_id: int, s
         if user and user.initial_capital_date:
             candidates.append(user.initial_capital_date)
         if earliest_trade_dt is not None:
-            candidates.append(earliest_trade_dt.date())
+            candidates.append(beijing_date(earliest_trade_dt))
 
         strategy.initial_date = min(candidates) if candidates else date.today()
         if strategy.initial_capital is None:
@@ -877,199 +821,18 @@ async def recalculate_strategy_capital_history(db: AsyncSession, user_id: int, s
 
     anchor_date = strategy.initial_date
     initial_capital = float(strategy.initial_capital) if strategy.initial_capital is not None else 100000.0
-    start_date = anchor_date
-
-    result = await db.execute(
-        select(StrategyCapitalHistory).where(
-            StrategyCapitalHistory.user_id == user_id,
-            StrategyCapitalHistory.strategy_id == strategy_id,
-            StrategyCapitalHistory.date == anchor_date
-        )
-    )
-    initial_record = result.scalar_one_or_none()
-    if not initial_record:
-        initial_record = StrategyCapitalHistory(
-            user_id=user_id,
-            strategy_id=strategy_id,
-            date=anchor_date,
-            capital=initial_capital,
-            available_funds=initial_capital,
-            position_value=0.0,
-        )
-        db.add(initial_record)
-        await db.flush()
-
-    available_funds = initial_capital
-    position_value = 0.0
-    positions: dict[int, Trade] = {}
-    if start_date > anchor_date:
-        prev_result = await db.execute(
-            select(StrategyCapitalHistory)
-            .where(
-                StrategyCapitalHistory.user_id == user_id,
-                StrategyCapitalHistory.strategy_id == strategy_id,
-                StrategyCapitalHistory.date < start_date,
-            )
-            .order_by(StrategyCapitalHistory.date.desc())
-            .limit(1)
-        )
-        prev_record = prev_result.scalar_one_or_none() or initial_record
-        prev_date = prev_record.date
-        available_funds = float(prev_record.available_funds) if prev_record.available_funds is not None else float(prev_record.capital)
-
-        open_pos_result = await db.execute(
-            select(Trade).where(
-                Trade.user_id == user_id,
-                Trade.strategy_id == strategy_id,
-                Trade.is_deleted == False,
-                Trade.open_time.isnot(None),
-                func.date(Trade.open_time) <= prev_date,
-                or_(
-                    and_(
-                        Trade.close_time.isnot(None),
-                        func.date(Trade.close_time) > prev_date,
-                    ),
-                    Trade.close_time.is_(None),
-                ),
-            )
-        )
-        open_positions = open_pos_result.scalars().all()
-        positions = {t.id: t for t in open_positions}
-        position_value = sum((t.buy_price or 0) * (t.shares or 0) for t in open_positions)
-
-    result = await db.execute(
-        select(Trade)
-        .where(
-            Trade.user_id == user_id,
-            Trade.strategy_id == strategy_id,
-            Trade.is_deleted == False,
-            or_(
-                func.date(Trade.open_time) >= start_date,
-                and_(
-                    Trade.close_time.isnot(None),
-                    func.date(Trade.close_time) >= start_date
-                )
-            )
-        )
-        .order_by(Trade.open_time.asc())
-    )
-    trades = result.scalars().all()
-
-    trade_events = []
-    for trade in trades:
-        open_date = trade.open_time.date()
-        if open_date >= start_date:
-            trade_events.append({'date': open_date, 'time': trade.open_time, 'type': 'open', 'trade': trade})
-        if trade.sell_price is not None:
-            close_dt = trade.close_time or trade.updated_at or trade.open_time
-            if close_dt is not None and trade.open_time is not None and close_dt < trade.open_time:
-                close_dt = trade.open_time
-            if close_dt is not None:
-                close_date = close_dt.date()
-                if close_date >= start_date:
-                    trade_events.append({'date': close_date, 'time': close_dt, 'type': 'close', 'trade': trade})
-    trade_events.sort(key=lambda x: (x['date'], x['time']))
-
-    capital_records: dict[date, tuple[float, float, float]] = {}
-    if start_date == anchor_date:
-        capital_records[start_date] = (initial_capital, 0.0, initial_capital)
 
-    if not trade_events:
-        if start_date == anchor_date:
-            result = await db.execute(
-                select(StrategyCapitalHistory).where(
-                    StrategyCapitalHistory.user_id == user_id,
-                    StrategyCapitalHistory.strategy_id == strategy_id,
-                    StrategyCapitalHistory.date != anchor_date
-                )
-            )
-            records_to_delete = result.scalars().all()
-            for record in records_to_delete:
-                await db.delete(record)
-
-            initial_record.capital = initial_capital
-            initial_record.available_funds = initial_capital
-            initial_record.position_value = 0.0
-            await db.commit()
-            return
-
-        result = await db.execute(
-            select(StrategyCapitalHistory).where(
-                StrategyCapitalHistory.user_id == user_id,
-                StrategyCapitalHistory.strategy_id == strategy_id,
-                StrategyCapitalHistory.date >= start_date,
-            )
-        )
-        records_to_delete = result.scalars().all()
-        for record in records_to_delete:
-            await db.delete(record)
-        await db.commit()
-        return
-
-    for event in trade_events:
-        trade_date = event['date']
-        trade = event['trade']
-
-        if event['type'] == 'open':
-            buy_commission = trade.buy_commission if trade.buy_commission is not None else (trade.commission or 0)
-            cost = trade.buy_price * trade.shares + buy_commission
-            available_funds -= cost
-            positions[trade.id] = trade
-        elif event['type'] == 'close' and trade.sell_price is not None:
-            if trade.profit_loss is not None:
-                buy_commission = trade.buy_commission if trade.buy_commission is not None else (trade.commission or 0)
-                buy_cost = trade.buy_price * trade.shares + buy_commission
-                available_funds += buy_cost + trade.profit_loss
-            else:
-                sell_amount = trade.sell_price * trade.shares
-                if trade.sell_commission is not None:
-                    sell_commission = trade.sell_commission
-                else:
-                    sell_commission = default_calculator.calculate_sell_commission(
-                        trade.sell_price,
-                        trade.shares,
-                        trade.stock_code
-                    )
-                available_funds += sell_amount - sell_commission
-            positions.pop(trade.id, None)
-        position_value = sum((t.buy_price or 0) * (t.shares or 0) for t in positions.values())
-        total_assets = available_funds + position_value
-        capital_records[trade_date] = (available_funds, position_value, total_assets)
+    # 增量重建：从 start_date 之前最近的日点状态继续重放，只写入变化的日期
+    await rebuild_strategy_capital_history(db, user_id, strategy_id, anchor_date, initial_capital, start_date)
+    await db.commit()
+    if initial_date_resolved:
+        strategy_directory.invalidate(user_id)
 
-    existing_result = await db.execute(
-        select(StrategyCapitalHistory).where(
-            StrategyCapitalHistory.user_id == user_id,
-            StrategyCapitalHistory.strategy_id == strategy_id,
-            StrategyCapitalHistory.date >= start_date,
-        )
-    )
-    existing_records = existing_result.scalars().all()
-    existing_by_date: dict[date, StrategyCapitalHistory] = {r.date: r for r in existing_records}
-
-    keep_dates = set(capital_records.keys())
-
-    for trade_date, (available, position_val, total) in capital_records.items():
-        existing = existing_by_date.get(trade_date)
-        if existing is not None:
-            existing.capital = total
-            existing.available_funds = available
-            existing.position_value = position_val
-        else:
-            db.add(
-                StrategyCapitalHistory(
-                    user_id=user_id,
-                    strategy_id=strategy_id,
-                    date=trade_date,
-                    capital=total,
-                    available_funds=available,
-                    position_value=position_val,
-                )
-            )
+async def _recompute_stock_strategy(db: AsyncSession, user_id: int, strategy_id: int, start_date: date | None):
+    await recalculate_strategy_capital_history(db, user_id, strategy_id, start_date or date.min)
 
-    for record in existing_records:
-        if record.date not in keep_dates:
-            await db.delete(record)
-    await db.commit()
+# 股票策略资金曲线统一经调度器重算（同一策略串行、突发请求合并）
+recompute_scheduler.register("stock", _recompute_stock_strategy)
 
 async def recalculate_capital_history(db: AsyncSession, user_id: int, start_date: date):
     """
@@ -1096,25 +859,6 @@ async def recalculate_capital_history(db: AsyncSession, user_id: int, start_date
 
     initial_capital = user.initial_capital if user and user.initial_capital is not None else 100000.0
 
-    # 确保 start_date 的初始资金记录存在（但注意：后续可能被同日交易覆盖，这里只负责兜底）
-    result = await db.execute(
-        select(CapitalHistory).where(
-            CapitalHistory.user_id == user_id,
-            CapitalHistory.date == start_date
-        )
-    )
-    initial_record = result.scalar_one_or_none()
-    if not initial_record:
-        initial_record = CapitalHistory(
-            user_id=user_id,
-            date=start_date,
-            capital=initial_capital,
-            available_funds=initial_capital,
-            position_value=0.0
-        )
-        db.add(initial_record)
-        await db.flush()
-    
     # 获取所有交易记录（从start_date开始，包括开仓和平仓）
     # 策略回测：需要获取所有在start_date之后有开仓或平仓的交易
     result = await db.execute(
@@ -1122,13 +866,13 @@ async def recalculate_capital_history(db: AsyncSession, user_id: int, start_date
         .where(
             Trade.user_id == user_id,
             Trade.is_deleted == False,
-            # 获取开仓时间或平仓时间在start_date之后的交易
+            # 获取开仓日期或平仓日期（北京时间）在start_date之后的交易
             or_(
-                func.date(Trade.open_time) >= start_date,
+                Trade.open_date_bj >= start_date,
                 and_(
                     Trade.status == "closed",
                     Trade.close_time.isnot(None),
-                    func.date(Trade.close_time) >= start_date
+                    Trade.close_date_bj >= start_date
                 )
             )
         )
@@ -1139,7 +883,7 @@ async def recalculate_capital_history(db: AsyncSession, user_id: int, start_date
     # 创建交易事件列表（包括开仓和平仓），按时间排序
     trade_events = []
     for trade in trades:
-        open_date = trade.open_time.date()
+        open_date = trade.open_date_bj or beijing_date(trade.open_time)
         # 开仓事件（如果开仓日期 >= start_date）
         if open_date >= start_date:
             trade_events.append({
@@ -1155,7 +899,7 @@ async def recalculate_capital_history(db: AsyncSession, user_id: int, start_date
             if close_dt is not None and trade.open_time is not None and close_dt < trade.open_time:
                 close_dt = trade.open_time
             if close_dt is not None:
-                close_date = close_dt.date()
+                close_date = beijing_date(close_dt)
                 if close_date >= start_date:
                     trade_events.append({
                         'date': close_date,
@@ -1177,22 +921,8 @@ async def recalculate_capital_history(db: AsyncSession, user_id: int, start_date
     
     # 如果没有交易记录，只保留初始资金记录（强制恢复为初始入金）
     if not trade_events:
-        # 删除除 start_date 之外的所有资金历史记录
-        result = await db.execute(
-            select(CapitalHistory).where(
-                CapitalHistory.user_id == user_id,
-                CapitalHistory.date != start_date
-            )
-        )
-        records_to_delete = result.scalars().all()
-        for record in records_to_delete:
-            await db.delete(record)
-
-        # 强制把 start_date 记录恢复为“初始入金”
-        initial_record.capital = initial_capital
-        initial_record.available_funds = initial_capital
-        initial_record.position_value = 0.0
-
+        await delete_capital_history(db, user_id, keep_date=start_date)
+        await upsert_capital_history(db, user_id, capital_records)
         await db.commit()
         return
     
@@ -1272,43 +1002,22 @@ async def recalculate_capital_history(db: AsyncSession, user_id: int, start_date
         capital_records[trade_date] = (available_funds, position_value, total_assets)
     
     # 更新或创建资金历史记录（同花顺模式：记录可用资金、持仓市值、总资产）
-    existing_result = await db.execute(
-        select(CapitalHistory).where(
-            CapitalHistory.user_id == user_id,
-            CapitalHistory.date >= start_date,
-        )
-    )
-    existing_records = existing_result.scalars().all()
-    existing_by_date: dict[date, CapitalHistory] = {r.date: r for r in existing_records}
-
-    keep_dates = set(capital_records.keys())
-
-    for trade_date, (available, position_val, total) in capital_records.items():
-        existing = existing_by_date.get(trade_date)
-        if existing is not None:
-            existing.capital = total
-            existing.available_funds = available
-            existing.position_value = position_val
-        else:
-            db.add(
-                CapitalHistory(
-                    user_id=user_id,
-                    date=trade_date,
-                    capital=total,
-                    available_funds=available,
-                    position_value=position_val,
-                )
-            )
-
-    for record in existing_records:
-        if record.date not in keep_dates:
-            await db.delete(record)
+    # 只写入变化的日点（批量 upsert），多余日点集合删除
+    existing = await load_capital_points(db, user_id, start_date)
+    changed, stale = diff_points(existing, capital_records)
+    await delete_capital_history(db, user_id, dates=stale)
+    await upsert_capital_history(db, user_id, changed)
     
     await db.commit()
 
 async def _ensure_strategy_capital_history_uptodate(db: AsyncSession, user_id: int, strategy_id: int) -> None:
+    # 只投影列：重算在调度器的会话中执行，避免本会话缓存过期的 ORM 对象
     latest_result = await db.execute(
-        select(StrategyCapitalHistory)
+        select(
+            StrategyCapitalHistory.date,
+            StrategyCapitalHistory.position_value,
+            StrategyCapitalHistory.created_at,
+        )
         .where(
             StrategyCapitalHistory.user_id == user_id,
             StrategyCapitalHistory.strategy_id == strategy_id,
@@ -1316,7 +1025,7 @@ async def _ensure_strategy_capital_history_uptodate(db: AsyncSession, user_id: i
         .order_by(StrategyCapitalHistory.date.desc())
         .limit(1)
     )
-    latest = latest_result.scalar_one_or_none()
+    latest = latest_result.first()
 
     last_trade_dt_result = await db.execute(
         select(func.max(Trade.open_time), func.max(Trade.close_time)).where(
@@ -1330,7 +1039,7 @@ async def _ensure_strategy_capital_history_uptodate(db: AsyncSession, user_id: i
     for dt in (max_open_dt, max_close_dt):
         if dt is None:
             continue
-        d = dt.date()
+        d = beijing_date(dt)
         if last_event_date is None or d > last_event_date:
             last_event_date = d
 
@@ -1347,8 +1056,7 @@ async def _ensure_strategy_capital_history_uptodate(db: AsyncSession, user_id: i
             select(func.count(Trade.id)).where(
                 Trade.user_id == user_id,
                 Trade.strategy_id == strategy_id,
-                Trade.is_deleted == False,
-                Trade.status == "open",
+                open_position_filter(Trade),
                 Trade.close_time.is_(None),
                 Trade.sell_price.is_(None),
             )
@@ -1373,7 +1081,71 @@ async def _ensure_strategy_capital_history_uptodate(db: AsyncSession, user_id: i
         return
 
     start_date = latest.date if latest is not None else (last_event_date or date.today())
-    await recalculate_strategy_capital_history(db, user_id, strategy_id, start_date)
+    # 与写入触发的后台重算同键串行，避免并发重算同一策略
+    await recompute_scheduler.run("stock", user_id, strategy_id, start_date)
+
+CAPITAL_HISTORY_BJ_MIGRATION = "capital_history_bj"
+# 认领超过该时长仍未完成视为执行进程已退出
+CAPITAL_HISTORY_BJ_CLAIM_LEASE = timedelta(hours=1)
+
+async def rebuild_capital_history_by_beijing_date() -> None:
+    """一次性迁移：资金曲线由UTC日期改为按北京时间日期分组后，全量重放已落库的曲线
+    旧日点按UTC日期记录，增量重算若以它为起点会重复或遗漏北京时间跨日的开/平仓，
+    因此全部曲线重放完成后才写入迁移标记；中途失败时下次启动重跑（重放幂等）
+    多个 worker 同时启动时先抢占认领，只有抢到的进程执行重放"""
+    async for db in get_db():
+        if await migration_applied(db, CAPITAL_HISTORY_BJ_MIGRATION):
+            return
+        if not await claim_migration(db, CAPITAL_HISTORY_BJ_MIGRATION, CAPITAL_HISTORY_BJ_CLAIM_LEASE):
+            logger.info("资金曲线北京时间迁移已由其他进程执行，跳过")
+            return
+        try:
+            await _replay_capital_history_by_beijing_date(db)
+        except BaseException:
+            await db.rollback()
+            raise
+        finally:
+            await release_migration(db, CAPITAL_HISTORY_BJ_MIGRATION)
+        return
+
+async def _replay_capital_history_by_beijing_date(db: AsyncSession) -> None:
+    """重放全部账户/策略资金曲线，全部成功后写入迁移标记"""
+    user_rows = (
+        await db.execute(
+            select(CapitalHistory.user_id, func.min(CapitalHistory.date)).group_by(CapitalHistory.user_id)
+        )
+    ).all()
+    strategy_rows = (
+        await db.execute(
+            select(StrategyCapitalHistory.user_id, StrategyCapitalHistory.strategy_id)
+            .join(Strategy, Strategy.id == StrategyCapitalHistory.strategy_id)
+            .where(Strategy.market == "stock")
+            .distinct()
+        )
+    ).all()
+
+    failed = 0
+    for user_id, first_date in user_rows:
+        try:
+            await recalculate_capital_history(db, user_id, first_date)
+        except Exception as e:
+            await db.rollback()
+            failed += 1
+            logger.error(f"重放账户资金曲线失败 user={user_id}: {e}")
+    for user_id, strategy_id in strategy_rows:
+        try:
+            # 不带起始日期：从策略锚点全量重放
+            await recompute_scheduler.run("stock", user_id, strategy_id)
+        except Exception as e:
+            failed += 1
+            logger.error(f"重放策略资金曲线失败 user={user_id} strategy={strategy_id}: {e}")
+
+    if failed:
+        logger.warning(f"⚠️ 资金曲线北京时间迁移有 {failed} 条曲线失败，下次启动重试")
+        return
+    await mark_migration_applied(db, CAPITAL_HISTORY_BJ_MIGRATION)
+    await db.commit()
+    logger.info(f"✅ 资金曲线已按北京时间日期重建: {len(user_rows)} 个账户, {len(strategy_rows)} 个策略")
 
 @router.get("/strategies", response_model=list[StrategyResponse], summary="获取策略列表")
 async def list_strategies(
@@ -1442,6 +1214,7 @@ async def create_strategy(
             )
         )
     await db.commit()
+    strategy_directory.invalidate(current_user.id)
     await db.refresh(strategy)
 
     if market == "stock":
@@ -1480,6 +1253,10 @@ async def delete_all_strategies(
     
     deleted_count = 0
     
+    if market == "stock":
+        # 删除策略资金历史（一次集合删除）
+        await delete_strategy_capital_history(db, current_user.id, [strategy.id for strategy in strategies])
+    
     for strategy in strategies:
         # 删除关联数据逻辑与单个删除相同
         if market == "stock":
@@ -1493,16 +1270,6 @@ async def delete_all_strategies(
             for t in trades:
                 t.is_deleted = True
                 t.deleted_at = datetime.now()
-            
-            # 删除策略资金历史
-            capital_result = await db.execute(
-                select(StrategyCapitalHistory).where(
-                    StrategyCapitalHistory.user_id == current_user.id,
-                    StrategyCapitalHistory.strategy_id == strategy.id
-                )
-            )
-            for h in capital_result.scalars().all():
-                await db.delete(h)
                 
         elif market == "forex":
             trades_result = await db.execute(
@@ -1521,6 +1288,8 @@ async def delete_all_strategies(
         deleted_count += 1
         
     await db.commit()
+    strategy_directory.invalidate(current_user.id)
+    count_cache.invalidate("trades" if market == "stock" else "forex_trades", current_user.id)
     
     return {"message": f"已删除 {deleted_count} 个策略", "deleted_count": deleted_count}
 
@@ -1558,18 +1327,12 @@ async def delete_strategy(
             t.updated_at = datetime.utcnow()
         deleted_trades = len(trades)
 
-        history_result = await db.execute(
-            select(StrategyCapitalHistory).where(
-                StrategyCapitalHistory.user_id == current_user.id,
-                StrategyCapitalHistory.strategy_id == strategy.id,
-            )
-        )
-        history = history_result.scalars().all()
-        for h in history:
-            await db.delete(h)
+        await delete_strategy_capital_history(db, current_user.id, [strategy.id])
 
         await db.delete(strategy)
         await db.commit()
+        strategy_directory.invalidate(current_user.id)
+        count_cache.invalidate("trades", current_user.id)
         return {"message": "删除成功", "deleted_trades": deleted_trades}
 
     if market == "forex":
@@ -1589,6 +1352,8 @@ async def delete_strategy(
 
         await db.delete(strategy)
         await db.commit()
+        strategy_directory.invalidate(current_user.id)
+        count_cache.invalidate("forex_trades", current_user.id)
         return {"message": "删除成功", "deleted_trades": deleted_trades}
 
     raise HTTPException(status_code=400, detail="不支持的市场类型")
@@ -1658,20 +1423,20 @@ async def get_all_strategy_capital_histories(
             events.sort(key=lambda x: x[0])
 
             for event_time, event_type, t in events:
-                beijing_date = (event_time + timedelta(hours=8)).date()
-                if beijing_date < strategy_anchor_date:
+                event_date = beijing_date(event_time)
+                if event_date < strategy_anchor_date:
                     continue
-                if end_date is not None and beijing_date > end_date:
+                if end_date is not None and event_date > end_date:
                     break
                 if event_type == "open":
                     running -= float(t.commission or 0)
                 else:
                     running += float(t.profit or 0) + float(t.commission or 0)
-                if beijing_date < effective_start:
+                if event_date < effective_start:
                     start_value = running
                     points_by_date[effective_start] = start_value
                     continue
-                points_by_date[beijing_date] = running
+                points_by_date[event_date] = running
 
             dates = sorted(points_by_date.keys())
             series_by_strategy_id[s.id] = [
@@ -1,31 +1,112 @@
 """
 闹铃监控服务
 
-定期检查持仓的止损止盈条件，触发闹铃通知（WebSocket + 邮件）
+事件驱动：启动时加载一次未平仓持仓，按股票建立止损/止盈触发簿（按阈值排序），
+订阅 price_monitor 的价格变化回调，每次报价只取出被穿越的闹铃（O(log n + k)）。
+交易新增/修改/平仓/删除时由路由调用 sync_trade/remove_trade 增量更新，不再每轮扫表。
+触发闹铃后发送通知（WebSocket 推送 + 邮件）
 """
 
 import asyncio
+import bisect
 import logging
+import os
+import time
 from datetime import datetime
-from typing import Dict, Set
+from typing import Callable, Dict, Optional, Set
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import Trade, User, get_db
+from app.database import Trade, User, get_db, open_position_filter
 from app.services.price_monitor import price_monitor
-from app.services.email_service import default_email_service
+from app.services.email_queue import alert_email_queue
+from app.services.push_hub import push_hub
+from app.services.market_clock import market_clock
 
 logger = logging.getLogger(__name__)
 
 
+class AlertEntry:
+    """触发簿中的持仓快照（只保留闹铃需要的字段，不持有ORM对象）"""
+
+    __slots__ = (
+        "id", "user_id", "stock_code", "stock_name",
+        "stop_loss_price", "take_profit_price", "stop_loss_alert", "take_profit_alert",
+    )
+
+    def __init__(self, trade: Trade):
+        self.id = trade.id
+        self.user_id = trade.user_id
+        self.stock_code = trade.stock_code
+        self.stock_name = trade.stock_name
+        self.stop_loss_price = trade.stop_loss_price if trade.stop_loss_alert and (trade.stop_loss_price or 0) > 0 else None
+        self.take_profit_price = trade.take_profit_price if trade.take_profit_alert and (trade.take_profit_price or 0) > 0 else None
+        self.stop_loss_alert = bool(trade.stop_loss_alert)
+        self.take_profit_alert = bool(trade.take_profit_alert)
+
+
+class SymbolAlertBook:
+    """单只股票的触发簿
+    stop_loss: [(止损价, trade_id)] 升序，价格 <= 止损价 时触发 -> 取尾部
+    take_profit: [(止盈价, trade_id)] 升序，价格 >= 止盈价 时触发 -> 取头部"""
+
+    __slots__ = ("stop_loss", "take_profit")
+
+    def __init__(self):
+        self.stop_loss: list[tuple[float, int]] = []
+        self.take_profit: list[tuple[float, int]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.stop_loss or self.take_profit)
+
+    def add(self, alert_type: str, threshold: float, trade_id: int):
+        book = self.stop_loss if alert_type == "stop_loss" else self.take_profit
+        bisect.insort(book, (threshold, trade_id))
+
+    def discard(self, alert_type: str, threshold: float, trade_id: int):
+        book = self.stop_loss if alert_type == "stop_loss" else self.take_profit
+        key = (threshold, trade_id)
+        i = bisect.bisect_left(book, key)
+        if i < len(book) and book[i] == key:
+            del book[i]
+
+    def pop_crossed(self, price: float) -> list[tuple[str, float, int]]:
+        """取出并移除被当前价格穿越的闹铃: [(alert_type, 阈值, trade_id)]"""
+        fired: list[tuple[str, float, int]] = []
+        i = bisect.bisect_left(self.stop_loss, (price, float("-inf")))
+        if i < len(self.stop_loss):
+            fired.extend(("stop_loss", threshold, trade_id) for threshold, trade_id in self.stop_loss[i:])
+            del self.stop_loss[i:]
+        j = bisect.bisect_right(self.take_profit, (price, float("inf")))
+        if j > 0:
+            fired.extend(("take_profit", threshold, trade_id) for threshold, trade_id in self.take_profit[:j])
+            del self.take_profit[:j]
+        return fired
+
+
+ALERT_SUBSCRIBER = "alert_monitor"  # 在价格订阅登记表中的订阅者ID
+
+
 class AlertMonitor:
     """闹铃监控服务"""
     
     def __init__(self):
         self.running = False
         self.task: asyncio.Task | None = None
-        self.check_interval = 10  # 每10秒检查一次
+        self.check_interval = 10  # 兜底：每10秒用最新报价复核一次触发簿
+        # 全量重载间隔（秒），兜底覆盖未经过路由的数据变更
+        self.resync_interval = float(os.getenv("ALERT_RESYNC_INTERVAL", "600"))
         self.triggered_alerts: Dict[int, Set[str]] = {}  # trade_id -> {'stop_loss', 'take_profit'}
+        self.entries: Dict[int, AlertEntry] = {}  # trade_id -> 持仓快照
+        self.books: Dict[str, SymbolAlertBook] = {}  # stock_code -> 触发簿
+        self._dispatch_tasks: Set[asyncio.Task] = set()
+        self._last_resync = 0.0
+        self._callback_registered = False
+        # 闹铃相关的用户设置缓存 {user_id: (过期时间, (email, email_alerts_enabled))}
+        self.user_cache_ttl = float(os.getenv("ALERT_USER_CACHE_TTL", "60"))
+        self._user_settings_cache: Dict[int, tuple[float, tuple[Optional[str], bool]]] = {}
+        # 共享行情模式下的非行情进程：不维护触发簿，把变更转发给行情进程 forwarder(类型, 内容)
+        self.forwarder: Optional[Callable[[str, str], None]] = None
         
     async def start(self):
         """启动监控服务"""
@@ -34,6 +115,12 @@ class AlertMonitor:
             return
         
         self.running = True
+        if not self._callback_registered:
+            price_monitor.add_price_change_callback(self._on_price_change)
+            # 挂有闹铃的代码由价格循环轮询，按距阈值的距离分级（闹铃本身不算查看者）
+            price_monitor.scheduler.passive_subscribers.add(ALERT_SUBSCRIBER)
+            price_monitor.scheduler.distance_provider = self.trigger_distance
+            self._callback_registered = True
         self.task = asyncio.create_task(self._monitor_loop())
         logger.info("✅ 闹铃监控服务已启动")
     
@@ -46,104 +133,241 @@ class AlertMonitor:
                 await self.task
             except asyncio.CancelledError:
                 pass
+        for task in list(self._dispatch_tasks):
+            task.cancel()
         logger.info("⏹️ 闹铃监控服务已停止")
     
     async def _monitor_loop(self):
-        """监控循环"""
+        """监控循环：定期全量重载触发簿（低频），交易时段内用最新报价复核，休市时睡到下一次开盘"""
         while self.running:
+            active = True
             try:
-                await self._check_all_positions()
+                if time.monotonic() - self._last_resync >= self.resync_interval:
+                    await self._load_open_positions()
+                active = market_clock.is_active()
+                if active:
+                    await self._check_all_positions()
             except Exception as e:
                 logger.error(f"闹铃监控出错: {e}")
             
-            await asyncio.sleep(self.check_interval)
-    
-    async def _check_all_positions(self):
-        """检查所有持仓的止损止盈条件"""
+            if active:
+                await asyncio.sleep(self.check_interval)
+            else:
+                await market_clock.sleep_until_open()
+
+    async def _load_open_positions(self):
+        """从数据库全量加载未平仓持仓，重建触发簿"""
         async for db in get_db():
-            try:
-                result = await db.execute(
-                    select(Trade).where(Trade.status == "open", Trade.is_deleted == False)
-                )
-                positions = result.scalars().all()
+            result = await db.execute(
+                select(Trade).where(open_position_filter(Trade))
+            )
+            positions = result.scalars().all()
+            open_ids = {pos.id for pos in positions}
+            for trade_id in list(self.entries.keys()):
+                if trade_id not in open_ids:
+                    self.remove_trade(trade_id)
+            for position in positions:
+                self._sync_entry(position)
+            self._last_resync = time.monotonic()
+            logger.info(f"闹铃触发簿已重载: {len(self.entries)} 个持仓, {len(self.books)} 只股票")
+            return
 
-                if not positions:
-                    return
+    def request_resync(self):
+        """下一轮监控循环时全量重载触发簿"""
+        self._last_resync = 0.0
 
-                stock_codes = [pos.stock_code for pos in positions if pos.stock_code]
-                price_data = await price_monitor.batch_fetch_prices(stock_codes)
+    async def resync_trade(self, trade_id: int):
+        """按ID重新读取一笔交易并同步触发簿（处理其他 worker 转发来的变更）"""
+        async for db in get_db():
+            trade = (await db.execute(select(Trade).where(Trade.id == trade_id))).scalar_one_or_none()
+            if trade is None:
+                self.remove_trade(trade_id)
+            else:
+                self.sync_trade(trade)
+            return
 
-                for position in positions:
-                    await self._check_position_alert(db, position, price_data)
+    def _arm(self, entry: AlertEntry):
+        """把持仓未触发的闹铃挂入触发簿"""
+        triggered = self.triggered_alerts.get(entry.id, set())
+        book = None
+        for alert_type, threshold in (("stop_loss", entry.stop_loss_price), ("take_profit", entry.take_profit_price)):
+            if threshold is None or alert_type in triggered:
+                continue
+            if book is None:
+                book = self.books.get(entry.stock_code)
+                if book is None:
+                    book = self.books[entry.stock_code] = SymbolAlertBook()
+                    price_monitor.registry.add(ALERT_SUBSCRIBER, [entry.stock_code])
+            book.add(alert_type, threshold, entry.id)
 
-            except Exception as e:
-                logger.error(f"检查持仓闹铃失败: {e}")
+    def _disarm(self, entry: AlertEntry):
+        """从触发簿移除持仓的所有闹铃"""
+        book = self.books.get(entry.stock_code)
+        if book is None:
+            return
+        if entry.stop_loss_price is not None:
+            book.discard("stop_loss", entry.stop_loss_price, entry.id)
+        if entry.take_profit_price is not None:
+            book.discard("take_profit", entry.take_profit_price, entry.id)
+        if not book:
+            self._drop_book(entry.stock_code)
+
+    def _drop_book(self, stock_code: str):
+        """触发簿清空后移除，并取消该代码的价格订阅"""
+        del self.books[stock_code]
+        price_monitor.registry.remove(ALERT_SUBSCRIBER, [stock_code])
+
+    def trigger_distance(self, stock_code: str, price: float) -> Optional[float]:
+        """当前价格到最近未触发阈值的相对距离（供分级轮询使用），无闹铃时返回 None"""
+        book = self.books.get(stock_code)
+        if book is None or price <= 0:
+            return None
+        distances = []
+        if book.stop_loss:
+            distances.append((price - book.stop_loss[-1][0]) / price)  # 最高的止损价
+        if book.take_profit:
+            distances.append((book.take_profit[0][0] - price) / price)  # 最低的止盈价
+        return max(0.0, min(distances)) if distances else None
+
+    def sync_trade(self, trade: Trade):
+        """交易新增/修改/平仓后同步触发簿（已平仓或已删除的交易会被移除）
+        阈值或开关变化的一侧会重新布防"""
+        if trade.id is None:
+            return
+        push_hub.positions_changed(trade.user_id)
+        if self.forwarder is not None:
+            self.forwarder("trade", str(trade.id))
+            return
+        self._sync_entry(trade)
+
+    def _sync_entry(self, trade: Trade):
+        """只同步触发簿，不通知推送中心（定期全量重载走这里，持仓未变时不必重推）"""
+        if trade.status != "open" or trade.is_deleted or not trade.stock_code:
+            self.remove_trade(trade.id)
+            return
+
+        new_entry = AlertEntry(trade)
+        old_entry = self.entries.get(trade.id)
+        if old_entry is not None:
+            self._disarm(old_entry)
+            triggered = self.triggered_alerts.get(trade.id)
+            if triggered:
+                if old_entry.stop_loss_price != new_entry.stop_loss_price or old_entry.stock_code != new_entry.stock_code:
+                    triggered.discard("stop_loss")
+                if old_entry.take_profit_price != new_entry.take_profit_price or old_entry.stock_code != new_entry.stock_code:
+                    triggered.discard("take_profit")
+        self.entries[trade.id] = new_entry
+        self._arm(new_entry)
+
+        # 已有报价时立即评估一次，新挂入且已穿越的闹铃不必等下一次价格变化
+        cached = price_monitor.quote_store.get(new_entry.stock_code)
+        if cached is not None and cached[0] > 0:
+            self._evaluate(new_entry.stock_code, cached[0])
+
+    def remove_trade(self, trade_id: int):
+        """交易平仓或删除后移除触发簿条目"""
+        if self.forwarder is not None:
+            push_hub.trade_removed(trade_id)
+            self.forwarder("trade", str(trade_id))
+            return
+        entry = self.entries.pop(trade_id, None)
+        if entry is not None:
+            self._disarm(entry)
+            push_hub.positions_changed(entry.user_id)
+        self.triggered_alerts.pop(trade_id, None)
+
+    def _on_price_change(self, stock_code: str, price: float, source: str):
+        """price_monitor 价格变化回调（同步）"""
+        if stock_code in self.books:
+            self._evaluate(stock_code, price)
+
+    def _evaluate(self, stock_code: str, price: float):
+        """取出被穿越的闹铃并异步派发通知"""
+        if price <= 0:
+            return
+        book = self.books.get(stock_code)
+        if book is None:
+            return
+        crossed = book.pop_crossed(price)
+        if not book:
+            self._drop_book(stock_code)
+        if not crossed:
+            return
+
+        fired = []
+        for alert_type, threshold, trade_id in crossed:
+            entry = self.entries.get(trade_id)
+            if entry is None:
+                continue
+            self.triggered_alerts.setdefault(trade_id, set()).add(alert_type)
+            fired.append((entry, alert_type, price, threshold))
+        if not fired:
             return
-    
-    async def _check_position_alert(
-        self,
-        db: AsyncSession,
-        position: Trade,
-        price_data: Dict[str, Dict]
-    ):
-        """检查单个持仓的闹铃条件"""
         try:
-            # 获取当前价格
-            if position.stock_code not in price_data:
-                return
-            
-            price_info = price_data[position.stock_code]
-            current_price = price_info.get("price", 0)
-            
-            if current_price <= 0:
-                return
-            
-            # 初始化该持仓的已触发闹铃记录
-            if position.id not in self.triggered_alerts:
-                self.triggered_alerts[position.id] = set()
-            
-            # 检查止损闹铃
-            if (position.stop_loss_alert and 
-                position.stop_loss_price and 
-                current_price <= position.stop_loss_price and
-                'stop_loss' not in self.triggered_alerts[position.id]):
-                
-                await self._trigger_alert(
-                    db,
-                    position,
-                    "stop_loss",
-                    current_price,
-                    position.stop_loss_price
-                )
-                self.triggered_alerts[position.id].add('stop_loss')
-            
-            # 检查止盈闹铃
-            if (position.take_profit_alert and 
-                position.take_profit_price and 
-                current_price >= position.take_profit_price and
-                'take_profit' not in self.triggered_alerts[position.id]):
-                
+            task = asyncio.get_running_loop().create_task(self._dispatch(fired))
+        except RuntimeError:
+            return
+        self._dispatch_tasks.add(task)
+        task.add_done_callback(self._dispatch_tasks.discard)
+
+    async def _dispatch(self, fired: list[tuple[AlertEntry, str, float, float]]):
+        """派发一批已触发的闹铃：一次查询解析所有相关用户的提醒设置"""
+        async for db in get_db():
+            user_settings = await self._resolve_alert_users(db, {entry.user_id for entry, *_ in fired})
+            for entry, alert_type, current_price, target_price in fired:
                 await self._trigger_alert(
-                    db,
-                    position,
-                    "take_profit",
-                    current_price,
-                    position.take_profit_price
+                    entry, alert_type, current_price, target_price, user_settings.get(entry.user_id)
                 )
-                self.triggered_alerts[position.id].add('take_profit')
-        
-        except Exception as e:
-            logger.error(f"检查持仓 {position.id} 闹铃失败: {e}")
+            return
+
+    async def _resolve_alert_users(self, db: AsyncSession, user_ids: Set[int]) -> Dict[int, tuple[Optional[str], bool]]:
+        """批量获取用户提醒设置 {user_id: (email, email_alerts_enabled)}
+        优先读 TTL 缓存，未命中的用户合并为一次 IN 查询"""
+        now = time.monotonic()
+        settings: Dict[int, tuple[Optional[str], bool]] = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self._user_settings_cache.get(user_id)
+            if cached is not None and cached[0] > now:
+                settings[user_id] = cached[1]
+            else:
+                missing.append(user_id)
+
+        if missing:
+            result = await db.execute(
+                select(User.id, User.email, User.email_alerts_enabled).where(User.id.in_(missing))
+            )
+            expires_at = now + self.user_cache_ttl
+            for user_id, email, enabled in result.all():
+                value = (email, bool(enabled))
+                settings[user_id] = value
+                self._user_settings_cache[user_id] = (expires_at, value)
+        return settings
+
+    def invalidate_user(self, user_id: int):
+        """用户邮箱或提醒开关变更后清除缓存"""
+        if self.forwarder is not None:
+            self.forwarder("user", str(user_id))
+            return
+        self._user_settings_cache.pop(user_id, None)
+    
+    async def _check_all_positions(self):
+        """用最新报价复核所有挂有闹铃的股票（只读行情缓存：这些代码已由价格循环按分级轮询）"""
+        for code in list(self.books.keys()):
+            cached = price_monitor.quote_store.get(code)
+            if cached is not None and cached[0] > 0:
+                self._evaluate(code, cached[0])
     
     async def _trigger_alert(
         self,
-        db: AsyncSession,
-        position: Trade,
+        position: AlertEntry,
         alert_type: str,
         current_price: float,
-        target_price: float
+        target_price: float,
+        user_settings: Optional[tuple[Optional[str], bool]]
     ):
-        """触发闹铃（发送邮件通知）"""
+        """触发闹铃（WebSocket 推送 + 邮件通知）
+        user_settings: (email, email_alerts_enabled)，由 _resolve_alert_users 批量解析"""
         try:
             alert_type_zh = "止盈" if alert_type == "take_profit" else "止损"
             logger.info(
@@ -151,19 +375,26 @@ class AlertMonitor:
                 f"(当前价格: {current_price}, 目标价格: {target_price})"
             )
             
-            # 获取用户信息
-            result = await db.execute(
-                select(User).where(User.id == position.user_id)
-            )
-            user = result.scalar_one_or_none()
+            # 推送给该用户在线的所有连接（不依赖邮箱提醒开关）
+            push_hub.send_alert(position.user_id, {
+                "trade_id": position.id,
+                "stock_code": position.stock_code,
+                "stock_name": position.stock_name,
+                "alert_type": alert_type,
+                "current_price": current_price,
+                "target_price": target_price,
+                "triggered_at": datetime.utcnow(),
+            })
             
-            if not user:
+            if not user_settings:
                 return
+            email, email_alerts_enabled = user_settings
             
             # 发送邮件通知（如果用户启用了邮箱提醒）
-            if user.email_alerts_enabled and user.email:
-                success = default_email_service.send_price_alert(
-                    to_email=user.email,
+            if email_alerts_enabled and email:
+                # 入队即返回，由发送队列在线程池中批量发送
+                queued = alert_email_queue.enqueue_price_alert(
+                    to_email=email,
                     stock_code=position.stock_code,
                     stock_name=position.stock_name,
                     alert_type=alert_type,
@@ -171,21 +402,22 @@ class AlertMonitor:
                     target_price=target_price
                 )
                 
-                if success:
-                    logger.info(f"✅ 邮件通知已发送: {user.email} - {position.stock_code}")
+                if queued:
+                    logger.info(f"📨 邮件通知已入队: {email} - {position.stock_code}")
                 else:
-                    logger.warning(f"⚠️ 邮件通知发送失败: {user.email} - {position.stock_code}")
-            
-            # TODO: 如果有WebSocket连接，也通过WebSocket发送实时通知
-            # 这部分需要在main.py中实现WebSocket端点
+                    logger.warning(f"⚠️ 邮件通知入队失败: {email} - {position.stock_code}")
             
         except Exception as e:
             logger.error(f"触发闹铃失败: {e}")
     
     def clear_position_alerts(self, position_id: int):
-        """清除某个持仓的已触发闹铃记录（用于用户取消闹铃或平仓时）"""
+        """清除某个持仓的已触发闹铃记录并重新布防（用于用户重置闹铃时）"""
         if position_id in self.triggered_alerts:
             del self.triggered_alerts[position_id]
+        entry = self.entries.get(position_id)
+        if entry is not None:
+            self._disarm(entry)
+            self._arm(entry)
 
 
 # 全局闹铃监控实例
@@ -0,0 +1,198 @@
+"""
+策略资金曲线增量计算
+
+以最近一个已落库的日点（可用资金 + 当日仍持有的仓位）作为运行状态，
+只重放受影响日期之后的开/平仓事件，并只写入发生变化的日期：
+- 修改一笔旧交易的代价为 O(受影响天数)，而不是 O(全部交易 + 全部 ORM 对象)
+- 变化的日点一次批量 upsert，多余日点一次集合删除
+- 事件按北京时间日期分组，查询走 open_date_bj / close_date_bj 索引
+"""
+
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import StrategyCapitalHistory, Trade, beijing_date
+from app.services.capital_history_store import (
+    CapitalPoint,
+    delete_strategy_capital_history,
+    diff_points,
+    load_strategy_capital_points,
+    upsert_strategy_capital_history,
+)
+from app.services.commission_calculator import default_calculator
+
+def _close_datetime(trade: Trade) -> Optional[datetime]:
+    """平仓事件时间：close_time，缺失时回退到 updated_at / open_time，且不早于开仓时间"""
+    if trade.sell_price is None:
+        return None
+    close_dt = trade.close_time or trade.updated_at or trade.open_time
+    if close_dt is not None and trade.open_time is not None and close_dt < trade.open_time:
+        close_dt = trade.open_time
+    return close_dt
+
+
+def _buy_cost(trade: Trade) -> float:
+    buy_commission = trade.buy_commission if trade.buy_commission is not None else (trade.commission or 0)
+    return trade.buy_price * trade.shares + buy_commission
+
+
+def _close_proceeds(trade: Trade) -> float:
+    """平仓回笼资金"""
+    if trade.profit_loss is not None:
+        return _buy_cost(trade) + trade.profit_loss
+    sell_amount = trade.sell_price * trade.shares
+    if trade.sell_commission is not None:
+        sell_commission = trade.sell_commission
+    else:
+        sell_commission = default_calculator.calculate_sell_commission(
+            trade.sell_price,
+            trade.shares,
+            trade.stock_code
+        )
+    return sell_amount - sell_commission
+
+
+def _position_value(trade: Trade) -> float:
+    return (trade.buy_price or 0) * (trade.shares or 0)
+
+
+class CapitalState:
+    """某日收盘后的策略运行状态：可用资金 + 持仓集合"""
+
+    def __init__(self, available_funds: float, positions: Optional[dict[int, float]] = None):
+        self.available_funds = available_funds
+        self.positions: dict[int, float] = positions or {}  # trade_id -> 持仓市值（按买入价）
+        self.position_value = sum(self.positions.values())
+
+    def open(self, trade: Trade):
+        self.available_funds -= _buy_cost(trade)
+        value = _position_value(trade)
+        self.positions[trade.id] = value
+        self.position_value += value
+
+    def close(self, trade: Trade):
+        self.available_funds += _close_proceeds(trade)
+        value = self.positions.pop(trade.id, None)
+        if value is not None:
+            self.position_value -= value
+        if not self.positions:
+            # 清仓时归零，避免浮点累计误差
+            self.position_value = 0.0
+
+    def point(self) -> CapitalPoint:
+        return (self.available_funds, self.position_value, self.available_funds + self.position_value)
+
+
+async def _load_state_before(
+    db: AsyncSession,
+    user_id: int,
+    strategy_id: int,
+    start_date: date,
+) -> Optional[CapitalState]:
+    """读取 start_date 之前最近一个日点，并还原当日收盘时的持仓集合"""
+    prev_result = await db.execute(
+        select(StrategyCapitalHistory.date, StrategyCapitalHistory.available_funds, StrategyCapitalHistory.capital)
+        .where(
+            StrategyCapitalHistory.user_id == user_id,
+            StrategyCapitalHistory.strategy_id == strategy_id,
+            StrategyCapitalHistory.date < start_date,
+        )
+        .order_by(StrategyCapitalHistory.date.desc())
+        .limit(1)
+    )
+    prev = prev_result.first()
+    if prev is None:
+        return None
+    prev_date, available_funds, capital = prev
+
+    # 候选：prev_date 当天或之前开仓、且未在 prev_date 当天或之前平仓
+    open_result = await db.execute(
+        select(Trade).where(
+            Trade.user_id == user_id,
+            Trade.strategy_id == strategy_id,
+            Trade.is_deleted == False,
+            Trade.open_date_bj <= prev_date,
+            or_(Trade.close_date_bj.is_(None), Trade.close_date_bj > prev_date),
+        )
+    )
+    positions: dict[int, float] = {}
+    for trade in open_result.scalars().all():
+        close_dt = _close_datetime(trade)
+        if close_dt is not None and beijing_date(close_dt) <= prev_date:
+            continue
+        positions[trade.id] = _position_value(trade)
+
+    available = float(available_funds) if available_funds is not None else float(capital)
+    return CapitalState(available, positions)
+
+
+async def _load_events_from(
+    db: AsyncSession,
+    user_id: int,
+    strategy_id: int,
+    start_date: date,
+) -> list[tuple[date, datetime, int, Trade]]:
+    """加载 start_date 及之后的开/平仓事件（北京时间日期），按 (日期, 时间) 稳定排序"""
+    result = await db.execute(
+        select(Trade)
+        .where(
+            Trade.user_id == user_id,
+            Trade.strategy_id == strategy_id,
+            Trade.is_deleted == False,
+            or_(
+                Trade.open_date_bj >= start_date,
+                Trade.close_date_bj >= start_date,
+                # 无 close_time 的已平仓记录按 updated_at 计平仓日
+                and_(Trade.sell_price.isnot(None), Trade.close_time.is_(None)),
+            ),
+        )
+        .order_by(Trade.open_time.asc())
+    )
+
+    events: list[tuple[date, datetime, int, Trade]] = []
+    for trade in result.scalars().all():
+        open_date = beijing_date(trade.open_time)
+        if open_date is not None and open_date >= start_date:
+            events.append((open_date, trade.open_time, 0, trade))
+        close_dt = _close_datetime(trade)
+        close_date = beijing_date(close_dt)
+        if close_date is not None and close_date >= start_date:
+            events.append((close_date, close_dt, 1, trade))
+    events.sort(key=lambda e: (e[0], e[1]))
+    return events
+
+
+async def rebuild_strategy_capital_history(
+    db: AsyncSession,
+    user_id: int,
+    strategy_id: int,
+    anchor_date: date,
+    initial_capital: float,
+    start_date: date,
+) -> None:
+    """从 start_date 起增量重建策略资金曲线（不提交事务）
+    start_date <= anchor_date 或之前没有日点时从初始资金全量重放"""
+    state = None
+    if start_date > anchor_date:
+        state = await _load_state_before(db, user_id, strategy_id, start_date)
+    points: dict[date, CapitalPoint] = {}
+    if state is None:
+        start_date = anchor_date
+        state = CapitalState(initial_capital)
+        points[anchor_date] = state.point()
+
+    for event_date, _, kind, trade in await _load_events_from(db, user_id, strategy_id, start_date):
+        if kind == 0:
+            state.open(trade)
+        else:
+            state.close(trade)
+        points[event_date] = state.point()
+
+    existing = await load_strategy_capital_points(db, user_id, strategy_id, start_date)
+    changed, stale = diff_points(existing, points)
+
+    await delete_strategy_capital_history(db, user_id, [strategy_id], dates=stale)
+    await upsert_strategy_capital_history(db, user_id, strategy_id, changed)
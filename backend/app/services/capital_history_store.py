@@ -0,0 +1,194 @@
+"""
+资金曲线批量持久化
+
+按数据库方言生成 INSERT ... ON CONFLICT DO UPDATE（PostgreSQL / SQLite）和集合式 DELETE，
+一次语句写入/删除多天数据，不再逐条加载 ORM 对象。
+其他方言回退到逐条 merge。
+"""
+
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import CapitalHistory, StrategyCapitalHistory, dialect_insert
+
+# (可用资金, 持仓市值, 总资产)
+CapitalPoint = tuple[float, float, float]
+
+# SQLite 单条语句绑定参数上限较低，分批写入
+_UPSERT_CHUNK = 200
+
+# 小于该差值的金额视为未变化，不重写
+_EPSILON = 1e-6
+
+
+async def _bulk_upsert(db: AsyncSession, model, index_elements: list[str], rows: list[dict]) -> None:
+    if not rows:
+        return
+    insert = dialect_insert(db)
+    if insert is None:
+        for row in rows:
+            result = await db.execute(select(model).filter_by(**{col: row[col] for col in index_elements}))
+            record = result.scalar_one_or_none()
+            if record is None:
+                db.add(model(**row))
+            else:
+                for key, value in row.items():
+                    setattr(record, key, value)
+        await db.flush()
+        return
+
+    for i in range(0, len(rows), _UPSERT_CHUNK):
+        stmt = insert(model).values(rows[i:i + _UPSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={
+                "capital": stmt.excluded.capital,
+                "available_funds": stmt.excluded.available_funds,
+                "position_value": stmt.excluded.position_value,
+                "created_at": stmt.excluded.created_at,
+            },
+        )
+        await db.execute(stmt)
+
+
+def _point_rows(points: dict[date, CapitalPoint], **keys) -> list[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            **keys,
+            "date": day,
+            "capital": total,
+            "available_funds": available,
+            "position_value": position_value,
+            "created_at": now,
+        }
+        for day, (available, position_value, total) in sorted(points.items())
+    ]
+
+
+def _point_changed(existing: tuple, point: CapitalPoint) -> bool:
+    capital, available_funds, position_value = existing
+    new_available, new_position_value, new_total = point
+    return (
+        capital is None
+        or abs(float(capital) - new_total) > _EPSILON
+        or available_funds is None
+        or abs(float(available_funds) - new_available) > _EPSILON
+        or abs(float(position_value or 0.0) - new_position_value) > _EPSILON
+    )
+
+
+def diff_points(
+    existing: dict[date, tuple],
+    points: dict[date, CapitalPoint],
+) -> tuple[dict[date, CapitalPoint], list[date]]:
+    """对比已落库日点 {date: (capital, available_funds, position_value)} 与新计算结果
+    返回 (需要写入的日点, 需要删除的日期)"""
+    changed = {
+        day: point for day, point in points.items()
+        if day not in existing or _point_changed(existing[day], point)
+    }
+    stale = [day for day in existing if day not in points]
+    return changed, stale
+
+
+async def load_capital_points(db: AsyncSession, user_id: int, from_date: date) -> dict[date, tuple]:
+    """读取 from_date 及之后的账户资金日点（只投影数值列）"""
+    result = await db.execute(
+        select(
+            CapitalHistory.date,
+            CapitalHistory.capital,
+            CapitalHistory.available_funds,
+            CapitalHistory.position_value,
+        ).where(
+            CapitalHistory.user_id == user_id,
+            CapitalHistory.date >= from_date,
+        )
+    )
+    return {row[0]: tuple(row[1:]) for row in result.all()}
+
+
+async def load_strategy_capital_points(
+    db: AsyncSession,
+    user_id: int,
+    strategy_id: int,
+    from_date: date,
+) -> dict[date, tuple]:
+    """读取 from_date 及之后的策略资金日点（只投影数值列）"""
+    result = await db.execute(
+        select(
+            StrategyCapitalHistory.date,
+            StrategyCapitalHistory.capital,
+            StrategyCapitalHistory.available_funds,
+            StrategyCapitalHistory.position_value,
+        ).where(
+            StrategyCapitalHistory.user_id == user_id,
+            StrategyCapitalHistory.strategy_id == strategy_id,
+            StrategyCapitalHistory.date >= from_date,
+        )
+    )
+    return {row[0]: tuple(row[1:]) for row in result.all()}
+
+
+async def upsert_capital_history(db: AsyncSession, user_id: int, points: dict[date, CapitalPoint]) -> None:
+    """批量写入账户资金曲线（按 user_id + date 冲突更新）"""
+    await _bulk_upsert(db, CapitalHistory, ["user_id", "date"], _point_rows(points, user_id=user_id))
+
+
+async def upsert_strategy_capital_history(
+    db: AsyncSession,
+    user_id: int,
+    strategy_id: int,
+    points: dict[date, CapitalPoint],
+) -> None:
+    """批量写入策略资金曲线（按 user_id + strategy_id + date 冲突更新）"""
+    await _bulk_upsert(
+        db,
+        StrategyCapitalHistory,
+        ["user_id", "strategy_id", "date"],
+        _point_rows(points, user_id=user_id, strategy_id=strategy_id),
+    )
+
+
+async def delete_capital_history(
+    db: AsyncSession,
+    user_id: int,
+    dates: Optional[Iterable[date]] = None,
+    keep_date: Optional[date] = None,
+) -> None:
+    """集合式删除账户资金曲线
+    dates 为 None 时删除全部日期（keep_date 除外）"""
+    stmt = delete(CapitalHistory).where(CapitalHistory.user_id == user_id)
+    if dates is not None:
+        dates = list(dates)
+        if not dates:
+            return
+        stmt = stmt.where(CapitalHistory.date.in_(dates))
+    if keep_date is not None:
+        stmt = stmt.where(CapitalHistory.date != keep_date)
+    await db.execute(stmt, execution_options={"synchronize_session": False})
+
+
+async def delete_strategy_capital_history(
+    db: AsyncSession,
+    user_id: int,
+    strategy_ids: Optional[Iterable[int]] = None,
+    dates: Optional[Iterable[date]] = None,
+) -> None:
+    """集合式删除策略资金曲线
+    strategy_ids 为 None 时删除该用户全部策略；dates 为 None 时删除全部日期"""
+    stmt = delete(StrategyCapitalHistory).where(StrategyCapitalHistory.user_id == user_id)
+    if strategy_ids is not None:
+        strategy_ids = list(strategy_ids)
+        if not strategy_ids:
+            return
+        stmt = stmt.where(StrategyCapitalHistory.strategy_id.in_(strategy_ids))
+    if dates is not None:
+        dates = list(dates)
+        if not dates:
+            return
+        stmt = stmt.where(StrategyCapitalHistory.date.in_(dates))
+    await db.execute(stmt, execution_options={"synchronize_session": False})
@@ -0,0 +1,213 @@
+"""
+闹铃邮件发送队列
+
+事件循环内只做入队（不阻塞），后台调度任务：
+- 收集 EMAIL_DIGEST_WINDOW 秒内的提醒，同一收件人的多条合并为一封摘要邮件
+- 一批邮件分给线程池中的 worker，每个 worker 复用一个已认证的SMTP连接发送
+- 记录队列深度、发送数量和发送延迟
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from app.services.email_service import EmailService, default_email_service
+from app.services.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+
+class AlertEmailQueue:
+    """闹铃邮件异步发送队列"""
+
+    def __init__(self, email_service: EmailService = default_email_service):
+        self.email_service = email_service
+        self.digest_window = float(os.getenv("EMAIL_DIGEST_WINDOW", "5"))
+        self.max_workers = max(1, int(os.getenv("EMAIL_WORKERS", "2")))
+        self.max_queue_size = int(os.getenv("EMAIL_QUEUE_MAXSIZE", "1000"))
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: asyncio.Task | None = None
+        self.running = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # enqueued/dropped 按提醒条数计，sent/failed/digests 按邮件封数（每个收件人一封）计
+        self.metrics: Dict[str, int] = {
+            "enqueued": 0,
+            "dropped": 0,
+            "sent": 0,
+            "failed": 0,
+            "digests": 0,
+            "bursts": 0,
+        }
+        self._send_latency = deque(maxlen=200)  # 单个SMTP连接发送一组邮件的耗时
+        self._delivery_latency = deque(maxlen=200)  # 入队到发送完成的耗时
+
+    async def start(self):
+        """启动发送队列"""
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="email")
+        self.running = True
+        self.task = asyncio.create_task(self._dispatch_loop())
+        logger.info("✅ 邮件发送队列已启动")
+
+    async def stop(self, timeout: float = 30):
+        """停止发送队列：发送已入队的提醒后退出"""
+        if not self.running:
+            return
+        self.running = False
+        if self.task:
+            try:
+                self.queue.put_nowait(None)
+                await asyncio.wait_for(self.task, timeout=timeout)
+            except (asyncio.QueueFull, asyncio.TimeoutError):
+                self.task.cancel()
+                try:
+                    await self.task
+                except asyncio.CancelledError:
+                    pass
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        logger.info("⏹️ 邮件发送队列已停止")
+
+    def enqueue_price_alert(
+        self,
+        to_email: str,
+        stock_code: str,
+        stock_name: Optional[str],
+        alert_type: str,
+        current_price: float,
+        target_price: float,
+    ) -> bool:
+        """提醒入队（不阻塞），返回是否入队成功"""
+        if not self.running or self.queue is None:
+            logger.warning("邮件发送队列未启动，跳过发送")
+            return False
+        if not self.email_service.is_configured():
+            logger.warning("邮件服务未配置，跳过发送")
+            return False
+        try:
+            self.queue.put_nowait({
+                "to_email": to_email,
+                "stock_code": stock_code,
+                "stock_name": stock_name,
+                "alert_type": alert_type,
+                "current_price": current_price,
+                "target_price": target_price,
+                "enqueued_at": time.monotonic(),
+            })
+        except asyncio.QueueFull:
+            self.metrics["dropped"] += 1
+            logger.error(f"❌ 邮件发送队列已满，丢弃提醒: {to_email} - {stock_code}")
+            return False
+        self.metrics["enqueued"] += 1
+        return True
+
+    async def _dispatch_loop(self):
+        """调度循环：收集一个摘要窗口内的提醒后成批发送"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.digest_window
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self._send_burst(batch)
+            except Exception as e:
+                self.metrics["failed"] += len({alert["to_email"] for alert in batch})
+                logger.error(f"❌ 批量发送邮件失败: {e}")
+
+    async def _send_burst(self, batch: list[dict]):
+        """按收件人合并提醒，分给 worker 并发发送"""
+        by_recipient: Dict[str, list[dict]] = {}
+        for alert in batch:
+            by_recipient.setdefault(alert["to_email"], []).append(alert)
+
+        groups = list(by_recipient.items())
+        worker_count = min(self.max_workers, len(groups))
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, self._send_groups, groups[i::worker_count])
+                for i in range(worker_count)
+            ),
+            return_exceptions=True,
+        )
+
+        self.metrics["bursts"] += 1
+        self.metrics["digests"] += sum(1 for _, alerts in groups if len(alerts) > 1)
+        now = time.monotonic()
+        for i, result in enumerate(results):
+            worker_groups = groups[i::worker_count]
+            if isinstance(result, Exception):
+                self.metrics["failed"] += len(worker_groups)
+                logger.error(f"❌ 邮件发送失败: {result}")
+                continue
+            sent_groups, elapsed = result
+            self._send_latency.append(elapsed)
+            self.metrics["failed"] += len(worker_groups) - sent_groups
+            self.metrics["sent"] += sent_groups
+            for _, alerts in worker_groups:
+                for alert in alerts:
+                    self._delivery_latency.append(now - alert["enqueued_at"])
+        logger.info(f"📨 邮件批次发送完成: {len(batch)} 条提醒, {len(groups)} 个收件人")
+
+    def _send_groups(self, groups: list[tuple[str, list[dict]]]) -> tuple[int, float]:
+        """在线程池中执行：构造邮件并用一个SMTP连接发送，返回 (成功封数, 耗时)"""
+        start = time.perf_counter()
+        messages = []
+        for to_email, alerts in groups:
+            if len(alerts) == 1:
+                alert = alerts[0]
+                messages.append(self.email_service.build_price_alert_message(
+                    to_email,
+                    alert["stock_code"],
+                    alert["stock_name"],
+                    alert["alert_type"],
+                    alert["current_price"],
+                    alert["target_price"],
+                ))
+            else:
+                messages.append(self.email_service.build_digest_message(to_email, alerts))
+        sent = self.email_service.send_messages(messages)
+        return sent, time.perf_counter() - start
+
+    @staticmethod
+    def _percentile(samples: deque, q: float) -> Optional[float]:
+        value = percentile(samples, q)
+        return round(value, 3) if value is not None else None
+
+    def get_metrics(self) -> Dict:
+        """队列运行指标"""
+        return {
+            "running": self.running,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            **self.metrics,
+            "send_latency_p50": self._percentile(self._send_latency, 50),
+            "send_latency_p95": self._percentile(self._send_latency, 95),
+            "delivery_latency_p50": self._percentile(self._delivery_latency, 50),
+            "delivery_latency_p95": self._percentile(self._delivery_latency, 95),
+        }
+
+
+# 全局闹铃邮件队列
+alert_email_queue = AlertEmailQueue()
@@ -20,6 +20,7 @@ SMTP_USERNAME = os.getenv("SMTP_USERNAME", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", SMTP_USERNAME)
 SENDER_NAME = os.getenv("SENDER_NAME", "Trade View 价格提醒")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "15"))
 
 
 class EmailService:
@@ -47,7 +48,7 @@ class EmailService:
         target_price: float
     ) -> bool:
         """
-        发送价格提醒邮件
+        发送价格提醒邮件（同步，会阻塞调用线程；闹铃推送请走 email_queue）
         
         Args:
             to_email: 收件人邮箱
@@ -65,14 +66,155 @@ class EmailService:
             return False
         
         try:
-            # 构造邮件内容
-            alert_type_zh = "止盈提醒 🎉" if alert_type == "take_profit" else "止损提醒 ⚠️"
-            stock_display = f"{stock_code} - {stock_name}" if stock_name else stock_code
-            
-            subject = f"【Trade View】{alert_type_zh} - {stock_code}"
+            message = self.build_price_alert_message(
+                to_email, stock_code, stock_name, alert_type, current_price, target_price
+            )
+            if self.send_messages([message]) != 1:
+                return False
+            logger.info(f"✅ 邮件发送成功: {to_email} - {stock_code} {alert_type}")
+            return True
             
-            # HTML邮件正文（JOJO风格）
-            html_body = f"""
+        except Exception as e:
+            logger.error(f"❌ 邮件发送失败: {to_email} - {stock_code} - {e}")
+            return False
+
+    def _new_message(self, to_email: str, subject: str, html_body: str) -> MIMEMultipart:
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = f"{self.sender_name} <{self.sender_email}>"
+        message["To"] = to_email
+        message.attach(MIMEText(html_body, "html", "utf-8"))
+        return message
+
+    def build_price_alert_message(
+        self,
+        to_email: str,
+        stock_code: str,
+        stock_name: Optional[str],
+        alert_type: str,
+        current_price: float,
+        target_price: float
+    ) -> MIMEMultipart:
+        """构造单条价格提醒邮件"""
+        alert_type_zh = "止盈提醒 🎉" if alert_type == "take_profit" else "止损提醒 ⚠️"
+        stock_display = f"{stock_code} - {stock_name}" if stock_name else stock_code
+        
+        subject = f"【Trade View】{alert_type_zh} - {stock_code}"
+        
+        # HTML邮件正文（JOJO风格）
+        html_body = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <style>
+                body {{
+                    font-family: 'Arial', sans-serif;
+                    background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%);
+                    color: #ffffff;
+                    padding: 20px;
+                }}
+                .container {{
+                    max-width: 600px;
+                    margin: 0 auto;
+                    background-color: #0f3460;
+                    border: 4px solid #FFD700;
+                    border-radius: 12px;
+                    padding: 30px;
+                    box-shadow: 0 8px 32px rgba(255, 215, 0, 0.3);
+                }}
+                .header {{
+                    text-align: center;
+                    font-size: 32px;
+                    font-weight: bold;
+                    color: #FFD700;
+                    text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.5);
+                    margin-bottom: 20px;
+                }}
+                .alert-box {{
+                    background: {'rgba(16, 185, 129, 0.2)' if alert_type == 'take_profit' else 'rgba(239, 68, 68, 0.2)'};
+                    border: 2px solid {'#10B981' if alert_type == 'take_profit' else '#EF4444'};
+                    border-radius: 8px;
+                    padding: 20px;
+                    margin: 20px 0;
+                }}
+                .stock-name {{
+                    font-size: 24px;
+                    font-weight: bold;
+                    color: #FFD700;
+                    margin-bottom: 10px;
+                }}
+                .price-info {{
+                    font-size: 18px;
+                    margin: 10px 0;
+                }}
+                .price {{
+                    font-size: 28px;
+                    font-weight: bold;
+                    color: {'#10B981' if alert_type == 'take_profit' else '#EF4444'};
+                }}
+                .footer {{
+                    text-align: center;
+                    font-size: 14px;
+                    color: #9ca3af;
+                    margin-top: 30px;
+                    padding-top: 20px;
+                    border-top: 1px solid #4b5563;
+                }}
+                .emoji {{
+                    font-size: 48px;
+                    text-align: center;
+                    margin: 20px 0;
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">⭐ TRADE VIEW ⭐</div>
+                <div class="emoji">{'🎉' if alert_type == 'take_profit' else '⚠️'}</div>
+                <div class="alert-box">
+                    <div class="stock-name">{stock_display}</div>
+                    <div class="price-info">
+                        <strong>提醒类型：</strong>{alert_type_zh}
+                    </div>
+                    <div class="price-info">
+                        <strong>当前价格：</strong>
+                        <span class="price">¥{current_price:.2f}</span>
+                    </div>
+                    <div class="price-info">
+                        <strong>目标价格：</strong>¥{target_price:.2f}
+                    </div>
+                </div>
+                <div class="footer">
+                    <p>这是一封自动发送的提醒邮件，请勿直接回复。</p>
+                    <p>如需关闭邮箱提醒，请登录 Trade View 在用户设置中修改。</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+        
+        return self._new_message(to_email, subject, html_body)
+
+    def build_digest_message(self, to_email: str, alerts: list[dict]) -> MIMEMultipart:
+        """把同一收件人短时间内的多条提醒合并为一封摘要邮件
+        alerts: [{stock_code, stock_name, alert_type, current_price, target_price}]"""
+        rows = []
+        for alert in alerts:
+            is_take_profit = alert["alert_type"] == "take_profit"
+            stock_display = (
+                f"{alert['stock_code']} - {alert['stock_name']}" if alert.get("stock_name") else alert["stock_code"]
+            )
+            rows.append(f"""
+                    <tr>
+                        <td>{stock_display}</td>
+                        <td style="color: {'#10B981' if is_take_profit else '#EF4444'};">{'止盈 🎉' if is_take_profit else '止损 ⚠️'}</td>
+                        <td>¥{alert['current_price']:.2f}</td>
+                        <td>¥{alert['target_price']:.2f}</td>
+                    </tr>""")
+
+        subject = f"【Trade View】{len(alerts)} 条价格提醒"
+        html_body = f"""
             <!DOCTYPE html>
             <html>
             <head>
@@ -91,70 +233,37 @@ class EmailService:
                         border: 4px solid #FFD700;
                         border-radius: 12px;
                         padding: 30px;
-                        box-shadow: 0 8px 32px rgba(255, 215, 0, 0.3);
                     }}
                     .header {{
                         text-align: center;
                         font-size: 32px;
                         font-weight: bold;
                         color: #FFD700;
-                        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.5);
                         margin-bottom: 20px;
                     }}
-                    .alert-box {{
-                        background: {'rgba(16, 185, 129, 0.2)' if alert_type == 'take_profit' else 'rgba(239, 68, 68, 0.2)'};
-                        border: 2px solid {'#10B981' if alert_type == 'take_profit' else '#EF4444'};
-                        border-radius: 8px;
-                        padding: 20px;
-                        margin: 20px 0;
-                    }}
-                    .stock-name {{
-                        font-size: 24px;
-                        font-weight: bold;
-                        color: #FFD700;
-                        margin-bottom: 10px;
-                    }}
-                    .price-info {{
-                        font-size: 18px;
-                        margin: 10px 0;
+                    table {{
+                        width: 100%;
+                        border-collapse: collapse;
                     }}
-                    .price {{
-                        font-size: 28px;
-                        font-weight: bold;
-                        color: {'#10B981' if alert_type == 'take_profit' else '#EF4444'};
+                    th, td {{
+                        padding: 8px;
+                        border-bottom: 1px solid #4b5563;
+                        text-align: left;
                     }}
                     .footer {{
                         text-align: center;
                         font-size: 14px;
                         color: #9ca3af;
                         margin-top: 30px;
-                        padding-top: 20px;
-                        border-top: 1px solid #4b5563;
-                    }}
-                    .emoji {{
-                        font-size: 48px;
-                        text-align: center;
-                        margin: 20px 0;
                     }}
                 </style>
             </head>
             <body>
                 <div class="container">
                     <div class="header">⭐ TRADE VIEW ⭐</div>
-                    <div class="emoji">{'🎉' if alert_type == 'take_profit' else '⚠️'}</div>
-                    <div class="alert-box">
-                        <div class="stock-name">{stock_display}</div>
-                        <div class="price-info">
-                            <strong>提醒类型：</strong>{alert_type_zh}
-                        </div>
-                        <div class="price-info">
-                            <strong>当前价格：</strong>
-                            <span class="price">¥{current_price:.2f}</span>
-                        </div>
-                        <div class="price-info">
-                            <strong>目标价格：</strong>¥{target_price:.2f}
-                        </div>
-                    </div>
+                    <table>
+                        <tr><th>股票</th><th>类型</th><th>当前价格</th><th>目标价格</th></tr>{''.join(rows)}
+                    </table>
                     <div class="footer">
                         <p>这是一封自动发送的提醒邮件，请勿直接回复。</p>
                         <p>如需关闭邮箱提醒，请登录 Trade View 在用户设置中修改。</p>
@@ -163,29 +272,51 @@ class EmailService:
             </body>
             </html>
             """
-            
-            # 创建邮件
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"{self.sender_name} <{self.sender_email}>"
-            message["To"] = to_email
-            
-            # 添加HTML正文
-            html_part = MIMEText(html_body, "html", "utf-8")
-            message.attach(html_part)
-            
-            # 发送邮件
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.username, self.password)
-                server.send_message(message)
-            
-            logger.info(f"✅ 邮件发送成功: {to_email} - {stock_code} {alert_type}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ 邮件发送失败: {to_email} - {stock_code} - {e}")
-            return False
+        return self._new_message(to_email, subject, html_body)
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=SMTP_TIMEOUT)
+        server.starttls()
+        server.login(self.username, self.password)
+        return server
+
+    def send_messages(self, messages: list[MIMEMultipart]) -> int:
+        """复用同一个已认证的SMTP连接发送一批邮件（同步），返回成功数量
+        连接中途断开或出现套接字错误/超时时重连一次；重连失败则放弃剩余邮件，已发送的仍计入成功数量"""
+        if not messages:
+            return 0
+        sent = 0
+        server = self._connect()
+        try:
+            for index, message in enumerate(messages):
+                try:
+                    server.send_message(message)
+                    sent += 1
+                    continue
+                except smtplib.SMTPServerDisconnected:
+                    pass
+                except smtplib.SMTPException as e:
+                    logger.error(f"❌ 邮件发送失败: {message['To']} - {e}")
+                    continue
+                except OSError as e:
+                    # 套接字错误/超时后连接状态未知，与断开同样重连
+                    logger.warning(f"⚠️ SMTP连接异常，重连后重试: {message['To']} - {e}")
+                server.close()
+                try:
+                    server = self._connect()
+                    server.send_message(message)
+                    sent += 1
+                except (smtplib.SMTPException, OSError) as e:
+                    logger.error(
+                        f"❌ SMTP重连后发送失败: {message['To']} - {e}，放弃本批剩余 {len(messages) - index - 1} 封"
+                    )
+                    break
+        finally:
+            try:
+                server.quit()
+            except Exception:
+                pass
+        return sent
 
 
 # 默认邮件服务实例
@@ -0,0 +1,161 @@
+"""
+A股交易时段时钟
+
+按北京时间预先计算每个交易日的时段边界（时间戳），运行中只做数值比较：
+- 时段：集合竞价（含开盘前缓冲）、连续竞价、午间休市、休市
+- 周末和节假日休市；节假日从 MARKET_HOLIDAYS_FILE（每行一个 YYYY-MM-DD，# 开头为注释）
+  和 MARKET_HOLIDAYS（逗号分隔）加载，可调用 load_holidays 运行时更新
+- 价格循环、闹铃循环在非交易时段直接睡到下一个时段开始，不再定时空转
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+BEIJING_TZ = ZoneInfo("Asia/Shanghai")
+
+AUCTION = "auction"  # 集合竞价（含开盘前缓冲）
+CONTINUOUS = "continuous"  # 连续竞价
+LUNCH_BREAK = "lunch_break"  # 午间休市
+CLOSED = "closed"  # 休市（盘前、盘后、周末、节假日）
+
+ACTIVE_PHASES = frozenset({AUCTION, CONTINUOUS})
+
+# 交易日时段模板（北京时间），前后各留 5 分钟缓冲，与原 9:10-11:35、12:55-15:05 的监控窗口一致
+SESSION_TEMPLATE = (
+    (AUCTION, dt_time(9, 10), dt_time(9, 30)),
+    (CONTINUOUS, dt_time(9, 30), dt_time(11, 35)),
+    (LUNCH_BREAK, dt_time(11, 35), dt_time(12, 55)),
+    (CONTINUOUS, dt_time(12, 55), dt_time(15, 5)),
+)
+
+
+def _parse_dates(values: Iterable[str]) -> set[date]:
+    dates = set()
+    for value in values:
+        value = value.split("#", 1)[0].strip()
+        if not value:
+            continue
+        try:
+            dates.add(date.fromisoformat(value))
+        except ValueError:
+            logger.warning(f"忽略无效的节假日日期: {value}")
+    return dates
+
+
+class MarketClock:
+    """交易时段时钟（按交易日缓存时段边界）"""
+
+    def __init__(self):
+        self.max_sleep = float(os.getenv("MARKET_CLOCK_MAX_SLEEP", "3600"))  # 单次睡眠上限，便于节假日表更新后重新计算
+        self.auction_interval = float(os.getenv("MARKET_POLL_AUCTION", "1.0"))
+        self.holidays: set[date] = set()
+        # 当前缓存的北京时间自然日：[day_start, day_end) 时间戳及当日时段
+        self._day_start = 0.0
+        self._day_end = 0.0
+        self._sessions: tuple[tuple[str, float, float], ...] = ()
+        self.load_holidays(self._configured_holidays())
+
+    @staticmethod
+    def _configured_holidays() -> set[date]:
+        values: list[str] = []
+        path = os.getenv("MARKET_HOLIDAYS_FILE")
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    values.extend(f.read().splitlines())
+            except OSError as e:
+                logger.warning(f"读取节假日文件失败 {path}: {e}")
+        values.extend((os.getenv("MARKET_HOLIDAYS") or "").split(","))
+        return _parse_dates(values)
+
+    def load_holidays(self, holidays: Iterable):
+        """替换节假日列表（date 或 YYYY-MM-DD 字符串）"""
+        dates = set()
+        strings = []
+        for value in holidays:
+            if isinstance(value, date):
+                dates.add(value)
+            else:
+                strings.append(str(value))
+        self.holidays = dates | _parse_dates(strings)
+        self._day_start = self._day_end = 0.0  # 清空时段缓存
+        if self.holidays:
+            logger.info(f"已加载 {len(self.holidays)} 个休市日")
+
+    def is_trading_day(self, day: date) -> bool:
+        return day.weekday() < 5 and day not in self.holidays
+
+    def sessions_for(self, day: date) -> tuple[tuple[str, float, float], ...]:
+        """某个北京时间日期的时段 [(phase, 开始时间戳, 结束时间戳)]，休市日为空"""
+        if not self.is_trading_day(day):
+            return ()
+        return tuple(
+            (
+                phase,
+                datetime.combine(day, start, BEIJING_TZ).timestamp(),
+                datetime.combine(day, end, BEIJING_TZ).timestamp(),
+            )
+            for phase, start, end in SESSION_TEMPLATE
+        )
+
+    def _ensure_day(self, ts: float):
+        if self._day_start <= ts < self._day_end:
+            return
+        day = datetime.fromtimestamp(ts, BEIJING_TZ).date()
+        self._day_start = datetime.combine(day, dt_time.min, BEIJING_TZ).timestamp()
+        self._day_end = datetime.combine(day + timedelta(days=1), dt_time.min, BEIJING_TZ).timestamp()
+        self._sessions = self.sessions_for(day)
+
+    def state(self, ts: Optional[float] = None) -> tuple[str, float]:
+        """返回 (当前时段, 该时段结束的时间戳)；休市时结束时间为下一次开盘"""
+        ts = time.time() if ts is None else ts
+        self._ensure_day(ts)
+        for phase, start, end in self._sessions:
+            if start <= ts < end:
+                return phase, end
+        return CLOSED, self.next_open(ts)
+
+    def phase(self, ts: Optional[float] = None) -> str:
+        return self.state(ts)[0]
+
+    def is_active(self, ts: Optional[float] = None) -> bool:
+        """是否处于需要轮询行情的时段（集合竞价或连续竞价）"""
+        return self.state(ts)[0] in ACTIVE_PHASES
+
+    def next_open(self, ts: Optional[float] = None) -> float:
+        """下一个活跃时段开始的时间戳（一年内无交易日时返回一年后）"""
+        ts = time.time() if ts is None else ts
+        day = datetime.fromtimestamp(ts, BEIJING_TZ).date()
+        for offset in range(366):
+            for phase, start, _ in self.sessions_for(day + timedelta(days=offset)):
+                if phase in ACTIVE_PHASES and start > ts:
+                    return start
+        return ts + 366 * 86400
+
+    def poll_interval(self, phase: str, continuous_interval: float) -> Optional[float]:
+        """时段对应的轮询间隔，非活跃时段返回 None（应睡到下一次开盘）"""
+        if phase == CONTINUOUS:
+            return continuous_interval
+        if phase == AUCTION:
+            return max(continuous_interval, self.auction_interval)
+        return None
+
+    async def sleep_until_open(self):
+        """非活跃时段睡到下一个时段开始（单次不超过 max_sleep）"""
+        ts = time.time()
+        phase, _ = self.state(ts)
+        if phase in ACTIVE_PHASES:
+            return
+        delay = self.next_open(ts) - ts
+        await asyncio.sleep(max(0.0, min(delay, self.max_sleep)))
+
+
+# 全局交易时段时钟
+market_clock = MarketClock()
@@ -0,0 +1,359 @@
+"""
+行情/闹铃循环的进程角色
+
+MARKET_DATA_MODE=embedded（默认）：与原来一致，每个进程各自轮询行情、运行闹铃监控。
+
+MARKET_DATA_MODE=shared：用于 uvicorn/gunicorn 多 worker 部署。同一台机器上的 worker 通过文件锁选出一个行情进程：
+- 行情进程：运行价格轮询和闹铃监控，把上游报价写入共享内存行情板（QuoteBoard），
+  处理其他 worker 信箱中的订阅需求和交易变更，并通过事件环转发闹铃通知
+- 其他 worker：不请求上游轮询、不运行闹铃；按交易时段从行情板读取已订阅代码的变化报价（无网络/数据库 I/O），
+  定期把本进程需要的代码及查看者数写入信箱；交易变更转发给行情进程；定期尝试获取锁，行情进程退出后自动接替
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+from app.services.alert_monitor import alert_monitor
+from app.services.market_clock import market_clock
+from app.services.price_monitor import price_monitor
+from app.services.push_hub import push_hub
+from app.services.quote_board import MAILBOX_TRADE, MAILBOX_USER, MAILBOX_WANT, QuoteBoard, fcntl
+from app.services.serialization import json_dumps
+
+logger = logging.getLogger(__name__)
+
+EMBEDDED = "embedded"
+LEADER = "leader"
+FOLLOWER = "follower"
+
+DEMAND_SUBSCRIBER = "board_demand"  # 行情进程中代表其他 worker 订阅需求的订阅者ID
+
+_FORWARD_KINDS = {"trade": MAILBOX_TRADE, "user": MAILBOX_USER}
+
+
+class MarketDataCoordinator:
+    """按 MARKET_DATA_MODE 启动行情/闹铃循环，shared 模式下负责选主和行情板读写"""
+
+    def __init__(self):
+        self.mode = (os.getenv("MARKET_DATA_MODE", EMBEDDED) or EMBEDDED).strip().lower()
+        self.board_path = os.getenv("QUOTE_BOARD_PATH") or os.path.join(tempfile.gettempdir(), "trade-view-quotes.bin")
+        self.board_capacity = int(os.getenv("QUOTE_BOARD_CAPACITY", "8192"))
+        self.board_max_age = float(os.getenv("QUOTE_BOARD_MAX_AGE", "15"))  # 非行情进程直接采用的报价最大时效
+        self.control_interval = float(os.getenv("MARKET_DATA_CONTROL_INTERVAL", "0.25"))
+        self.election_interval = float(os.getenv("MARKET_DATA_ELECTION_INTERVAL", "2"))
+        self.demand_refresh = float(os.getenv("MARKET_DATA_DEMAND_REFRESH", "10"))
+        self.demand_ttl = float(os.getenv("MARKET_DATA_DEMAND_TTL", "30"))
+        self.lookup_wait = float(os.getenv("MARKET_DATA_LOOKUP_WAIT", "2"))  # 行情板未命中时等待行情进程补齐的最长时间
+        self.role: Optional[str] = None
+        self.board: Optional[QuoteBoard] = None
+        self._lock_fd: Optional[int] = None
+        self._tasks: list[asyncio.Task] = []
+        self._seen: Dict[str, int] = {}  # 非行情进程：code -> 已读取的槽位版本号
+        self._seen_version = -1
+        self._demand_sent: Dict[str, tuple[float, int]] = {}  # 非行情进程：code -> (最近一次写入信箱的时间, 上报的查看者数)
+        self._demand: Dict[str, Dict[int, tuple[int, float]]] = {}  # 行情进程：code -> {worker pid: (查看者数, 收到时间)}
+        self._resync_tasks: Dict[int, asyncio.Task] = {}  # 行情进程：trade_id -> 进行中的触发簿同步
+        self._resync_again: set[int] = set()  # 同步进行中又收到变更的交易，完成后再同步一次
+        self._cold_fetches: set[asyncio.Task] = set()  # 行情进程：为 worker 未命中代码发起的即时查价
+
+    # ---- 启停 ----
+
+    async def start(self):
+        if self.mode != "shared":
+            self.role = EMBEDDED
+            await price_monitor.start()
+            await alert_monitor.start()
+            return
+        if fcntl is None:
+            logger.warning("当前平台不支持文件锁，MARKET_DATA_MODE=shared 退回 embedded")
+            self.role = EMBEDDED
+            await price_monitor.start()
+            await alert_monitor.start()
+            return
+
+        self.board = QuoteBoard(self.board_path, capacity=self.board_capacity)
+        await price_monitor.start(poll=False)
+        if self._try_acquire():
+            await self._become_leader()
+        else:
+            self._become_follower()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks = []
+        for task in list(self._resync_tasks.values()):
+            task.cancel()
+        self._resync_tasks.clear()
+        self._resync_again.clear()
+        for task in list(self._cold_fetches):
+            task.cancel()
+        self._cold_fetches.clear()
+        if self.role in (EMBEDDED, LEADER):
+            await alert_monitor.stop()
+        await price_monitor.stop()
+        price_monitor.board_publisher = None
+        price_monitor.board_lookup = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # 关闭即释放锁，其他 worker 可接替
+            self._lock_fd = None
+        if self.board is not None:
+            self.board.close()
+            self.board = None
+
+    def _try_acquire(self) -> bool:
+        fd = os.open(self.board_path + ".leader", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        return True
+
+    # ---- 行情进程 ----
+
+    async def _become_leader(self):
+        self.role = LEADER
+        self.board.claim()
+        alert_monitor.forwarder = None
+        price_monitor.board_lookup = None
+        price_monitor.board_publisher = self.board.publish
+        push_hub.alert_forwarder = self._publish_alert
+        # 需求订阅者只负责把代码留在轮询范围内，查看者数按各 worker 上报的数量计入定级
+        price_monitor.scheduler.passive_subscribers.add(DEMAND_SUBSCRIBER)
+        price_monitor.scheduler.external_watchers = self._external_watchers
+        price_monitor.start_polling()
+        await alert_monitor.start()
+        self._tasks.append(asyncio.create_task(self._leader_loop()))
+        logger.info(f"✅ [行情] 当选行情进程 (pid={os.getpid()})，行情板: {self.board_path}")
+
+    def _publish_alert(self, user_id: int, alert: Dict):
+        self.board.publish_event(json_dumps({"user_id": user_id, "alert": alert}))
+
+    async def _leader_loop(self):
+        cursor = self.board.mailbox_head()
+        next_expire = 0.0
+        while True:
+            try:
+                self.board.heartbeat()
+                cursor, messages, overflow = self.board.drain_mailbox(cursor)
+                if overflow:
+                    # 信箱被覆盖，可能丢失交易变更：全量重载触发簿
+                    alert_monitor.request_resync()
+                now = time.monotonic()
+                wanted = []
+                for kind, sender, payload in messages:
+                    if kind == MAILBOX_WANT:
+                        code, _, count = payload.partition(":")
+                        if code:
+                            self._demand.setdefault(code, {})[sender] = (int(count) if count.isdigit() else 0, now)
+                            wanted.append(code)
+                    elif kind == MAILBOX_TRADE and payload.isdigit():
+                        self._spawn_resync(int(payload))
+                    elif kind == MAILBOX_USER and payload.isdigit():
+                        alert_monitor.invalidate_user(int(payload))
+                if wanted:
+                    self._fetch_cold(wanted)
+                if now >= next_expire:
+                    self._expire_demand(now)
+                    price_monitor.subscribe(DEMAND_SUBSCRIBER, list(self._demand))
+                    next_expire = now + 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"行情进程信箱处理失败: {e}")
+            await asyncio.sleep(self.control_interval)
+
+    def _fetch_cold(self, codes: list[str]):
+        """worker 上报的代码在行情板上没有新鲜报价时立即查价（结果经 board_publisher 写入行情板），
+        不等下一轮轮询，也不受休市影响；worker 在 _lookup 中等待这次写入"""
+        codes = list(dict.fromkeys(codes))
+        fresh = self.board.read(codes, self.board_max_age)
+        cold = [code for code in codes if code not in fresh]
+        if not cold:
+            return
+        task = asyncio.create_task(price_monitor.batch_fetch_prices(cold))
+        self._cold_fetches.add(task)
+        task.add_done_callback(self._cold_fetch_done)
+
+    def _cold_fetch_done(self, task: asyncio.Task):
+        self._cold_fetches.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"为其他 worker 查价失败: {task.exception()}")
+
+    def _expire_demand(self, now: float):
+        """丢弃超过 demand_ttl 未刷新的 worker 需求（worker 退出或不再查看）"""
+        for code in list(self._demand):
+            workers = self._demand[code]
+            for sender in [pid for pid, (_, seen_at) in workers.items() if now - seen_at > self.demand_ttl]:
+                del workers[sender]
+            if not workers:
+                del self._demand[code]
+
+    def _external_watchers(self, code: str) -> int:
+        workers = self._demand.get(code)
+        if not workers:
+            return 0
+        return sum(count for count, _ in workers.values())
+
+    def _spawn_resync(self, trade_id: int):
+        """后台同步一笔交易的触发簿（持有任务引用）
+        同一交易正在同步时只记一次重跑，避免漏掉同步读取之后提交的变更"""
+        if trade_id in self._resync_tasks:
+            self._resync_again.add(trade_id)
+            return
+        task = asyncio.create_task(alert_monitor.resync_trade(trade_id))
+        self._resync_tasks[trade_id] = task
+        task.add_done_callback(lambda t: self._resync_done(trade_id, t))
+
+    def _resync_done(self, trade_id: int, task: asyncio.Task):
+        if self._resync_tasks.get(trade_id) is task:
+            del self._resync_tasks[trade_id]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"同步交易 {trade_id} 的闹铃触发簿失败: {task.exception()}")
+        if trade_id in self._resync_again:
+            self._resync_again.discard(trade_id)
+            self._spawn_resync(trade_id)
+
+    # ---- 其他 worker ----
+
+    def _become_follower(self):
+        self.role = FOLLOWER
+        price_monitor.board_publisher = None
+        price_monitor.board_lookup = self._lookup
+        alert_monitor.forwarder = self._forward
+        push_hub.alert_forwarder = None
+        self._tasks.append(asyncio.create_task(self._follower_quotes_loop()))
+        self._tasks.append(asyncio.create_task(self._follower_control_loop()))
+        logger.info(f"📡 [行情] 从行情板读取行情 (pid={os.getpid()})，行情板: {self.board_path}")
+
+    async def _lookup(self, codes: list[str]) -> Dict[str, tuple[float, str, str]]:
+        """查价请求只读行情板，本进程不请求上游：
+        未命中的代码登记为需求，行情进程收到后立即查价并写入行情板，这里最多等待 lookup_wait 秒；
+        仍未命中的代码不返回，由调用方按缓存兜底"""
+        hits = self.board.read(codes, self.board_max_age)
+        misses = [code for code in codes if code not in hits]
+        if not misses:
+            return hits
+        self._post_demand(misses, time.monotonic())
+        deadline = time.monotonic() + self.lookup_wait
+        while misses and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            found = self.board.read(misses, self.board_max_age)
+            if found:
+                hits.update(found)
+                misses = [code for code in misses if code not in found]
+        return hits
+
+    def _post_demand(self, codes, now: float):
+        """把需要轮询的代码及本进程的查看者数写入信箱：超过 demand_refresh 未上报或查看者数变化时才写"""
+        scheduler = price_monitor.scheduler
+        wanted = []
+        for code in codes:
+            count = scheduler.watchers(code)
+            sent = self._demand_sent.get(code)
+            if sent is None or sent[1] != count or now - sent[0] >= self.demand_refresh:
+                wanted.append(f"{code}:{count}")
+                self._demand_sent[code] = (now, count)
+        if wanted:
+            self.board.post(MAILBOX_WANT, wanted)
+
+    def _forward(self, kind: str, value: str):
+        self.board.post(_FORWARD_KINDS[kind], [value])
+
+    async def _follower_quotes_loop(self):
+        """按交易时段从行情板读取已订阅代码的变化报价，写入本进程行情缓存并触发回调"""
+        while True:
+            try:
+                phase, _ = market_clock.state()
+                interval = market_clock.poll_interval(phase, price_monitor.update_interval)
+                if interval is None:
+                    await market_clock.sleep_until_open()
+                    continue
+                universe = price_monitor.registry.universe
+                if price_monitor.registry.version != self._seen_version:
+                    self._seen = {code: self._seen[code] for code in universe if code in self._seen}
+                    self._seen_version = price_monitor.registry.version
+                changed = self.board.read_changed(universe, self._seen)
+                if changed:
+                    price_monitor.ingest(changed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"读取行情板失败: {e}")
+                interval = price_monitor.update_interval
+            await asyncio.sleep(interval)
+
+    async def _follower_control_loop(self):
+        """转发闹铃事件、刷新订阅需求、尝试接替行情进程"""
+        event_cursor = self.board.event_head()
+        next_demand = 0.0
+        next_election = time.monotonic() + self.election_interval
+        while True:
+            try:
+                event_cursor, events = self.board.drain_events(event_cursor)
+                for payload in events:
+                    event = json.loads(payload)
+                    push_hub.send_alert(int(event["user_id"]), event["alert"])
+
+                now = time.monotonic()
+                if now >= next_demand:
+                    self._refresh_demand(now)
+                    next_demand = now + 1.0
+
+                if now >= next_election:
+                    next_election = now + self.election_interval
+                    if self._try_acquire():
+                        await self._promote()
+                        return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"行情板控制循环出错: {e}")
+            await asyncio.sleep(self.control_interval)
+
+    def _refresh_demand(self, now: float):
+        universe = price_monitor.registry.universe
+        self._post_demand(universe, now)
+        if len(self._demand_sent) > 2 * max(len(universe), 1000):
+            self._demand_sent = {
+                code: sent for code, sent in self._demand_sent.items() if now - sent[0] < self.demand_refresh
+            }
+
+    async def _promote(self):
+        """前任行情进程退出后接替"""
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        self._tasks = [task for task in self._tasks if task is current]
+        self._seen.clear()
+        self._demand_sent.clear()
+        await self._become_leader()
+
+    def get_status(self) -> Dict:
+        status = {"mode": self.mode, "role": self.role}
+        if self.board is not None:
+            status["board"] = self.board.get_stats()
+            age = self.board.heartbeat_age()
+            status["leader_heartbeat_age"] = round(age, 3) if age is not None else None
+        return status
+
+
+# 全局行情进程协调器
+market_data = MarketDataCoordinator()
@@ -0,0 +1,14 @@
+"""
+运行指标的公共计算
+"""
+
+from typing import Iterable, Optional
+
+
+def percentile(samples: Iterable[float], q: float) -> Optional[float]:
+    """样本的分位数（q: 0-100，取最近秩），无样本时返回 None"""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
@@ -0,0 +1,88 @@
+"""
+列表分页工具
+
+- 游标（keyset）分页：以 (排序时间, id) 作为不透明的续页令牌，
+  WHERE (t, id) < (上一页末条) 直接沿复合索引定位，不随页码加深而变慢
+- 总数缓存：COUNT(*) 结果按查询条件缓存 PAGINATION_COUNT_TTL 秒，写入时按前缀失效
+"""
+
+import base64
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Hashable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> Optional[str]:
+    """生成续页令牌（排序值为空时无法续页，返回 None）"""
+    if sort_value is None:
+        return None
+    raw = json.dumps([sort_value.isoformat(), int(row_id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """解析续页令牌，格式错误时返回 400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def keyset_before(sort_col, id_col, cursor: str):
+    """按 (sort_col DESC, id DESC) 排序时，取游标之后（更早）的行"""
+    sort_value, row_id = decode_cursor(cursor)
+    return or_(sort_col < sort_value, and_(sort_col == sort_value, id_col < row_id))
+
+
+def next_cursor(rows: list, page_size: int, sort_attr: str) -> Optional[str]:
+    """本页取满时返回下一页令牌"""
+    if not rows or len(rows) < page_size:
+        return None
+    last = rows[-1]
+    return encode_cursor(getattr(last, sort_attr), last.id)
+
+
+class CountCache:
+    """列表总数缓存（TTL + 按键前缀失效）"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("PAGINATION_COUNT_TTL", "30"))
+        self.max_entries = int(os.getenv("PAGINATION_COUNT_CACHE_SIZE", "10000"))
+        self._entries: Dict[tuple, tuple[float, int]] = {}
+
+    async def count(self, db: AsyncSession, key: tuple, count_stmt) -> int:
+        """返回缓存的总数，过期或缺失时执行 count_stmt"""
+        now = time.monotonic()
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        total = int((await db.execute(count_stmt)).scalar() or 0)
+        if len(self._entries) >= self.max_entries:
+            self._evict(now)
+        self._entries[key] = (now + self.ttl, total)
+        return total
+
+    def invalidate(self, *prefix: Hashable):
+        """删除以 prefix 开头的缓存键，如 invalidate("trades", user_id)"""
+        size = len(prefix)
+        for key in [k for k in self._entries if k[:size] == prefix]:
+            self._entries.pop(key, None)
+
+    def _evict(self, now: float):
+        expired = [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            self._entries.pop(key, None)
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+
+# 全局总数缓存
+count_cache = CountCache()
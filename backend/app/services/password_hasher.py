@@ -0,0 +1,118 @@
+"""
+密码哈希服务
+
+pbkdf2_sha256 的哈希/校验是纯CPU计算（数十到数百毫秒），放在事件循环里会阻塞所有请求。
+这里统一放到专用线程池执行（hashlib.pbkdf2_hmac 计算期间释放GIL）：
+- 并发数受 PASSWORD_HASH_WORKERS 限制，排队超过 PASSWORD_HASH_MAX_PENDING 时直接拒绝
+- 记录排队时间和计算时间
+- 校验通过且哈希参数已过时（如调高了轮数）时返回新哈希，登录时透明升级
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.services.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+
+def _build_context() -> CryptContext:
+    # 使用pbkdf2_sha256作为密码加密方案（更兼容，无bcrypt版本问题）
+    options = {}
+    rounds = os.getenv("PASSWORD_PBKDF2_ROUNDS")
+    if rounds:
+        options["pbkdf2_sha256__default_rounds"] = int(rounds)
+        # 低于当前轮数的旧哈希视为过时，登录成功后重新哈希
+        options["pbkdf2_sha256__min_rounds"] = int(rounds)
+    return CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", **options)
+
+
+class PasswordHasher:
+    """在线程池中执行密码哈希/校验"""
+
+    def __init__(self):
+        self.context = _build_context()
+        self.max_workers = max(1, int(os.getenv("PASSWORD_HASH_WORKERS", "2")))
+        self.max_pending = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "100"))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self.metrics: Dict[str, int] = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0}
+        self._queue_wait = deque(maxlen=200)  # 等待空闲 worker 的时间
+        self._compute_time = deque(maxlen=200)  # 单次哈希/校验耗时
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pwhash")
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+    async def _run(self, func, *args):
+        self._ensure_started()
+        if self._pending >= self.max_pending:
+            self.metrics["rejected"] += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="服务繁忙，请稍后重试")
+        self._pending += 1
+        enqueued_at = time.perf_counter()
+        try:
+            async with self._semaphore:
+                started_at = time.perf_counter()
+                self._queue_wait.append(started_at - enqueued_at)
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, func, *args)
+                self._compute_time.append(time.perf_counter() - started_at)
+                return result
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        password_hash = await self._run(self.context.hash, password)
+        self.metrics["hashed"] += 1
+        return password_hash
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """校验密码"""
+        ok, _ = await self.verify_and_update(password, password_hash)
+        return ok
+
+    async def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        """校验密码，通过且哈希参数过时时返回 (True, 新哈希)，否则新哈希为 None"""
+        ok, new_hash = await self._run(self.context.verify_and_update, password, password_hash)
+        self.metrics["verified"] += 1
+        if ok and new_hash:
+            self.metrics["rehashed"] += 1
+        return bool(ok), new_hash
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._semaphore = None
+
+    @staticmethod
+    def _percentile(samples: deque, q: float) -> Optional[float]:
+        value = percentile(samples, q)
+        return round(value * 1000, 2) if value is not None else None
+
+    def get_metrics(self) -> Dict:
+        """运行指标（耗时单位：毫秒）"""
+        return {
+            "pending": self._pending,
+            **self.metrics,
+            "queue_wait_ms_p50": self._percentile(self._queue_wait, 50),
+            "queue_wait_ms_p95": self._percentile(self._queue_wait, 95),
+            "compute_ms_p50": self._percentile(self._compute_time, 50),
+            "compute_ms_p95": self._percentile(self._compute_time, 95),
+        }
+
+
+# 全局密码哈希服务
+password_hasher = PasswordHasher()
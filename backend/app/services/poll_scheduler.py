@@ -0,0 +1,139 @@
+"""
+分级轮询调度
+
+原先每个订阅代码每轮（0.5 秒）都请求一次上游。这里按代码定级，不同级别按不同间隔轮询：
+- HOT：价格接近止损/止盈阈值、或正在被较多连接查看、或近期波动大，每轮轮询
+- WARM：有连接在看，或阈值在 POLL_WARM_DISTANCE 以内，每 POLL_WARM_INTERVAL 秒
+- COLD：只为远离阈值的闹铃保留的代码，每 POLL_COLD_INTERVAL 秒
+定级每 POLL_RETIER_INTERVAL 秒（或订阅变化时）重算一次；同一轮到期的各级代码合并后再分块，
+与原来一样按 BATCH_SIZE 批量请求上游。
+"""
+
+import math
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from app.services.symbol_registry import SymbolRegistry
+
+HOT = "hot"
+WARM = "warm"
+COLD = "cold"
+TIERS = (HOT, WARM, COLD)
+
+
+class PollScheduler:
+    """按代码定级并给出本轮到期的批次"""
+
+    def __init__(self, registry: SymbolRegistry, batch_size: int):
+        self.registry = registry
+        self.batch_size = max(1, int(batch_size))
+        self.intervals = {
+            HOT: 0.0,  # 每轮
+            WARM: float(os.getenv("POLL_WARM_INTERVAL", "2")),
+            COLD: float(os.getenv("POLL_COLD_INTERVAL", "10")),
+        }
+        self.retier_interval = float(os.getenv("POLL_RETIER_INTERVAL", "2"))
+        self.hot_distance = float(os.getenv("POLL_HOT_DISTANCE", "0.01"))  # 距阈值 1% 以内
+        self.warm_distance = float(os.getenv("POLL_WARM_DISTANCE", "0.05"))
+        self.hot_watchers = int(os.getenv("POLL_HOT_WATCHERS", "5"))
+        self.hot_volatility = float(os.getenv("POLL_HOT_VOLATILITY", "0.003"))  # 单次变动幅度的均值
+        self.volatility_half_life = float(os.getenv("POLL_VOLATILITY_HALF_LIFE", "60"))
+        self.passive_subscribers: set[str] = set()  # 不算作“查看者”的订阅者（如闹铃监控）
+        # 返回代码当前价格到最近闹铃阈值的相对距离，无阈值时返回 None
+        self.distance_provider: Optional[Callable[[str, float], Optional[float]]] = None
+        self.price_provider: Optional[Callable[[str], Optional[float]]] = None
+        # 其他进程上的查看者数（共享行情模式下由行情进程按各 worker 上报的需求汇总）
+        self.external_watchers: Optional[Callable[[str], int]] = None
+
+        self._volatility: Dict[str, tuple[float, float]] = {}  # code -> (EWMA 变动幅度, 更新时间)
+        self._tier_codes: Dict[str, tuple[str, ...]] = {tier: () for tier in TIERS}
+        self._next_due: Dict[str, float] = {tier: 0.0 for tier in TIERS}
+        # 到期级别组合 -> (合并后的代码, 批次)
+        self._merged: Dict[tuple[str, ...], tuple[list[str], tuple[list[str], ...]]] = {}
+        self._registry_version = -1
+        self._retier_at = 0.0
+        self.metrics: Dict[str, int] = {"polled_codes": 0, "ticks": 0}
+
+    def record_change(self, code: str, old_price: Optional[float], new_price: float):
+        """价格变化回调中调用：更新该代码的波动率（变动幅度的指数平均）"""
+        if not old_price or old_price <= 0:
+            return
+        move = abs(new_price - old_price) / old_price
+        now = time.monotonic()
+        current = self._decayed_volatility(code, now)
+        self._volatility[code] = (0.7 * current + 0.3 * move, now)
+
+    def _decayed_volatility(self, code: str, now: float) -> float:
+        value = self._volatility.get(code)
+        if value is None:
+            return 0.0
+        ewma, updated_at = value
+        if self.volatility_half_life <= 0:
+            return ewma
+        return ewma * math.pow(0.5, (now - updated_at) / self.volatility_half_life)
+
+    def watchers(self, code: str) -> int:
+        """正在查看该代码的订阅者数（本进程 + 其他进程上报）"""
+        local = sum(1 for sub in self.registry.subscribers_of(code) if sub not in self.passive_subscribers)
+        if self.external_watchers is None:
+            return local
+        return local + self.external_watchers(code)
+
+    def _tier(self, code: str, now: float) -> str:
+        price = self.price_provider(code) if self.price_provider is not None else None
+        if not price:
+            return HOT  # 还没有报价，先取一次
+        distance = self.distance_provider(code, price) if self.distance_provider is not None else None
+        watchers = self.watchers(code)
+        volatile = self._decayed_volatility(code, now) >= self.hot_volatility
+
+        if distance is not None and distance <= self.hot_distance:
+            return HOT
+        if watchers >= self.hot_watchers or (watchers and volatile):
+            return HOT
+        if watchers or (distance is not None and distance <= self.warm_distance):
+            return WARM if not volatile else HOT
+        return COLD if not volatile else WARM
+
+    def _retier(self, now: float):
+        tiers: Dict[str, list[str]] = {tier: [] for tier in TIERS}
+        for code in self.registry.universe:
+            tiers[self._tier(code, now)].append(code)
+        self._tier_codes = {tier: tuple(codes) for tier, codes in tiers.items()}
+        self._merged.clear()
+        for code in [code for code in self._volatility if code not in self.registry]:
+            del self._volatility[code]
+        self._registry_version = self.registry.version
+        self._retier_at = now + self.retier_interval
+
+    def due(self, now: Optional[float] = None) -> tuple[list[str], tuple[list[str], ...]]:
+        """本轮到期的 (代码, 批次)：各级合并后按 batch_size 分块，组合不变时复用同一对象"""
+        now = time.monotonic() if now is None else now
+        self.registry.universe  # 触发登记表按需重建
+        if self.registry.version != self._registry_version or now >= self._retier_at:
+            self._retier(now)
+
+        due = []
+        for tier in TIERS:
+            if not self._tier_codes[tier]:
+                continue
+            if now >= self._next_due[tier]:
+                due.append(tier)
+                self._next_due[tier] = now + self.intervals[tier]
+        key = tuple(due)
+        merged = self._merged.get(key)
+        if merged is None:
+            codes = [code for tier in due for code in self._tier_codes[tier]]
+            size = self.batch_size
+            merged = (codes, tuple(codes[i:i + size] for i in range(0, len(codes), size)))
+            self._merged[key] = merged
+        self.metrics["ticks"] += 1
+        self.metrics["polled_codes"] += len(merged[0])
+        return merged
+
+    def get_stats(self) -> Dict:
+        return {
+            **{f"{tier}_codes": len(self._tier_codes[tier]) for tier in TIERS},
+            **self.metrics,
+        }
@@ -1,73 +1,157 @@
-from typing import Dict, Set, Optional
+from typing import Dict, Optional
+from collections import deque
+from functools import partial
 import asyncio
-from datetime import datetime
 import aiohttp
 import logging
 import json
+import os
 import time
 
+from app.services.metrics import percentile
+from app.services.quote_store import QuoteStore, FAILED_SOURCE
+from app.services.quote_parser import build_code_map, parse_sina, parse_tencent
+from app.services.symbol_registry import SymbolRegistry
+from app.services.market_clock import market_clock
+from app.services.poll_scheduler import PollScheduler
+
 logger = logging.getLogger(__name__)
 
 # API性能统计
 class APIPerformance:
-    def __init__(self):
-        self.stats: Dict[str, Dict] = {}  # {api_name: {count, total_time, avg_time, success_count, fail_count}}
+    def __init__(self, window_size: int = 200):
+        # 滚动窗口：只保留最近 window_size 次成功调用的耗时，用于计算分位数
+        self.window_size = window_size
+        self.stats: Dict[str, Dict] = {}  # {api_name: {count, success_count, fail_count, min_time, max_time, window}}
     
     def record(self, api_name: str, response_time: float, success: bool):
         """记录API调用性能"""
         if api_name not in self.stats:
             self.stats[api_name] = {
                 'count': 0,
-                'total_time': 0.0,
-                'avg_time': 0.0,
                 'success_count': 0,
                 'fail_count': 0,
                 'min_time': float('inf'),
-                'max_time': 0.0
+                'max_time': 0.0,
+                'window': deque(maxlen=self.window_size),
             }
         
         stats = self.stats[api_name]
         stats['count'] += 1
-        stats['total_time'] += response_time
-        stats['avg_time'] = stats['total_time'] / stats['count']
         stats['min_time'] = min(stats['min_time'], response_time)
         stats['max_time'] = max(stats['max_time'], response_time)
         
         if success:
             stats['success_count'] += 1
+            stats['window'].append(response_time)
         else:
             stats['fail_count'] += 1
+
+    def percentile(self, api_name: str, q: float) -> Optional[float]:
+        """获取最近窗口内的延迟分位数（q: 0-100），无数据时返回None"""
+        stats = self.stats.get(api_name)
+        if not stats:
+            return None
+        return percentile(stats['window'], q)
     
-    def get_best_api(self) -> Optional[str]:
-        """获取平均响应时间最短的API"""
+    def get_best_api(self, candidates: Optional[list[str]] = None) -> Optional[str]:
+        """获取最近窗口内 p50 延迟最短的API"""
         if not self.stats:
             return None
         
         best_api = None
-        best_avg_time = float('inf')
+        best_p50 = float('inf')
         
-        for api_name, stats in self.stats.items():
-            if stats['success_count'] > 0 and stats['avg_time'] < best_avg_time:
-                best_avg_time = stats['avg_time']
+        for api_name in (candidates if candidates is not None else list(self.stats.keys())):
+            p50 = self.percentile(api_name, 50)
+            if p50 is not None and p50 < best_p50:
+                best_p50 = p50
                 best_api = api_name
         
         return best_api
     
     def get_stats_summary(self) -> Dict[str, Dict]:
-        """获取性能统计摘要"""
-        return self.stats.copy()
+        """获取性能统计摘要（含滚动窗口 p50/p95/p99）"""
+        summary = {}
+        for api_name, stats in self.stats.items():
+            window = stats['window']
+            summary[api_name] = {
+                'count': stats['count'],
+                'success_count': stats['success_count'],
+                'fail_count': stats['fail_count'],
+                'min_time': stats['min_time'],
+                'max_time': stats['max_time'],
+                'avg_time': (sum(window) / len(window)) if window else 0.0,
+                'p50': self.percentile(api_name, 50),
+                'p95': self.percentile(api_name, 95),
+                'p99': self.percentile(api_name, 99),
+                'window_size': len(window),
+            }
+        return summary
 
 api_performance = APIPerformance()
 
+SINA_BATCH_API = "新浪财经(批量)"
+TENCENT_BATCH_API = "腾讯财经(批量)"
+
 class PriceMonitor:
     def __init__(self):
-        self.subscriptions: Dict[str, Set[str]] = {}  # socket_id -> stock_codes
-        self.price_cache: Dict[str, tuple[float, datetime, str]] = {}  # (价格, 时间戳, 来源)
+        self.quote_store = QuoteStore()  # 紧凑行情存储（代码→槽位 + 并行数组）
         self.running = False
         self.task: asyncio.Task | None = None
-        self.CACHE_TTL = 0.5  # 0.5秒缓存（毫秒级实时性）
+        self.CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "0.5"))  # 0.5秒缓存（毫秒级实时性）
         self.update_interval = 0.5  # 0.5秒更新一次价格（500ms）
         self.price_change_callbacks = []  # 价格变化回调列表
+        # 多 worker 共享行情（见 market_data）：行情进程把上游结果写入行情板，其他 worker 先查行情板
+        self.board_publisher = None  # Callable[[Dict[str, tuple]], None]
+        self.board_lookup = None  # async Callable[[list[str]], Dict[str, tuple]]
+        self._inflight: Dict[str, asyncio.Future] = {}  # 在途上游请求（single-flight）
+        # 长连接池（start() 中创建，stop() 中关闭），避免每次请求都重新握手
+        self.session: aiohttp.ClientSession | None = None
+        self.http_pool_limit = int(os.getenv("PRICE_HTTP_POOL_LIMIT", "32"))
+        self.http_pool_limit_per_host = int(os.getenv("PRICE_HTTP_POOL_LIMIT_PER_HOST", "8"))
+        self.http_dns_cache_ttl = int(os.getenv("PRICE_HTTP_DNS_TTL", "300"))
+        self.http_keepalive_timeout = float(os.getenv("PRICE_HTTP_KEEPALIVE", "30"))
+        # 批量请求：每批最多30个代码，分块并发请求（受并发上限控制）
+        self.BATCH_SIZE = 30
+        # 订阅登记表（socket_id <-> stock_codes 双向引用计数，预分块）
+        self.registry = SymbolRegistry(self.BATCH_SIZE)
+        # 分级轮询：按查看者数量、距闹铃阈值的距离和波动率决定每个代码的轮询间隔
+        self.scheduler = PollScheduler(self.registry, self.BATCH_SIZE)
+        self.scheduler.price_provider = self._cached_price
+        self.fetch_concurrency = int(os.getenv("PRICE_FETCH_CONCURRENCY", "8"))
+        # 对冲请求：先请求近期延迟最低的源，超过其 p95 仍未返回则并发请求备用源，取先返回者
+        self.hedge_enabled = (os.getenv("PRICE_HEDGE_ENABLED", "true") or "").strip().lower() in {"1", "true", "yes", "on"}
+        self.hedge_percentile = float(os.getenv("PRICE_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_delay = 0.05
+        self.hedge_max_delay = 1.0
+        self.hedge_default_delay = 0.3
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """创建带连接池、keep-alive 和 DNS 缓存的 HTTP 会话"""
+        connector = aiohttp.TCPConnector(
+            ssl=False,
+            limit=self.http_pool_limit,
+            limit_per_host=self.http_pool_limit_per_host,
+            ttl_dns_cache=self.http_dns_cache_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.http_keepalive_timeout,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=3),
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享会话（服务未启动时也可按需创建，例如请求处理中直接查价）"""
+        if self.session is None or self.session.closed:
+            self.session = self._create_session()
+        return self.session
+
+    async def _close_session(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
 
     def add_price_change_callback(self, callback):
         """添加价格变化回调函数"""
@@ -103,8 +187,11 @@ class PriceMonitor:
         else:
             return code
     
-    async def fetch_stock_info_sina_batch(self, stock_codes: list[str]) -> Dict[str, tuple[float, str, str]]:
+    async def fetch_stock_info_sina_batch(
+        self, stock_codes: list[str], with_names: bool = True
+    ) -> Dict[str, tuple[float, str, str]]:
         """批量获取新浪财经API股票价格
+        with_names=False 时跳过名称的GBK解码（轮询取价只需要价格）
         返回: {stock_code: (price, name, source)}"""
         if not stock_codes:
             return {}
@@ -117,49 +204,32 @@ class PriceMonitor:
             codes_str = ",".join(normalized_codes)
             url = f"http://hq.sinajs.cn/list={codes_str}"
             
-            # 映射 normalized_code -> original_code
-            code_map = {norm: orig for norm, orig in zip(normalized_codes, stock_codes)}
+            # 映射 normalized_code(bytes) -> original_code
+            code_map = build_code_map(normalized_codes, stock_codes)
             
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=3)) as resp:
-                    if resp.status == 200:
-                        text = await resp.text()
-                        # 解析结果
-                        # 格式: var hq_str_sh600879="...";\nvar hq_str_sz000001="...";
-                        results = {}
-                        lines = text.split('\n')
-                        for line in lines:
-                            if 'hq_str_' in line and '=' in line:
-                                try:
-                                    # 提取代码: var hq_str_sh600879=... -> sh600879
-                                    norm_code = line.split('hq_str_')[1].split('=')[0]
-                                    if norm_code in code_map:
-                                        orig_code = code_map[norm_code]
-                                        data_str = line.split('=')[1].strip().strip('";')
-                                        if data_str and ',' in data_str:
-                                            parts = data_str.split(',')
-                                            if len(parts) >= 4:
-                                                stock_name = parts[0].strip()
-                                                price = float(parts[3])
-                                                if price > 0:
-                                                    results[orig_code] = (round(price, 2), stock_name, "新浪财经")
-                                except Exception as e:
-                                    continue
-                        
-                        response_time = time.time() - start_time
-                        api_performance.record("新浪财经(批量)", response_time, True)
-                        return results
+            session = self._get_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=3)) as resp:
+                if resp.status == 200:
+                    # 直接解析原始字节，不整体解码
+                    body = await resp.read()
+                    results = parse_sina(body, code_map, with_names=with_names)
+                    
+                    response_time = time.time() - start_time
+                    api_performance.record(SINA_BATCH_API, response_time, True)
+                    return results
             
-            api_performance.record("新浪财经(批量)", time.time() - start_time, False)
+            api_performance.record(SINA_BATCH_API, time.time() - start_time, False)
             return {}
         except Exception as e:
             logger.error(f"批量获取新浪API失败: {e}")
-            api_performance.record("新浪财经(批量)", time.time() - start_time, False)
+            api_performance.record(SINA_BATCH_API, time.time() - start_time, False)
             return {}
 
-    async def fetch_stock_info_tencent_batch(self, stock_codes: list[str]) -> Dict[str, tuple[float, str, str]]:
+    async def fetch_stock_info_tencent_batch(
+        self, stock_codes: list[str], with_names: bool = True
+    ) -> Dict[str, tuple[float, str, str]]:
         """批量获取腾讯财经API股票价格
+        with_names=False 时跳过名称的GBK解码（轮询取价只需要价格）
         返回: {stock_code: (price, name, source)}"""
         if not stock_codes:
             return {}
@@ -172,67 +242,30 @@ class PriceMonitor:
             codes_str = ",".join(normalized_codes)
             url = f"http://qt.gtimg.cn/q={codes_str}"
             
-            # 映射 normalized_code -> original_code
-            code_map = {norm: orig for norm, orig in zip(normalized_codes, stock_codes)}
+            # 映射 normalized_code(bytes) -> original_code
+            code_map = build_code_map(normalized_codes, stock_codes)
             
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=3)) as resp:
-                    if resp.status == 200:
-                        text = await resp.text()
-                        results = {}
-                        # 腾讯可能一行返回一个，也可能多行
-                        lines = text.split(';')
-                        for line in lines:
-                            if 'v_' in line and '=' in line:
-                                try:
-                                    # v_sh600879="...";
-                                    norm_code = line.split('v_')[1].split('=')[0]
-                                    if norm_code in code_map:
-                                        orig_code = code_map[norm_code]
-                                        data_str = line.split('=')[1].strip().strip('"')
-                                        if data_str and '~' in data_str:
-                                            parts = data_str.split('~')
-                                            if len(parts) >= 4:
-                                                stock_name = parts[1].strip()
-                                                price = float(parts[3])
-                                                results[orig_code] = (round(price, 2), stock_name, "腾讯财经")
-                                except Exception as e:
-                                    continue
-                        
-                        response_time = time.time() - start_time
-                        api_performance.record("腾讯财经(批量)", response_time, True)
-                        return results
+            session = self._get_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=3)) as resp:
+                if resp.status == 200:
+                    # 直接解析原始字节，不整体解码
+                    body = await resp.read()
+                    results = parse_tencent(body, code_map, with_names=with_names)
+                    
+                    response_time = time.time() - start_time
+                    api_performance.record(TENCENT_BATCH_API, response_time, True)
+                    return results
             
-            api_performance.record("腾讯财经(批量)", time.time() - start_time, False)
+            api_performance.record(TENCENT_BATCH_API, time.time() - start_time, False)
             return {}
         except Exception as e:
             logger.error(f"批量获取腾讯API失败: {e}")
-            api_performance.record("腾讯财经(批量)", time.time() - start_time, False)
+            api_performance.record(TENCENT_BATCH_API, time.time() - start_time, False)
             return {}
 
     def is_trading_time(self) -> bool:
-        """检查是否在交易时间 (9:10-11:35, 12:55-15:05)"""
-        now = datetime.now()
-        # 周末不交易
-        if now.weekday() >= 5:
-            return False
-            
-        current_time = now.time()
-        
-        # 上午盘 (含集合竞价)
-        morning_start = time.strptime("09:10:00", "%H:%M:%S")
-        morning_end = time.strptime("11:35:00", "%H:%M:%S")
-        
-        # 下午盘
-        afternoon_start = time.strptime("12:55:00", "%H:%M:%S")
-        afternoon_end = time.strptime("15:05:00", "%H:%M:%S")
-        
-        # 将当前时间转换为 struct_time 进行比较
-        curr = time.strptime(current_time.strftime("%H:%M:%S"), "%H:%M:%S")
-        
-        return (curr >= morning_start and curr <= morning_end) or \
-               (curr >= afternoon_start and curr <= afternoon_end)
+        """检查是否在交易时间（北京时间 9:10-11:35, 12:55-15:05，排除周末和节假日）"""
+        return market_clock.is_active()
 
     async def fetch_stock_name(self, stock_code: str) -> Optional[str]:
         """获取股票名称
@@ -253,6 +286,21 @@ class PriceMonitor:
             logger.error(f"获取股票 {stock_code} 名称失败: {e}")
             return None
 
+    async def fetch_stock_names(self, stock_codes: list[str]) -> Dict[str, str]:
+        """批量获取股票名称（新浪优先，缺失的再用腾讯补齐）
+        返回: {stock_code: name}，获取失败的代码不在结果中"""
+        names: Dict[str, str] = {}
+        remaining = list(dict.fromkeys(stock_codes))
+        for fetcher in (self.fetch_stock_info_sina_batch, self.fetch_stock_info_tencent_batch):
+            if not remaining:
+                break
+            results = await self._fetch_chunks_concurrently(fetcher, self._chunk_codes(remaining))
+            for code, (_, name, _) in results.items():
+                if name:
+                    names[code] = name
+            remaining = [code for code in remaining if code not in names]
+        return names
+
     async def fetch_stock_price(self, stock_code: str, force_refresh: bool = False) -> tuple[float, str]:
         """获取股票价格（带缓存和重试机制）
         返回: (价格, 来源)
@@ -263,126 +311,290 @@ class PriceMonitor:
             return (results[stock_code]["price"], results[stock_code]["source"])
         return (0.0, "获取失败")
 
+    async def _fetch_chunks_concurrently(self, fetcher, chunks: list[list[str]]) -> Dict[str, tuple[float, str, str]]:
+        """在并发上限内同时请求所有分块，合并结果"""
+        semaphore = asyncio.Semaphore(max(1, self.fetch_concurrency))
+
+        async def _run(chunk: list[str]):
+            async with semaphore:
+                return await fetcher(chunk)
+
+        merged: Dict[str, tuple[float, str, str]] = {}
+        chunk_results = await asyncio.gather(*(_run(chunk) for chunk in chunks), return_exceptions=True)
+        for chunk_result in chunk_results:
+            if isinstance(chunk_result, dict):
+                merged.update(chunk_result)
+            elif isinstance(chunk_result, Exception):
+                logger.error(f"分块获取价格失败: {chunk_result}")
+        return merged
+
+    def _ordered_sources(self) -> list[tuple[str, any]]:
+        """按近期 p50 延迟排序的行情源，默认新浪优先（轮询取价不解码名称）"""
+        sources = [
+            (SINA_BATCH_API, partial(self.fetch_stock_info_sina_batch, with_names=False)),
+            (TENCENT_BATCH_API, partial(self.fetch_stock_info_tencent_batch, with_names=False)),
+        ]
+        best = api_performance.get_best_api([name for name, _ in sources])
+        if best == TENCENT_BATCH_API:
+            sources.reverse()
+        return sources
+
+    def _hedge_delay(self, api_name: str) -> float:
+        """对冲延迟：主源近期延迟分位数，限制在合理区间内"""
+        delay = api_performance.percentile(api_name, self.hedge_percentile)
+        if delay is None:
+            return self.hedge_default_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, delay))
+
+    async def _fetch_chunk_hedged(
+        self, chunk: list[str], hedged: Optional[set] = None
+    ) -> Dict[str, tuple[float, str, str]]:
+        """对单个分块发起对冲请求：主源超过延迟阈值未返回时并发请求备用源，取先成功者
+        hedged: 记录备用源已应答过的代码，避免回退阶段重复请求"""
+        (primary_name, primary), (_, secondary) = self._ordered_sources()
+        primary_task = asyncio.create_task(primary(chunk))
+        pending = {primary_task}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self._hedge_delay(primary_name))
+            if primary_task in done:
+                result = primary_task.result()
+                if result:
+                    return result
+                pending = set()
+            secondary_task = asyncio.create_task(secondary(chunk))
+            pending.add(secondary_task)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is secondary_task and hedged is not None:
+                        hedged.update(chunk)
+                    result = task.result()
+                    if result:
+                        return result
+            return {}
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fetch_upstream(
+        self, stock_codes: list[str], chunks: Optional[list[list[str]]] = None
+    ) -> Dict[str, tuple[float, str, str]]:
+        """从上游行情源批量获取价格
+        1. 所有分块并发请求主源（对冲模式下按分块对冲）
+        2. 汇总仍失败的代码，合并成一次备用源批量回退（对冲时已请求过备用源的代码不再重复）
+        chunks: 已分好的批次（如订阅登记表的预分块），为空时按 BATCH_SIZE 分块
+        返回: {stock_code: (price, name, source)}"""
+        if chunks is None:
+            chunks = self._chunk_codes(stock_codes)
+        (_, primary), (_, secondary) = self._ordered_sources()
+        hedged: set = set()
+        first_pass = partial(self._fetch_chunk_hedged, hedged=hedged) if self.hedge_enabled else primary
+        results = await self._fetch_chunks_concurrently(first_pass, chunks)
+
+        failed_codes = [code for code in stock_codes if code not in results and code not in hedged]
+        if failed_codes:
+            fallback_results = await self._fetch_chunks_concurrently(secondary, self._chunk_codes(failed_codes))
+            results.update(fallback_results)
+        return results
+
+    def _chunk_codes(self, stock_codes: list[str]) -> list[list[str]]:
+        """分批处理，每批最多 BATCH_SIZE 个，避免URL过长"""
+        size = self.BATCH_SIZE
+        return [stock_codes[i:i + size] for i in range(0, len(stock_codes), size)]
+
+    def _cached_fallback(self, code: str) -> Dict[str, any]:
+        """获取失败时使用缓存价格（标记为缓存）"""
+        cached = self.quote_store.get(code)
+        if cached is None:
+            return {"price": 0.0, "source": FAILED_SOURCE}
+        price, source, _ = cached
+        # 如果不是获取失败，标记为缓存
+        if source != FAILED_SOURCE:
+            source += "(缓存)"
+        return {"price": price, "source": source}
+
+    def _get_fresh_cached(self, code: str) -> Optional[Dict[str, any]]:
+        """读取未过期（CACHE_TTL 内）的缓存价格"""
+        cached = self.quote_store.get(code)
+        if cached is None:
+            return None
+        price, source, age = cached
+        if age > self.CACHE_TTL:
+            return None
+        return {"price": price, "source": source}
+
+    def _apply_upstream_results(
+        self,
+        stock_codes: list[str],
+        batch_results: Dict[str, tuple[float, str, str]],
+    ) -> Dict[str, Dict[str, any]]:
+        """整理上游结果：向量化更新行情存储、触发价格变化回调，失败的代码回退到缓存"""
+        fetched = {code: batch_results[code] for code in stock_codes if code in batch_results}
+        changed_codes = self.quote_store.update_from_batch(fetched)
+        if self.board_publisher is not None and fetched:
+            try:
+                self.board_publisher(fetched)
+            except Exception as e:
+                logger.error(f"写入行情板失败: {e}")
+
+        # 更新波动率并触发回调
+        for code in changed_codes:
+            price, _, source = fetched[code]
+            self.scheduler.record_change(code, self.quote_store.previous_price(code), price)
+            for callback in self.price_change_callbacks:
+                try:
+                    callback(code, price, source)
+                except Exception:
+                    pass
+
+        all_results = {}
+        for code in stock_codes:
+            if code in fetched:
+                price, _, source = fetched[code]
+                all_results[code] = {"price": price, "source": source}
+            else:
+                all_results[code] = self._cached_fallback(code)
+        return all_results
+
+    async def _fetch_single_flight(
+        self, stock_codes: list[str], chunks: Optional[list[list[str]]] = None
+    ) -> Dict[str, Dict[str, any]]:
+        """合并并发请求：同一代码同一时刻只有一个上游请求在途，其余请求等待其结果
+        chunks: stock_codes 的预分块，仅在全部代码都由本次请求发起时沿用"""
+        loop = asyncio.get_running_loop()
+        waiting: Dict[str, asyncio.Future] = {}
+        owned: list[str] = []
+        for code in stock_codes:
+            future = self._inflight.get(code)
+            if future is not None:
+                waiting[code] = future
+            else:
+                self._inflight[code] = loop.create_future()
+                owned.append(code)
+
+        results: Dict[str, Dict[str, any]] = {}
+        if owned:
+            try:
+                batch_results = await self._fetch_upstream(owned, chunks if not waiting else None)
+                results.update(self._apply_upstream_results(owned, batch_results))
+            finally:
+                for code in owned:
+                    future = self._inflight.pop(code, None)
+                    if future is not None and not future.done():
+                        future.set_result(results.get(code) or self._cached_fallback(code))
+
+        for code, future in waiting.items():
+            try:
+                results[code] = await asyncio.shield(future)
+            except Exception:
+                results[code] = self._cached_fallback(code)
+        return results
+
     async def batch_fetch_prices(self, stock_codes: list[str], force_refresh: bool = False) -> Dict[str, Dict[str, any]]:
         """批量获取股票价格 (真正实现批量请求)
+        force_refresh=False 时优先返回 CACHE_TTL 内的缓存，未命中的代码合并后再请求上游
         返回: {stock_code: {"price": float, "source": str}}"""
         if not stock_codes:
             return {}
-            
-        # 分批处理，每批最多30个，避免URL过长
-        BATCH_SIZE = 30
-        all_results = {}
-        
-        # 将股票代码分块
-        chunks = [stock_codes[i:i + BATCH_SIZE] for i in range(0, len(stock_codes), BATCH_SIZE)]
-        
-        for chunk in chunks:
-            # 1. 尝试新浪批量
-            batch_results = await self.fetch_stock_info_sina_batch(chunk)
-            
-            # 2. 检查哪些失败了，尝试腾讯批量
-            failed_codes = [code for code in chunk if code not in batch_results]
-            if failed_codes:
-                tencent_results = await self.fetch_stock_info_tencent_batch(failed_codes)
-                batch_results.update(tencent_results)
-            
-            # 3. 整理结果，更新缓存
-            for code in chunk:
-                if code in batch_results:
-                    price, _, source = batch_results[code]
-                    
-                    # 检查价格变化并触发回调
-                    old_price = None
-                    if code in self.price_cache:
-                        old_price_data = self.price_cache[code]
-                        if isinstance(old_price_data, tuple) and len(old_price_data) >= 3:
-                            old_price = old_price_data[0]
-                    
-                    # 更新缓存
-                    self.price_cache[code] = (price, datetime.utcnow(), source)
-                    
-                    # 触发回调
-                    if hasattr(self, 'price_change_callbacks') and old_price is not None and abs(old_price - price) > 0.001:
-                        for callback in self.price_change_callbacks:
-                            try:
-                                callback(code, price, source)
-                            except Exception:
-                                pass
-                                
-                    all_results[code] = {"price": price, "source": source}
+
+        # 去重并保持顺序
+        stock_codes = list(dict.fromkeys(stock_codes))
+        all_results: Dict[str, Dict[str, any]] = {}
+
+        misses = stock_codes
+        if not force_refresh:
+            misses = []
+            for code in stock_codes:
+                cached = self._get_fresh_cached(code)
+                if cached is not None:
+                    all_results[code] = cached
                 else:
-                    # 获取失败，使用缓存
-                    cached_data = self.price_cache.get(code, (0.0, datetime.utcnow(), "获取失败"))
-                    price = cached_data[0] if isinstance(cached_data, tuple) else 0.0
-                    source = cached_data[2] if isinstance(cached_data, tuple) and len(cached_data) >= 3 else "获取失败"
-                    # 如果不是获取失败，标记为缓存
-                    if source != "获取失败":
-                        source += "(缓存)"
-                    all_results[code] = {"price": price, "source": source}
-                    
-        return all_results
+                    misses.append(code)
+
+        if misses and self.board_lookup is not None:
+            # 共享行情模式：只由行情进程请求上游，本进程读行情板，仍未命中的代码按缓存兜底
+            board_hits = await self.board_lookup(misses)
+            if board_hits:
+                all_results.update(self._apply_upstream_results(list(board_hits), board_hits))
+            for code in misses:
+                if code not in board_hits:
+                    all_results[code] = self._cached_fallback(code)
+        elif misses:
+            all_results.update(await self._fetch_single_flight(misses))
+
+        return {code: all_results[code] for code in stock_codes if code in all_results}
     
+    def _cached_price(self, stock_code: str) -> Optional[float]:
+        cached = self.quote_store.get(stock_code)
+        if cached is None or cached[0] <= 0:
+            return None
+        return cached[0]
+
     def get_current_price(self, stock_code: str) -> tuple[Optional[float], Optional[str]]:
         """获取当前缓存的价格和来源（同步方法）
         返回: (价格, 来源)"""
-        if stock_code in self.price_cache:
-            price_data = self.price_cache[stock_code]
-            if isinstance(price_data, tuple) and len(price_data) >= 3:
-                return (price_data[0], price_data[2])
-            elif isinstance(price_data, tuple) and len(price_data) >= 2:
-                return (price_data[0], "缓存")
-        return (None, None)
+        cached = self.quote_store.get(stock_code)
+        if cached is None:
+            return (None, None)
+        return (cached[0], cached[1])
     
+    def ingest(self, quotes: Dict[str, tuple[float, str, str]]) -> Dict[str, Dict[str, any]]:
+        """写入来自其他来源（共享行情板）的报价：更新行情缓存并触发价格变化回调"""
+        return self._apply_upstream_results(list(quotes), quotes)
+
     def subscribe(self, socket_id: str, stock_codes: list[str]):
-        """订阅股票价格更新"""
-        self.subscriptions[socket_id] = set(stock_codes)
-        logger.info(f"订阅价格更新: {socket_id} -> {stock_codes}")
+        """订阅股票价格更新（替换该连接的订阅，登记表只按增量调整引用计数）"""
+        self.registry.subscribe(socket_id, stock_codes)
+        logger.debug(f"订阅价格更新: {socket_id} -> {stock_codes}")
     
     def unsubscribe(self, socket_id: str):
         """取消订阅"""
-        if socket_id in self.subscriptions:
-            del self.subscriptions[socket_id]
-            logger.info(f"取消订阅: {socket_id}")
+        if self.registry.unsubscribe(socket_id):
+            logger.debug(f"取消订阅: {socket_id}")
     
     async def update_prices_loop(self):
         """价格更新循环（毫秒级实时更新）"""
         logger.info(f"启动价格监控循环，间隔: {self.update_interval}s")
         while self.running:
             try:
-                # 检查交易时间
-                if not self.is_trading_time():
-                    # 非交易时间，大幅降低频率（例如10秒一次，或者完全停止）
-                    # 为了用户体验（可能在非交易时间查看），保持低频更新
-                    await asyncio.sleep(5)
+                # 按交易时段决定轮询间隔；午间休市和休市时段直接睡到下一次开盘
+                # （非交易时段的查价请求仍会按需请求上游）
+                phase, _ = market_clock.state()
+                interval = market_clock.poll_interval(phase, self.update_interval)
+                if interval is None:
+                    await market_clock.sleep_until_open()
                     continue
 
-                # 收集所有需要监控的股票代码
-                all_stock_codes = set()
-                for stock_codes in self.subscriptions.values():
-                    all_stock_codes.update(stock_codes)
-                
-                if all_stock_codes:
-                    # 批量获取价格（强制刷新，忽略缓存，实现毫秒级实时性）
-                    prices = await self.batch_fetch_prices(list(all_stock_codes), force_refresh=True)
-                    # 仅在有价格变化或特定条件下打日志，避免日志爆炸
-                    # logger.debug(f"更新价格: {len(prices)} 只股票")
+                # 分级调度：只取本轮到期的代码（各级合并、预分块，定级不变时为同一对象）
+                codes, batches = self.scheduler.due()
+                if batches:
+                    # 批量获取价格（强制刷新，忽略缓存）
+                    await self._fetch_single_flight(codes, batches)
                 
-                # 使用设定的间隔
-                await asyncio.sleep(self.update_interval)
+                # 使用当前时段的间隔
+                await asyncio.sleep(interval)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"价格更新循环错误: {e}")
                 await asyncio.sleep(self.update_interval)
     
-    async def start(self):
-        """启动价格监控服务"""
+    async def start(self, poll: bool = True):
+        """启动价格监控服务
+        poll=False 时只准备 HTTP 会话、不启动轮询循环（共享行情模式下的非行情进程）"""
         if self.running:
             return
         
         self.running = True
-        self.task = asyncio.create_task(self.update_prices_loop())
+        self._get_session()
+        if poll:
+            self.start_polling()
         logger.info("价格监控服务已启动")
+
+    def start_polling(self):
+        """启动价格轮询循环（共享行情模式下当选行情进程时调用）"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.update_prices_loop())
     
     async def stop(self):
         """停止价格监控服务"""
@@ -393,6 +605,8 @@ class PriceMonitor:
                 await self.task
             except asyncio.CancelledError:
                 pass
+            self.task = None
+        await self._close_session()
         logger.info("价格监控服务已停止")
 
 # 全局实例
@@ -0,0 +1,315 @@
+"""
+实时推送中心（WebSocket）
+
+前端原先轮询 /api/price/batch 和 /api/positions 获取行情和持仓浮动盈亏，这里改为推送：
+- 每个连接订阅一组股票代码，并自动订阅该用户未平仓持仓涉及的代码
+- 订阅 price_monitor 的价格变化回调，同一轮行情（PUSH_FLUSH_DELAY 内）的变化合并为一条消息，
+  只包含变化的报价和受影响持仓重新计算的市值/浮动盈亏
+- 每个连接一个发送任务，待发送报价按代码合并（只保留最新值），慢连接只会收到更少、更大的消息；
+  单次发送超过 PUSH_SEND_TIMEOUT 视为连接失效并断开
+- 闹铃通知通过同一连接推送
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+from collections import deque
+from typing import Any, Dict, Optional, Set
+
+from fastapi import WebSocket
+from sqlalchemy import select
+
+from app.database import Trade, get_db, open_position_filter
+from app.services.price_monitor import price_monitor
+from app.services.serialization import json_dumps
+
+logger = logging.getLogger(__name__)
+
+# 浮动盈亏计算所需的持仓字段
+_POSITION_COLUMNS = (Trade.id, Trade.stock_code, Trade.shares, Trade.buy_price, Trade.buy_commission)
+
+
+class PushConnection:
+    """单个 WebSocket 连接的订阅和待发送状态"""
+
+    def __init__(self, connection_id: str, user_id: int, websocket: WebSocket, max_alerts: int):
+        self.id = connection_id
+        self.user_id = user_id
+        self.websocket = websocket
+        self.codes: Set[str] = set()  # 客户端显式订阅的代码
+        self.pending_quotes: Dict[str, Dict[str, Any]] = {}  # code -> 最新报价（合并）
+        self.pending_positions: Dict[int, Dict[str, Any]] = {}  # trade_id -> 最新持仓估值（合并）
+        self.pending_alerts: deque = deque(maxlen=max_alerts)
+        self.pending_pong = False
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped_alerts = 0
+
+    def has_pending(self) -> bool:
+        return bool(self.pending_pong or self.pending_quotes or self.pending_positions or self.pending_alerts)
+
+
+class PushHub:
+    """按用户管理推送连接，合并每轮行情变化后分发"""
+
+    def __init__(self):
+        self.flush_delay = float(os.getenv("PUSH_FLUSH_DELAY", "0.05"))
+        self.send_timeout = float(os.getenv("PUSH_SEND_TIMEOUT", "5"))
+        self.max_pending_alerts = int(os.getenv("PUSH_MAX_PENDING_ALERTS", "100"))
+        self.max_codes = int(os.getenv("PUSH_MAX_CODES", "200"))
+        self.connections: Dict[str, PushConnection] = {}
+        self._by_user: Dict[int, Set[str]] = {}  # user_id -> connection_id
+        # user_id -> {trade_id: (stock_code, shares, buy_price, buy_commission)}
+        self._positions: Dict[int, Dict[int, tuple]] = {}
+        self._reload_tasks: Dict[int, asyncio.Task] = {}
+        self._dirty: Dict[str, tuple[float, str]] = {}  # 本轮变化的报价
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._callback_registered = False
+        self.alert_forwarder = None  # Callable[[int, Dict], None]
+        self._ids = itertools.count(1)
+        self.metrics: Dict[str, int] = {"messages": 0, "flushes": 0, "slow_disconnects": 0}
+
+    # ---- 连接管理 ----
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> PushConnection:
+        """登记已接受的连接，加载用户持仓并启动发送任务"""
+        if not self._callback_registered:
+            price_monitor.add_price_change_callback(self._on_price_change)
+            self._callback_registered = True
+        conn = PushConnection(f"ws-{next(self._ids)}", user_id, websocket, self.max_pending_alerts)
+        self.connections[conn.id] = conn
+        first_for_user = user_id not in self._by_user
+        self._by_user.setdefault(user_id, set()).add(conn.id)
+        try:
+            if first_for_user:
+                await self._reload_positions(user_id)
+            self._resubscribe(conn)
+        except Exception:
+            await self.disconnect(conn)
+            raise
+        # 首条消息：用已有报价推送一次全部持仓估值
+        self._queue_positions(conn, None)
+        if conn.has_pending():
+            conn.wakeup.set()
+        conn.task = asyncio.create_task(self._writer(conn))
+        logger.info(f"推送连接已建立: {conn.id} (user={user_id})，当前连接数 {len(self.connections)}")
+        return conn
+
+    async def disconnect(self, conn: PushConnection):
+        if self.connections.pop(conn.id, None) is None:
+            return
+        price_monitor.unsubscribe(conn.id)
+        user_conns = self._by_user.get(conn.user_id)
+        if user_conns is not None:
+            user_conns.discard(conn.id)
+            if not user_conns:
+                del self._by_user[conn.user_id]
+                self._positions.pop(conn.user_id, None)
+        if conn.task is not None and conn.task is not asyncio.current_task():
+            conn.task.cancel()
+        logger.info(f"推送连接已关闭: {conn.id}，当前连接数 {len(self.connections)}")
+
+    def set_codes(self, conn: PushConnection, codes: list[str]):
+        """替换连接显式订阅的代码，并立即推送已有报价"""
+        conn.codes = {str(code).strip() for code in codes if code and str(code).strip()}
+        if len(conn.codes) > self.max_codes:
+            conn.codes = set(sorted(conn.codes)[: self.max_codes])
+        self._resubscribe(conn)
+        for code in self._codes_of(conn):
+            cached = price_monitor.quote_store.get(code)
+            if cached is not None and cached[0] > 0:
+                conn.pending_quotes[code] = {"price": cached[0], "source": cached[1]}
+        self._queue_positions(conn, None)
+        if conn.has_pending():
+            conn.wakeup.set()
+
+    def pong(self, conn: PushConnection):
+        """心跳应答：由连接的发送任务写出（同一连接上的发送不能并发）"""
+        conn.pending_pong = True
+        conn.wakeup.set()
+
+    def _codes_of(self, conn: PushConnection) -> Set[str]:
+        positions = self._positions.get(conn.user_id, {})
+        return conn.codes | {position[0] for position in positions.values()}
+
+    def _resubscribe(self, conn: PushConnection):
+        """让价格循环轮询该连接需要的全部代码"""
+        price_monitor.subscribe(conn.id, list(self._codes_of(conn)))
+
+    # ---- 持仓 ----
+
+    async def _reload_positions(self, user_id: int):
+        async for db in get_db():
+            result = await db.execute(
+                select(*_POSITION_COLUMNS).where(Trade.user_id == user_id, open_position_filter(Trade))
+            )
+            self._positions[user_id] = {
+                row.id: (row.stock_code, int(row.shares or 0), float(row.buy_price or 0), float(row.buy_commission or 0))
+                for row in result.all()
+                if row.stock_code
+            }
+            return
+
+    def positions_changed(self, user_id: Optional[int]):
+        """持仓新增/修改/平仓/删除后调用：有在线连接时异步重载该用户持仓"""
+        if user_id is None or user_id not in self._by_user or user_id in self._reload_tasks:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._reload_and_push(user_id))
+        except RuntimeError:
+            return
+        self._reload_tasks[user_id] = task
+        task.add_done_callback(lambda _: self._reload_tasks.pop(user_id, None))
+
+    def trade_removed(self, trade_id: int):
+        """只知道交易ID时（如删除），重载持有该持仓的在线用户"""
+        for user_id, positions in list(self._positions.items()):
+            if trade_id in positions:
+                self.positions_changed(user_id)
+
+    async def _reload_and_push(self, user_id: int):
+        try:
+            await self._reload_positions(user_id)
+        except Exception as e:
+            logger.error(f"推送中心重载用户 {user_id} 持仓失败: {e}")
+            return
+        for conn_id in list(self._by_user.get(user_id, ())):
+            conn = self.connections.get(conn_id)
+            if conn is None:
+                continue
+            self._resubscribe(conn)
+            self._queue_positions(conn, None)
+            conn.wakeup.set()
+
+    def _queue_positions(self, conn: PushConnection, codes: Optional[Dict[str, tuple[float, str]]]):
+        """计算持仓估值放入待发送队列；codes 为 None 时计算全部持仓（使用缓存报价）"""
+        for trade_id, (stock_code, shares, buy_price, buy_commission) in self._positions.get(conn.user_id, {}).items():
+            if codes is None:
+                cached = price_monitor.quote_store.get(stock_code)
+                price = cached[0] if cached is not None and cached[0] > 0 else None
+            else:
+                quote = codes.get(stock_code)
+                if quote is None:
+                    continue
+                price = quote[0]
+            if price is None:
+                continue
+            conn.pending_positions[trade_id] = {
+                "id": trade_id,
+                "stock_code": stock_code,
+                "current_price": price,
+                "market_value": round(price * shares, 2),
+                "profit_loss": round((price - buy_price) * shares - buy_commission, 2),
+            }
+
+    # ---- 行情分发 ----
+
+    def _on_price_change(self, stock_code: str, price: float, source: str):
+        """price_monitor 价格变化回调（同步）：只记录，延迟 flush_delay 后统一分发"""
+        if not self.connections:
+            return
+        self._dirty[stock_code] = (price, source)
+        if self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._flush_handle = loop.call_later(self.flush_delay, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        self.metrics["flushes"] += 1
+        # 通过订阅登记表只分发给订阅了变化代码的连接
+        touched: Dict[str, PushConnection] = {}
+        for code, (price, source) in dirty.items():
+            quote = {"price": price, "source": source}
+            for conn_id in price_monitor.registry.subscribers_of(code):
+                conn = self.connections.get(conn_id)
+                if conn is None:
+                    continue
+                conn.pending_quotes[code] = quote
+                touched[conn_id] = conn
+        for conn in touched.values():
+            self._queue_positions(conn, dirty)
+            conn.wakeup.set()
+
+    def send_alert(self, user_id: int, alert: Dict[str, Any]) -> int:
+        """向用户的所有连接推送闹铃通知，返回投递的连接数
+        设置了 alert_forwarder 时（共享行情模式的行情进程）同时转发给其他 worker"""
+        if self.alert_forwarder is not None:
+            try:
+                self.alert_forwarder(user_id, alert)
+            except Exception as e:
+                logger.error(f"转发闹铃通知失败: {e}")
+        delivered = 0
+        for conn_id in self._by_user.get(user_id, ()):
+            conn = self.connections.get(conn_id)
+            if conn is None:
+                continue
+            if len(conn.pending_alerts) == conn.pending_alerts.maxlen:
+                conn.dropped_alerts += 1
+            conn.pending_alerts.append(alert)
+            conn.wakeup.set()
+            delivered += 1
+        return delivered
+
+    async def _writer(self, conn: PushConnection):
+        """连接的发送任务：一次只有一条消息在途，其间到达的更新合并到下一条"""
+        try:
+            while True:
+                await conn.wakeup.wait()
+                conn.wakeup.clear()
+                if conn.pending_pong:
+                    conn.pending_pong = False
+                    await self._send(conn, {"type": "pong"})
+                while conn.pending_alerts:
+                    await self._send(conn, {"type": "alert", **conn.pending_alerts.popleft()})
+                if conn.pending_quotes or conn.pending_positions:
+                    quotes, conn.pending_quotes = conn.pending_quotes, {}
+                    positions, conn.pending_positions = conn.pending_positions, {}
+                    await self._send(conn, {"type": "tick", "quotes": quotes, "positions": list(positions.values())})
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            self.metrics["slow_disconnects"] += 1
+            logger.warning(f"推送连接 {conn.id} 发送超时，断开连接")
+            await self._close(conn)
+        except Exception as e:
+            logger.info(f"推送连接 {conn.id} 发送失败: {e}")
+            await self._close(conn)
+
+    async def _send(self, conn: PushConnection, message: Dict[str, Any]):
+        await asyncio.wait_for(conn.websocket.send_text(json_dumps(message).decode("utf-8")), timeout=self.send_timeout)
+        self.metrics["messages"] += 1
+
+    async def _close(self, conn: PushConnection):
+        await self.disconnect(conn)
+        try:
+            await conn.websocket.close()
+        except Exception:
+            pass
+
+    async def close_all(self):
+        """服务关闭时断开所有连接"""
+        for conn in list(self.connections.values()):
+            await self._close(conn)
+            if conn.task is not None:
+                conn.task.cancel()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    def get_metrics(self) -> Dict:
+        return {
+            "connections": len(self.connections),
+            "users": len(self._by_user),
+            **self.metrics,
+        }
+
+
+# 全局推送中心
+push_hub = PushHub()
@@ -0,0 +1,314 @@
+"""
+共享内存行情板（多 worker 部署）
+
+一个内存映射文件，固定布局，供同一台机器上的所有 API worker 读取：
+
+    [头部 64B][行情槽位 × capacity][信箱 × mailbox_capacity][事件环 × event_capacity]
+
+- 行情槽位：只由当选的行情进程写入，每个槽位带 seqlock 版本号（写入前后各加一，奇数表示正在写），
+  读取方读到前后版本一致且为偶数才算有效；代码一经分配槽位不再变化，槽位数只增不减
+- 信箱：其他 worker → 行情进程（需要轮询的代码及查看者数、发生变化的交易ID），多写入方，写入时持有文件锁，
+  每条消息带发送方 pid
+- 事件环：行情进程 → 其他 worker（闹铃通知），单写入方
+"""
+
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl，共享模式不可用
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TVQBOARD"
+LAYOUT_VERSION = 2
+
+# magic, 布局版本, 槽位容量, 信箱容量, 事件环容量, 代际, 已分配槽位数, 信箱写入计数, 事件写入计数, 心跳时间
+_HEADER = struct.Struct("<8sIIIIQQQQd")
+_HEADER_SIZE = 64
+_GENERATION_OFFSET = 24
+_SLOT_COUNT_OFFSET = 32
+_MAILBOX_HEAD_OFFSET = 40
+_EVENT_HEAD_OFFSET = 48
+_HEARTBEAT_OFFSET = 56
+
+# 版本号, 代码, 价格, 更新时间(epoch), 来源
+_SLOT = struct.Struct("<Q16sdd32s")
+_SEQ = struct.Struct("<Q")
+_U64 = struct.Struct("<Q")
+_F64 = struct.Struct("<d")
+# 序号(写入计数+1，0 表示未写完), 时间, 内容, 类型, 发送方 pid
+_MAILBOX_ENTRY = struct.Struct("<Qd16sBxxxI")
+# 序号, 内容长度, 内容
+_EVENT_ENTRY = struct.Struct("<QH510s")
+
+MAILBOX_WANT = 1  # 内容：股票代码:发送方的查看者数
+MAILBOX_TRADE = 2  # 内容：交易ID
+MAILBOX_USER = 3  # 内容：用户ID（提醒设置变更）
+
+_READ_RETRIES = 8
+
+
+def _decode(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode("utf-8", errors="ignore")
+
+
+class QuoteBoard:
+    """内存映射的行情板（行情进程写，所有 worker 读）"""
+
+    def __init__(self, path: str, capacity: int = 8192, mailbox_capacity: int = 4096, event_capacity: int = 1024):
+        self.path = path
+        self.capacity = int(capacity)
+        self.mailbox_capacity = int(mailbox_capacity)
+        self.event_capacity = int(event_capacity)
+        self._slots_offset = _HEADER_SIZE
+        self._mailbox_offset = self._slots_offset + self.capacity * _SLOT.size
+        self._events_offset = self._mailbox_offset + self.mailbox_capacity * _MAILBOX_ENTRY.size
+        self.size = self._events_offset + self.event_capacity * _EVENT_ENTRY.size
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._mm = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        self._lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+
+        # 写入方：code -> 槽位
+        self._write_index: Dict[str, int] = {}
+        # 读取方：code -> 槽位（按已分配槽位数增量扫描）
+        self._read_index: Dict[str, int] = {}
+        self._scanned = 0
+        self._generation = -1
+        self._dropped = 0
+
+    def close(self):
+        try:
+            self._mm.close()
+        finally:
+            os.close(self._lock_fd)
+
+    # ---- 头部 ----
+
+    def _u64(self, offset: int) -> int:
+        return _U64.unpack_from(self._mm, offset)[0]
+
+    def _header_valid(self) -> bool:
+        magic, version, capacity, mailbox_capacity, event_capacity, *_ = _HEADER.unpack_from(self._mm, 0)
+        return (magic, version, capacity, mailbox_capacity, event_capacity) == (
+            MAGIC, LAYOUT_VERSION, self.capacity, self.mailbox_capacity, self.event_capacity
+        )
+
+    def claim(self):
+        """行情进程当选后调用：沿用布局一致的现有数据（接管前任的槽位），否则清空重建"""
+        if self._header_valid():
+            self._write_index = {}
+            for slot in range(min(self._u64(_SLOT_COUNT_OFFSET), self.capacity)):
+                offset = self._slot_offset(slot)
+                seq, raw_code, _, _, _ = _SLOT.unpack_from(self._mm, offset)
+                if seq & 1:
+                    # 前任写入中途退出：丢弃半写的报价（价格置 0，读取方跳过），版本号恢复为偶数
+                    _SLOT.pack_into(self._mm, offset, seq + 1, raw_code, 0.0, 0.0, b"")
+                code = _decode(raw_code)
+                if code:
+                    self._write_index[code] = slot
+            return
+        generation = self._u64(_GENERATION_OFFSET) + 1 if self._mm[:8] == MAGIC else 1
+        self._mm[:] = bytes(self.size)
+        _HEADER.pack_into(
+            self._mm, 0, MAGIC, LAYOUT_VERSION, self.capacity, self.mailbox_capacity, self.event_capacity,
+            generation, 0, 0, 0, time.time(),
+        )
+        self._write_index = {}
+
+    def heartbeat(self):
+        _F64.pack_into(self._mm, _HEARTBEAT_OFFSET, time.time())
+
+    def heartbeat_age(self) -> Optional[float]:
+        if not self._header_valid():
+            return None
+        return time.time() - _F64.unpack_from(self._mm, _HEARTBEAT_OFFSET)[0]
+
+    # ---- 行情槽位 ----
+
+    def _slot_offset(self, slot: int) -> int:
+        return self._slots_offset + slot * _SLOT.size
+
+    def publish(self, quotes: Dict[str, tuple[float, str, str]]):
+        """写入一批报价 {code: (price, name, source)}（仅行情进程调用）"""
+        now = time.time()
+        for code, (price, _, source) in quotes.items():
+            slot = self._write_index.get(code)
+            if slot is None:
+                slot = len(self._write_index)
+                if slot >= self.capacity:
+                    self._dropped += 1
+                    continue
+                offset = self._slot_offset(slot)
+                _SLOT.pack_into(self._mm, offset, 0, code.encode("utf-8")[:16], 0.0, 0.0, b"")
+                self._write_index[code] = slot
+                _U64.pack_into(self._mm, _SLOT_COUNT_OFFSET, slot + 1)
+            offset = self._slot_offset(slot)
+            writing = _SEQ.unpack_from(self._mm, offset)[0] | 1  # 奇数：写入中（已是奇数时保持，避免奇偶翻转）
+            _SEQ.pack_into(self._mm, offset, writing)
+            _SLOT.pack_into(
+                self._mm, offset, writing, code.encode("utf-8")[:16], float(price), now,
+                source.encode("utf-8")[:32],
+            )
+            _SEQ.pack_into(self._mm, offset, writing + 1)
+
+    def _refresh_read_index(self):
+        generation = self._u64(_GENERATION_OFFSET)
+        if generation != self._generation:
+            self._read_index.clear()
+            self._scanned = 0
+            self._generation = generation
+        count = min(self._u64(_SLOT_COUNT_OFFSET), self.capacity)
+        for slot in range(self._scanned, count):
+            code = _decode(_SLOT.unpack_from(self._mm, self._slot_offset(slot))[1])
+            if code:
+                self._read_index[code] = slot
+        self._scanned = count
+
+    def _read_slot(self, slot: int) -> Optional[tuple[int, float, float, str]]:
+        """seqlock 读取：返回 (版本号, 价格, 更新时间, 来源)，持续冲突时返回 None"""
+        offset = self._slot_offset(slot)
+        for _ in range(_READ_RETRIES):
+            seq1, _, price, updated_at, source = _SLOT.unpack_from(self._mm, offset)
+            if seq1 & 1:
+                continue
+            if _SEQ.unpack_from(self._mm, offset)[0] == seq1:
+                return seq1, price, updated_at, _decode(source)
+        return None
+
+    def _slot_for(self, code: str) -> Optional[int]:
+        slot = self._read_index.get(code)
+        if slot is None:
+            self._refresh_read_index()
+            slot = self._read_index.get(code)
+        return slot
+
+    def read(self, codes: Iterable[str], max_age: float) -> Dict[str, tuple[float, str, str]]:
+        """读取 max_age 秒内更新过的报价 {code: (price, "", source)}"""
+        now = time.time()
+        if self._u64(_GENERATION_OFFSET) != self._generation:
+            self._refresh_read_index()
+        result: Dict[str, tuple[float, str, str]] = {}
+        for code in codes:
+            slot = self._slot_for(code)
+            if slot is None:
+                continue
+            value = self._read_slot(slot)
+            if value is None or value[0] == 0:
+                continue
+            _, price, updated_at, source = value
+            if price > 0 and now - updated_at <= max_age:
+                result[code] = (price, "", source)
+        return result
+
+    def read_changed(self, codes: Iterable[str], seen: Dict[str, int]) -> Dict[str, tuple[float, str, str]]:
+        """读取版本号与 seen 不同的报价，并更新 seen"""
+        self._refresh_read_index()
+        result: Dict[str, tuple[float, str, str]] = {}
+        for code in codes:
+            slot = self._read_index.get(code)
+            if slot is None:
+                continue
+            offset = self._slot_offset(slot)
+            if _SEQ.unpack_from(self._mm, offset)[0] == seen.get(code):
+                continue
+            value = self._read_slot(slot)
+            if value is None or value[0] == 0:
+                continue
+            seq, price, _, source = value
+            seen[code] = seq
+            if price > 0:
+                result[code] = (price, "", source)
+        return result
+
+    # ---- 信箱（worker → 行情进程）----
+
+    def post(self, kind: int, payloads: Iterable[str]):
+        """追加信箱消息（持有文件锁，多个 worker 可并发调用）"""
+        payloads = [p.encode("utf-8")[:16] for p in payloads]
+        if not payloads:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            head = self._u64(_MAILBOX_HEAD_OFFSET)
+            now = time.time()
+            sender = os.getpid()
+            for payload in payloads:
+                offset = self._mailbox_offset + (head % self.mailbox_capacity) * _MAILBOX_ENTRY.size
+                _SEQ.pack_into(self._mm, offset, 0)
+                _MAILBOX_ENTRY.pack_into(self._mm, offset, 0, now, payload, kind, sender)
+                _SEQ.pack_into(self._mm, offset, head + 1)
+                head += 1
+            _U64.pack_into(self._mm, _MAILBOX_HEAD_OFFSET, head)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def mailbox_head(self) -> int:
+        return self._u64(_MAILBOX_HEAD_OFFSET)
+
+    def drain_mailbox(self, cursor: int) -> tuple[int, list[tuple[int, int, str]], bool]:
+        """读取 cursor 之后的信箱消息，返回 (新 cursor, [(类型, 发送方 pid, 内容)], 是否有消息被覆盖)"""
+        head = self.mailbox_head()
+        cursor = min(cursor, head)  # 行情板重建后计数归零
+        overflow = head - cursor > self.mailbox_capacity
+        if overflow:
+            cursor = head - self.mailbox_capacity
+        messages = []
+        for index in range(cursor, head):
+            offset = self._mailbox_offset + (index % self.mailbox_capacity) * _MAILBOX_ENTRY.size
+            seq, _, payload, kind, sender = _MAILBOX_ENTRY.unpack_from(self._mm, offset)
+            if seq == index + 1:
+                messages.append((kind, sender, _decode(payload)))
+        return head, messages, overflow
+
+    # ---- 事件环（行情进程 → worker）----
+
+    def publish_event(self, payload: bytes) -> bool:
+        """写入一条事件（仅行情进程调用），超长时丢弃"""
+        if len(payload) > 510:
+            logger.warning(f"行情板事件过长，已丢弃: {len(payload)} bytes")
+            return False
+        head = self._u64(_EVENT_HEAD_OFFSET)
+        offset = self._events_offset + (head % self.event_capacity) * _EVENT_ENTRY.size
+        _SEQ.pack_into(self._mm, offset, 0)
+        _EVENT_ENTRY.pack_into(self._mm, offset, 0, len(payload), payload)
+        _SEQ.pack_into(self._mm, offset, head + 1)
+        _U64.pack_into(self._mm, _EVENT_HEAD_OFFSET, head + 1)
+        return True
+
+    def event_head(self) -> int:
+        return self._u64(_EVENT_HEAD_OFFSET)
+
+    def drain_events(self, cursor: int) -> tuple[int, list[bytes]]:
+        """读取 cursor 之后的事件，返回 (新 cursor, [内容])"""
+        head = self.event_head()
+        cursor = max(min(cursor, head), head - self.event_capacity)
+        events = []
+        for index in range(cursor, head):
+            offset = self._events_offset + (index % self.event_capacity) * _EVENT_ENTRY.size
+            seq, length, payload = _EVENT_ENTRY.unpack_from(self._mm, offset)
+            if seq == index + 1:
+                events.append(payload[:length])
+        return head, events
+
+    def get_stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "slots": min(self._u64(_SLOT_COUNT_OFFSET), self.capacity) if self._header_valid() else 0,
+            "capacity": self.capacity,
+            "dropped": self._dropped,
+        }
@@ -0,0 +1,107 @@
+"""
+行情响应解析
+
+直接在原始 bytes 上用 find 定位字段，不整体解码、不反复 split：
+- 只解析用到的字段（名称、最新价）
+- 仅在需要名称时对名称片段做 GBK 解码
+
+新浪格式: var hq_str_sh600000="浦发银行,开盘,昨收,最新,...";
+腾讯格式: v_sh600000="1~浦发银行~600000~最新~昨收~...";
+"""
+
+from typing import Dict
+
+SINA_SOURCE = "新浪财经"
+TENCENT_SOURCE = "腾讯财经"
+
+_SINA_PREFIX = b"hq_str_"
+_TENCENT_PREFIX = b"v_"
+_ASSIGN = b'="'
+_QUOTE = b'"'
+
+
+def build_code_map(normalized_codes: list[str], stock_codes: list[str]) -> Dict[bytes, str]:
+    """构造 标准化代码(bytes) -> 原始代码 映射，供解析器直接匹配原始响应"""
+    return {norm.encode("ascii", "ignore"): orig for norm, orig in zip(normalized_codes, stock_codes)}
+
+
+def _iter_records(body: bytes, prefix: bytes, code_map: Dict[bytes, str]):
+    """遍历响应中的记录，产出 (原始代码, 数据起始下标, 数据结束下标)"""
+    pos = 0
+    prefix_len = len(prefix)
+    while True:
+        start = body.find(prefix, pos)
+        if start < 0:
+            return
+        assign = body.find(_ASSIGN, start)
+        if assign < 0:
+            return
+        data_start = assign + 2
+        data_end = body.find(_QUOTE, data_start)
+        if data_end < 0:
+            return
+        pos = data_end + 1
+        orig_code = code_map.get(body[start + prefix_len:assign])
+        if orig_code is not None and data_end > data_start:
+            yield orig_code, data_start, data_end
+
+
+def _nth_sep(body: bytes, sep: bytes, start: int, end: int, n: int) -> int:
+    """返回 [start, end) 内第 n 个分隔符的位置（n 从 1 开始），不存在返回 -1"""
+    idx = start - 1
+    for _ in range(n):
+        idx = body.find(sep, idx + 1, end)
+        if idx < 0:
+            return -1
+    return idx
+
+
+def _decode_name(raw: bytes) -> str:
+    return raw.decode("gbk", errors="replace").strip()
+
+
+def parse_sina(body: bytes, code_map: Dict[bytes, str], with_names: bool = True) -> Dict[str, tuple[float, str, str]]:
+    """解析新浪批量行情
+    返回: {stock_code: (price, name, source)}；with_names=False 时名称为空字符串"""
+    results: Dict[str, tuple[float, str, str]] = {}
+    for orig_code, start, end in _iter_records(body, _SINA_PREFIX, code_map):
+        c0 = body.find(b",", start, end)
+        if c0 < 0:
+            continue
+        c2 = _nth_sep(body, b",", c0 + 1, end, 2)
+        if c2 < 0:
+            continue
+        c3 = body.find(b",", c2 + 1, end)
+        try:
+            price = float(body[c2 + 1:c3 if c3 >= 0 else end])
+        except ValueError:
+            continue
+        if price > 0:
+            name = _decode_name(body[start:c0]) if with_names else ""
+            results[orig_code] = (round(price, 2), name, SINA_SOURCE)
+    return results
+
+
+def parse_tencent(body: bytes, code_map: Dict[bytes, str], with_names: bool = True) -> Dict[str, tuple[float, str, str]]:
+    """解析腾讯批量行情
+    返回: {stock_code: (price, name, source)}；with_names=False 时名称为空字符串"""
+    results: Dict[str, tuple[float, str, str]] = {}
+    for orig_code, start, end in _iter_records(body, _TENCENT_PREFIX, code_map):
+        t0 = body.find(b"~", start, end)
+        if t0 < 0:
+            continue
+        t1 = body.find(b"~", t0 + 1, end)
+        if t1 < 0:
+            continue
+        t2 = body.find(b"~", t1 + 1, end)
+        if t2 < 0:
+            continue
+        t3 = body.find(b"~", t2 + 1, end)
+        try:
+            price = float(body[t2 + 1:t3 if t3 >= 0 else end])
+        except ValueError:
+            continue
+        name = _decode_name(body[t0 + 1:t1]) if with_names else ""
+        results[orig_code] = (round(price, 2), name, TENCENT_SOURCE)
+    return results
+
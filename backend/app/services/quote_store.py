@@ -0,0 +1,147 @@
+"""
+紧凑行情存储
+
+用 代码→槽位 索引 + 并行 NumPy 列（最新价、上一价、单调时间戳、来源ID）保存报价，
+替代 {code: (price, datetime, source)} 元组字典：批量更新和变化检测均为向量化操作，
+每次更新不再分配 datetime / tuple，来源字符串只保存一份。
+"""
+
+import time
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+FAILED_SOURCE = "获取失败"
+
+
+class QuoteStore:
+    """代码→槽位索引 + 并行数组的行情存储"""
+
+    CHANGE_EPSILON = 0.001  # 小于该幅度的价格波动不视为变化
+
+    def __init__(self, initial_capacity: int = 1024):
+        capacity = max(1, int(initial_capacity))
+        self._index: Dict[str, int] = {}
+        self._symbols: list[str] = []
+        self._last_price = np.full(capacity, np.nan, dtype=np.float64)
+        self._prev_price = np.full(capacity, np.nan, dtype=np.float64)
+        self._updated_at = np.zeros(capacity, dtype=np.float64)  # time.monotonic()
+        self._source_id = np.zeros(capacity, dtype=np.int8)
+        # 来源枚举：0 固定为“获取失败”，其余按首次出现顺序分配
+        self._source_names: list[str] = [FAILED_SOURCE]
+        self._source_ids: Dict[str, int] = {FAILED_SOURCE: 0}
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def __contains__(self, code: str) -> bool:
+        slot = self._index.get(code)
+        return slot is not None and not np.isnan(self._last_price[slot])
+
+    @property
+    def capacity(self) -> int:
+        return int(self._last_price.shape[0])
+
+    def source_id(self, source: str) -> int:
+        """获取（必要时登记）来源ID"""
+        sid = self._source_ids.get(source)
+        if sid is None:
+            if len(self._source_names) >= np.iinfo(np.int8).max:
+                raise ValueError("行情来源数量超出上限")
+            sid = len(self._source_names)
+            self._source_names.append(source)
+            self._source_ids[source] = sid
+        return sid
+
+    def source_name(self, source_id: int) -> str:
+        return self._source_names[int(source_id)]
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        extra = capacity - self.capacity
+        self._last_price = np.concatenate([self._last_price, np.full(extra, np.nan, dtype=np.float64)])
+        self._prev_price = np.concatenate([self._prev_price, np.full(extra, np.nan, dtype=np.float64)])
+        self._updated_at = np.concatenate([self._updated_at, np.zeros(extra, dtype=np.float64)])
+        self._source_id = np.concatenate([self._source_id, np.zeros(extra, dtype=np.int8)])
+
+    def slots_for(self, codes: Iterable[str]) -> np.ndarray:
+        """获取代码对应的槽位（新代码自动分配槽位）"""
+        slots = []
+        for code in codes:
+            slot = self._index.get(code)
+            if slot is None:
+                slot = len(self._symbols)
+                self._index[code] = slot
+                self._symbols.append(code)
+            slots.append(slot)
+        if len(self._symbols) > self.capacity:
+            self._grow(len(self._symbols))
+        return np.asarray(slots, dtype=np.intp)
+
+    def bulk_update(
+        self,
+        codes: list[str],
+        prices: np.ndarray,
+        source_ids: np.ndarray,
+        now: Optional[float] = None,
+    ) -> list[str]:
+        """向量化批量写入一批报价，返回价格发生变化的代码
+        首次写入的有效报价（之前无价格）也算变化，订阅方据此收到第一笔报价"""
+        if not codes:
+            return []
+        slots = self.slots_for(codes)
+        prices = np.asarray(prices, dtype=np.float64)
+        previous = self._last_price[slots]
+
+        self._prev_price[slots] = previous
+        self._last_price[slots] = prices
+        self._updated_at[slots] = time.monotonic() if now is None else now
+        self._source_id[slots] = np.asarray(source_ids, dtype=np.int8)
+
+        first = np.isnan(previous)
+        changed = (~first & (np.abs(previous - prices) > self.CHANGE_EPSILON)) | (first & (prices > 0))
+        return [codes[i] for i in np.flatnonzero(changed)]
+
+    def update_from_batch(self, batch_results: Dict[str, tuple[float, str, str]]) -> list[str]:
+        """从解析后的行情批次 {code: (price, name, source)} 批量更新"""
+        if not batch_results:
+            return []
+        codes = list(batch_results.keys())
+        prices = np.fromiter((batch_results[c][0] for c in codes), dtype=np.float64, count=len(codes))
+        source_ids = np.fromiter(
+            (self.source_id(batch_results[c][2]) for c in codes), dtype=np.int8, count=len(codes)
+        )
+        return self.bulk_update(codes, prices, source_ids)
+
+    def get(self, code: str) -> Optional[tuple[float, str, float]]:
+        """返回 (价格, 来源, 距今秒数)，无数据时返回None"""
+        slot = self._index.get(code)
+        if slot is None:
+            return None
+        price = self._last_price[slot]
+        if np.isnan(price):
+            return None
+        age = time.monotonic() - float(self._updated_at[slot])
+        return float(price), self._source_names[int(self._source_id[slot])], age
+
+    def previous_price(self, code: str) -> Optional[float]:
+        slot = self._index.get(code)
+        if slot is None or np.isnan(self._prev_price[slot]):
+            return None
+        return float(self._prev_price[slot])
+
+    def snapshot(self, codes: list[str]) -> Dict[str, tuple[float, str]]:
+        """批量读取已知代码的 (价格, 来源)"""
+        known = [(code, self._index[code]) for code in codes if code in self._index]
+        if not known:
+            return {}
+        slots = np.asarray([slot for _, slot in known], dtype=np.intp)
+        prices = self._last_price[slots]
+        source_ids = self._source_id[slots]
+        return {
+            code: (float(prices[i]), self._source_names[int(source_ids[i])])
+            for i, (code, _) in enumerate(known)
+            if not np.isnan(prices[i])
+        }
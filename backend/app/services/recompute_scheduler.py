@@ -0,0 +1,189 @@
+"""
+资金曲线重算调度
+
+按 (类型, user_id, strategy_id) 合并重算请求：
+- 突发写入（如连续导入多笔交易）在防抖窗口内合并为一次，起始日期取最早者
+- 同一个键同时最多运行一个任务，运行期间的新请求排队合并到下一次
+- 全局并发受工作数限制
+- 调用方可 await schedule() 返回的 Future 等待完成，或用 status() 轮询
+- 关闭时 drain() 立即执行所有待处理任务并等待完成
+"""
+
+import asyncio
+import logging
+import os
+from datetime import date
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# handler(db, user_id, strategy_id, start_date)
+RecomputeHandler = Callable[..., Awaitable[None]]
+RecomputeKey = tuple[str, int, int]
+
+
+class _PendingJob:
+    """某个键上尚未开始的合并任务"""
+
+    def __init__(self, now: float):
+        self.start_date: Optional[date] = None
+        self.first_request = now
+        self.last_request = now
+        self.immediate = False
+        self.waiters: list[asyncio.Future] = []
+        self.wake = asyncio.Event()
+
+
+class RecomputeScheduler:
+    """防抖、合并的后台重算调度器"""
+
+    def __init__(self):
+        self.debounce = float(os.getenv("RECOMPUTE_DEBOUNCE", "0.5"))
+        self.max_delay = float(os.getenv("RECOMPUTE_MAX_DELAY", "5"))  # 持续写入时最长推迟时间
+        self.max_workers = max(1, int(os.getenv("RECOMPUTE_WORKERS", "4")))
+        self._handlers: Dict[str, RecomputeHandler] = {}
+        self._pending: Dict[RecomputeKey, _PendingJob] = {}
+        self._running: set[RecomputeKey] = set()
+        self._drivers: Dict[RecomputeKey, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._draining = False
+        self.metrics: Dict[str, int] = {"requested": 0, "executed": 0, "coalesced": 0, "failed": 0}
+
+    def register(self, kind: str, handler: RecomputeHandler):
+        """注册某类重算的执行函数 handler(db, user_id, strategy_id, start_date)"""
+        self._handlers[kind] = handler
+
+    def schedule(
+        self,
+        kind: str,
+        user_id: int,
+        strategy_id: int,
+        start_date: Optional[date] = None,
+        debounce: bool = True,
+    ) -> asyncio.Future:
+        """提交重算请求，返回在覆盖该请求的任务完成时结束的 Future
+        start_date 为 None 表示全量重算；debounce=False 时不等待防抖窗口"""
+        if kind not in self._handlers:
+            raise ValueError(f"未注册的重算类型: {kind}")
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        key = (kind, int(user_id), int(strategy_id))
+        now = loop.time()
+        job = self._pending.get(key)
+        if job is None:
+            job = _PendingJob(now)
+            job.start_date = start_date
+            self._pending[key] = job
+        else:
+            self.metrics["coalesced"] += 1
+            if start_date is None or (job.start_date is not None and start_date < job.start_date):
+                job.start_date = start_date
+            job.last_request = now
+        if not debounce or self._draining:
+            job.immediate = True
+            job.wake.set()
+
+        waiter = loop.create_future()
+        # 后台提交的请求不会 await，提前标记异常已读取，避免未读取异常告警
+        waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+        job.waiters.append(waiter)
+        self.metrics["requested"] += 1
+
+        if key not in self._drivers:
+            task = asyncio.create_task(self._drive(key))
+            self._drivers[key] = task
+        return waiter
+
+    async def run(
+        self,
+        kind: str,
+        user_id: int,
+        strategy_id: int,
+        start_date: Optional[date] = None,
+    ) -> None:
+        """立即排队执行并等待完成（与同键的后台请求合并，不会并发重算同一策略）"""
+        await self.schedule(kind, user_id, strategy_id, start_date, debounce=False)
+
+    def status(self, kind: str, user_id: int, strategy_id: int) -> str:
+        """轮询任务状态: running / pending / idle"""
+        key = (kind, int(user_id), int(strategy_id))
+        if key in self._running:
+            return "running"
+        if key in self._pending:
+            return "pending"
+        return "idle"
+
+    async def _wait_debounce(self, job: _PendingJob):
+        loop = asyncio.get_running_loop()
+        while not job.immediate:
+            now = loop.time()
+            delay = min(job.last_request + self.debounce, job.first_request + self.max_delay) - now
+            if delay <= 0:
+                return
+            job.wake.clear()
+            try:
+                await asyncio.wait_for(job.wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, kind: str, user_id: int, strategy_id: int, start_date: Optional[date]):
+        async for db in get_db():
+            await self._handlers[kind](db, user_id, strategy_id, start_date)
+            return
+
+    async def _drive(self, key: RecomputeKey):
+        """单个键的驱动任务：依次执行该键上合并后的请求"""
+        kind, user_id, strategy_id = key
+        try:
+            while True:
+                job = self._pending.get(key)
+                if job is None:
+                    return
+                await self._wait_debounce(job)
+                # 防抖结束后取走任务，之后到达的请求进入下一轮
+                self._pending.pop(key, None)
+                async with self._semaphore:
+                    self._running.add(key)
+                    try:
+                        await self._execute(kind, user_id, strategy_id, job.start_date)
+                    except Exception as e:
+                        self.metrics["failed"] += 1
+                        logger.error(f"资金曲线重算失败 {key}: {e}", exc_info=True)
+                        for waiter in job.waiters:
+                            if not waiter.done():
+                                waiter.set_exception(e)
+                    else:
+                        self.metrics["executed"] += 1
+                        for waiter in job.waiters:
+                            if not waiter.done():
+                                waiter.set_result(None)
+                    finally:
+                        self._running.discard(key)
+        finally:
+            self._drivers.pop(key, None)
+
+    async def drain(self, timeout: float = 30):
+        """立即执行所有待处理任务并等待完成（用于关闭服务）"""
+        self._draining = True
+        try:
+            for job in self._pending.values():
+                job.immediate = True
+                job.wake.set()
+            drivers = list(self._drivers.values())
+            if not drivers:
+                return
+            done, pending = await asyncio.wait(drivers, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"⚠️ 关闭时仍有 {len(pending)} 个资金曲线重算任务未完成，已取消")
+        finally:
+            self._draining = False
+
+
+# 全局重算调度器
+recompute_scheduler = RecomputeScheduler()
@@ -0,0 +1,96 @@
+"""
+交易列表的快速序列化
+
+列表接口原先加载完整的 ORM 对象，再复制 __dict__ 逐行构造 TradeResponse，
+返回后 FastAPI 还要按 response_model 再校验、再编码一次。这里改为：
+- 只查询 TradeResponse 需要的列（TRADE_COLUMNS），行直接转成普通 dict
+- 用 FastJSONResponse 直接编码（安装了 orjson 时使用 orjson），跳过二次校验
+路由上保留 response_model，仅用于生成接口文档。
+"""
+
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import Trade
+from app.models import TradeResponse
+from app.services.symbol_directory import symbol_directory
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时退回标准库 json
+    orjson = None
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_dumps(content: Any) -> bytes:
+    """编码 dict/list/基本类型/datetime（安装了 orjson 时使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """不经 jsonable_encoder 的 JSON 响应，内容须为 dict/list/基本类型/datetime"""
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+# TradeResponse 中直接来自 trades 表的字段，按模型字段顺序排列
+TRADE_FIELDS = tuple(name for name in TradeResponse.model_fields if name in Trade.__table__.columns)
+TRADE_COLUMNS = tuple(Trade.__table__.columns[name] for name in TRADE_FIELDS)
+# 需要在路由中计算的字段，默认值与 TradeResponse 一致
+_COMPUTED_DEFAULTS = tuple(
+    (name, field.default)
+    for name, field in TradeResponse.model_fields.items()
+    if name not in Trade.__table__.columns
+)
+
+
+def risk_reward_ratio(buy_price, stop_loss_price, take_profit_price) -> Optional[float]:
+    """风险回报比：(止盈价-买入价)/(买入价-止损价)，无法计算时返回 None"""
+    if buy_price and stop_loss_price and take_profit_price:
+        risk = buy_price - stop_loss_price  # 止损距离（风险）
+        reward = take_profit_price - buy_price  # 止盈距离（回报）
+        if risk > 0:
+            return round(reward / risk, 2)
+    return None
+
+
+def trade_item(row) -> Dict[str, Any]:
+    """把 select(*TRADE_COLUMNS) 的一行转成响应字典（含风险回报比）"""
+    item = dict(zip(TRADE_FIELDS, row))
+    item.update(_COMPUTED_DEFAULTS)
+    item["risk_reward_ratio"] = risk_reward_ratio(
+        item["buy_price"], item["stop_loss_price"], item["take_profit_price"]
+    )
+    return item
+
+
+async def fill_trade_names(db: AsyncSession, items: Iterable[Dict[str, Any]]) -> bool:
+    """从股票代码表补全缺失的股票名称并写回数据库（只查内存），返回是否有更新"""
+    updates: Dict[str, list[int]] = defaultdict(list)
+    for item in items:
+        if (not item["stock_name"] or item["stock_name"].strip() == "") and item["stock_code"]:
+            name = symbol_directory.get_name(item["stock_code"])
+            if name:
+                item["stock_name"] = name
+                updates[name].append(item["id"])
+    for name, ids in updates.items():
+        await db.execute(
+            update(Trade).where(Trade.id.in_(ids)).values(stock_name=name).execution_options(synchronize_session=False)
+        )
+    return bool(updates)
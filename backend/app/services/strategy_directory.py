@@ -0,0 +1,110 @@
+"""
+用户策略目录缓存
+
+几乎所有股票/外汇接口都要先解析策略。这里按用户缓存全部策略的 detached 快照：
+- 未命中时一次查询加载该用户所有策略，同一用户的并发请求共享这一次加载
+- 命中时用 session.merge(load=False) 把快照并入当前会话，不查询数据库，路由中的修改可正常提交
+- 创建/删除策略、修改初始资金/起始日期后需调用 invalidate
+- invalidate 只作用于当前进程，其他 worker 依赖短 TTL 过期，故默认 TTL 只有几秒
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import Strategy, detached_snapshot
+
+
+class _UserStrategies:
+    """单个用户的策略目录"""
+
+    def __init__(self, strategies: list[Strategy], ttl: float):
+        self.expires_at = time.monotonic() + ttl
+        self.by_market: Dict[str, Dict[int, Strategy]] = {}
+        for strategy in sorted(strategies, key=lambda s: s.id):
+            market = strategy.market or "stock"
+            self.by_market.setdefault(market, {})[strategy.id] = detached_snapshot(strategy)
+        self.legacy_migrated: set[str] = set()
+
+    def default_strategy_id(self, market: str) -> Optional[int]:
+        ids = self.by_market.get(market)
+        return min(ids) if ids else None
+
+
+class StrategyDirectory:
+    """按用户缓存策略目录（LRU + TTL）"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("STRATEGY_CACHE_TTL", "5"))
+        self.max_users = int(os.getenv("STRATEGY_CACHE_SIZE", "10000"))
+        self._entries: "OrderedDict[int, _UserStrategies]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._generation: Dict[int, int] = {}
+
+    async def _directory(self, db: AsyncSession, user_id: int) -> _UserStrategies:
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(user_id)
+            return entry
+
+        pending = self._loading.get(user_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # 没有并发等待者时也标记异常已读取
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._loading[user_id] = future
+        generation = self._generation.get(user_id, 0)
+        try:
+            result = await db.execute(select(Strategy).where(Strategy.user_id == user_id))
+            entry = _UserStrategies(result.scalars().all(), self.ttl)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._loading.pop(user_id, None)
+
+        # 加载期间被 invalidate 的结果只给本次请求使用，不写入缓存
+        if self._generation.get(user_id, 0) == generation and self.ttl > 0:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        future.set_result(entry)
+        return entry
+
+    async def get(self, db: AsyncSession, user_id: int, strategy_id: int, market: str) -> Optional[Strategy]:
+        """返回归属当前会话的策略对象，不存在时返回 None"""
+        entry = await self._directory(db, user_id)
+        snapshot = entry.by_market.get(market, {}).get(int(strategy_id))
+        if snapshot is None:
+            return None
+        return await db.merge(snapshot, load=False)
+
+    async def default_strategy_id(self, db: AsyncSession, user_id: int, market: str) -> Optional[int]:
+        """该市场下最早创建（id 最小）的策略"""
+        entry = await self._directory(db, user_id)
+        return entry.default_strategy_id(market)
+
+    async def needs_legacy_migration(self, db: AsyncSession, user_id: int, market: str) -> bool:
+        """目录加载后首次调用返回 True，之后不再重复执行旧数据迁移检查"""
+        entry = await self._directory(db, user_id)
+        if market in entry.legacy_migrated:
+            return False
+        entry.legacy_migrated.add(market)
+        return True
+
+    def invalidate(self, user_id: int):
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+        self._entries.pop(user_id, None)
+
+
+# 全局策略目录缓存
+strategy_directory = StrategyDirectory()
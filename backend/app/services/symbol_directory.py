@@ -0,0 +1,191 @@
+"""
+股票代码表（symbols）
+
+列表/持仓接口过去在请求中逐个调用行情接口补全缺失的股票名称，响应时间随外部接口波动。
+这里改为：
+- 启动时把 symbols 表整体加载到内存，请求中只查内存，不访问外部接口
+- 内存中没有的代码登记为待补全，由后台任务批量拉取（新浪优先，腾讯补齐）后写回 symbols 表
+- 超过 SYMBOL_MAX_AGE_DAYS 未刷新的名称定期重新拉取（更名、ST 等）
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import select, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db, Symbol, Trade, dialect_insert
+from app.services.price_monitor import price_monitor
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolDirectory:
+    """内存中的代码 → 名称索引，后台批量补全并持久化"""
+
+    def __init__(self):
+        self.refresh_interval = float(os.getenv("SYMBOL_REFRESH_INTERVAL", "3600"))
+        self.max_age = timedelta(days=float(os.getenv("SYMBOL_MAX_AGE_DAYS", "7")))
+        self.retry_delay = float(os.getenv("SYMBOL_RETRY_DELAY", "300"))
+        self.names: Dict[str, str] = {}
+        self._updated_at: Dict[str, datetime] = {}
+        self._missing: set[str] = set()
+        self._retry_at: Dict[str, float] = {}  # 拉取失败的代码在此时间之前不再重试
+        self._loaded = False
+        self._wake: Optional[asyncio.Event] = None
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        self.metrics: Dict[str, int] = {"hits": 0, "misses": 0, "fetched": 0, "failed": 0}
+
+    def get_name(self, stock_code: Optional[str]) -> Optional[str]:
+        """只查内存；未知代码登记为待补全并唤醒后台任务"""
+        if not stock_code:
+            return None
+        code = stock_code.strip()
+        name = self.names.get(code)
+        if name:
+            self.metrics["hits"] += 1
+            return name
+        self.metrics["misses"] += 1
+        if code and code not in self._missing:
+            self._missing.add(code)
+            if self._wake is not None:
+                self._wake.set()
+        return None
+
+    async def load(self, db: AsyncSession):
+        """加载 symbols 表，并把交易记录中出现但表中没有的代码登记为待补全"""
+        result = await db.execute(select(Symbol.code, Symbol.name, Symbol.updated_at))
+        for code, name, updated_at in result.all():
+            if name:
+                self.names[code] = name
+                self._updated_at[code] = updated_at or datetime.min
+        result = await db.execute(select(distinct(Trade.stock_code)).where(Trade.is_deleted == False))
+        for (code,) in result.all():
+            if code and code.strip() and code.strip() not in self.names:
+                self._missing.add(code.strip())
+        self._loaded = True
+        logger.info(f"股票代码表已加载: {len(self.names)} 条，待补全 {len(self._missing)} 条")
+
+    def _due_codes(self) -> list[str]:
+        now = time.monotonic()
+        self._retry_at = {code: t for code, t in self._retry_at.items() if t > now}
+        stale_before = datetime.utcnow() - self.max_age
+        codes = [code for code in self._missing if self._retry_at.get(code, 0) <= now]
+        codes.extend(
+            code for code, updated_at in self._updated_at.items()
+            if updated_at < stale_before and self._retry_at.get(code, 0) <= now
+        )
+        return list(dict.fromkeys(codes))
+
+    @staticmethod
+    def _exchange(stock_code: str) -> Optional[str]:
+        normalized = price_monitor._normalize_stock_code(stock_code)
+        return normalized[:2] if normalized[:2] in ("sh", "sz") else None
+
+    async def _save(self, db: AsyncSession, names: Dict[str, str], now: datetime):
+        rows = [
+            {"code": code, "exchange": self._exchange(code), "name": name, "updated_at": now}
+            for code, name in names.items()
+        ]
+        insert = dialect_insert(db)
+        if insert is not None:
+            stmt = insert(Symbol).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Symbol.code],
+                set_={"exchange": stmt.excluded.exchange, "name": stmt.excluded.name, "updated_at": stmt.excluded.updated_at},
+            )
+            await db.execute(stmt)
+        else:
+            result = await db.execute(select(Symbol).where(Symbol.code.in_(list(names))))
+            existing = {symbol.code: symbol for symbol in result.scalars().all()}
+            for row in rows:
+                symbol = existing.get(row["code"])
+                if symbol is None:
+                    db.add(Symbol(**row))
+                else:
+                    symbol.exchange = row["exchange"]
+                    symbol.name = row["name"]
+                    symbol.updated_at = now
+        await db.commit()
+
+    async def refresh(self):
+        """批量拉取待补全/过期的名称并写回 symbols 表"""
+        async for db in get_db():
+            if not self._loaded:
+                await self.load(db)
+            codes = self._due_codes()
+            if not codes:
+                return
+            names = await price_monitor.fetch_stock_names(codes)
+            failed = [code for code in codes if code not in names]
+            if names:
+                now = datetime.utcnow()
+                await self._save(db, names, now)
+                for code, name in names.items():
+                    self.names[code] = name
+                    self._updated_at[code] = now
+                    self._missing.discard(code)
+                    self._retry_at.pop(code, None)
+            retry_at = time.monotonic() + self.retry_delay
+            for code in failed:
+                self._retry_at[code] = retry_at
+            self.metrics["fetched"] += len(names)
+            self.metrics["failed"] += len(failed)
+            logger.info(f"股票代码表刷新: 更新 {len(names)} 条，失败 {len(failed)} 条")
+
+    async def _refresh_loop(self):
+        while self.running:
+            try:
+                await self.refresh()
+                timeout = self.refresh_interval
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                # 数据库尚未初始化完成或行情接口异常时稍后重试
+                logger.error(f"股票代码表刷新失败: {e}")
+                timeout = self.retry_delay
+            if self._retry_at:
+                timeout = min(timeout, max(1.0, min(self._retry_at.values()) - time.monotonic()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def start(self):
+        """启动后台刷新任务"""
+        if self.running:
+            return
+        self.running = True
+        self._wake = asyncio.Event()
+        self.task = asyncio.create_task(self._refresh_loop())
+        logger.info("股票代码表刷新任务已启动")
+
+    async def stop(self):
+        """停止后台刷新任务"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        logger.info("股票代码表刷新任务已停止")
+
+    def get_metrics(self) -> Dict:
+        return {
+            "loaded": self._loaded,
+            "symbols": len(self.names),
+            "pending": len(self._missing),
+            **self.metrics,
+        }
+
+
+# 全局股票代码表
+symbol_directory = SymbolDirectory()
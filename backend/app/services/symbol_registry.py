@@ -0,0 +1,119 @@
+"""
+行情订阅登记表
+
+按 订阅者→代码 和 代码→订阅者 双向维护引用计数，订阅变更只处理增量：
+- 价格循环每轮直接取缓存的活跃代码列表和预分块批次，不再每轮合并所有订阅者的集合
+- 只有代码首次被订阅或最后一个订阅者退订时，活跃代码集合才变化，批次按需重建
+- subscribers_of(code) 用于把变化的报价只分发给订阅了该代码的订阅者
+"""
+
+from typing import Dict, Iterable, Set
+
+_EMPTY: frozenset = frozenset()
+
+
+class SymbolRegistry:
+    """带引用计数的订阅登记表"""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = max(1, int(batch_size))
+        self._by_subscriber: Dict[str, Set[str]] = {}  # subscriber -> codes
+        self._subscribers: Dict[str, Set[str]] = {}  # code -> subscribers（集合大小即引用计数）
+        self._universe: tuple[str, ...] = ()
+        self._batches: tuple[list[str], ...] = ()
+        self._dirty = False
+        self.version = 0  # 活跃代码集合每变化一次加一
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._subscribers
+
+    def _add(self, subscriber: str, codes: Iterable[str]):
+        for code in codes:
+            holders = self._subscribers.get(code)
+            if holders is None:
+                self._subscribers[code] = {subscriber}
+                self._dirty = True
+            else:
+                holders.add(subscriber)
+
+    def _remove(self, subscriber: str, codes: Iterable[str]):
+        for code in codes:
+            holders = self._subscribers.get(code)
+            if holders is None:
+                continue
+            holders.discard(subscriber)
+            if not holders:
+                del self._subscribers[code]
+                self._dirty = True
+
+    def subscribe(self, subscriber: str, codes: Iterable[str]):
+        """替换订阅者的代码集合（只按差集增减引用）"""
+        new_codes = {code for code in codes if code}
+        old_codes = self._by_subscriber.get(subscriber, set())
+        self._remove(subscriber, old_codes - new_codes)
+        self._add(subscriber, new_codes - old_codes)
+        if new_codes:
+            self._by_subscriber[subscriber] = new_codes
+        else:
+            self._by_subscriber.pop(subscriber, None)
+
+    def add(self, subscriber: str, codes: Iterable[str]):
+        """为订阅者追加代码"""
+        current = self._by_subscriber.setdefault(subscriber, set())
+        added = {code for code in codes if code} - current
+        current.update(added)
+        self._add(subscriber, added)
+
+    def remove(self, subscriber: str, codes: Iterable[str]):
+        """为订阅者移除部分代码"""
+        current = self._by_subscriber.get(subscriber)
+        if not current:
+            return
+        removed = current.intersection(codes)
+        current.difference_update(removed)
+        self._remove(subscriber, removed)
+        if not current:
+            del self._by_subscriber[subscriber]
+
+    def unsubscribe(self, subscriber: str) -> bool:
+        """移除订阅者的全部订阅，返回订阅者此前是否存在"""
+        codes = self._by_subscriber.pop(subscriber, None)
+        if codes is None:
+            return False
+        self._remove(subscriber, codes)
+        return True
+
+    def codes_of(self, subscriber: str) -> frozenset:
+        return frozenset(self._by_subscriber.get(subscriber, _EMPTY))
+
+    def subscribers_of(self, code: str) -> Set[str]:
+        """订阅了该代码的订阅者（只读视图，调用方不要修改）"""
+        return self._subscribers.get(code, _EMPTY)
+
+    def _rebuild(self):
+        self._universe = tuple(sorted(self._subscribers))
+        size = self.batch_size
+        self._batches = tuple(list(self._universe[i:i + size]) for i in range(0, len(self._universe), size))
+        self._dirty = False
+        self.version += 1
+
+    @property
+    def universe(self) -> tuple[str, ...]:
+        """当前活跃代码（排序后的稳定顺序，集合不变时返回同一对象）"""
+        if self._dirty:
+            self._rebuild()
+        return self._universe
+
+    @property
+    def batches(self) -> tuple[list[str], ...]:
+        """按 batch_size 预分块的活跃代码，集合不变时返回同一对象"""
+        if self._dirty:
+            self._rebuild()
+        return self._batches
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._by_subscriber)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""行情解析微基准：对比旧的 text+split 解析与 quote_parser 的字节级解析
+
+用法: python benchmark_quote_parser.py [代码数量] [重复次数]
+"""
+
+import sys
+import timeit
+
+from app.services.quote_parser import build_code_map, parse_sina, parse_tencent
+
+# 抓取的真实响应样本（GBK 编码），按代码数量复制扩展
+SINA_FIXTURE = (
+    'var hq_str_sh600000="浦发银行,10.250,10.230,10.310,10.350,10.200,10.300,10.310,'
+    '35218900,362158642.000,18300,10.300,62400,10.290,40200,10.280,37700,10.270,27300,10.260,'
+    '25600,10.310,110700,10.320,95800,10.330,72900,10.340,135200,10.350,2024-05-17,15:00:03,00,";\n'
+)
+TENCENT_FIXTURE = (
+    'v_sh600000="1~浦发银行~600000~10.31~10.23~10.25~352189~178920~173269~10.30~183~10.29~624~'
+    '10.28~402~10.27~377~10.26~273~10.31~1107~10.32~958~10.33~729~10.34~1352~10.35~256~~'
+    '20240517150003~0.08~0.78~10.35~10.20~10.31/352189/362158642~352189~36216~0.12~5.36~~'
+    '10.35~10.20~1.47~3026.50~3026.50~0.43~11.25~9.21~1.10~-125~10.28~5.72~5.80~~~0.89~36216~'
+    '0.0000~0~ ~GP-A~3.52~1.28~4.75~8.42~7.33~10.84~7.42~1.28~2.59~0.61~29355726639~29355726639~'
+    '-47.38~12.91~29355726639~~~~~~~~CNY~0~~10.38~2098";\n'
+)
+
+
+def make_payload(template: str, count: int) -> tuple[bytes, list[str]]:
+    codes = [f"{600000 + i:06d}" for i in range(count)]
+    body = "".join(template.replace("600000", code) for code in codes)
+    return body.encode("gbk"), codes
+
+
+def legacy_parse_sina(text: str, code_map: dict) -> dict:
+    results = {}
+    for line in text.split('\n'):
+        if 'hq_str_' in line and '=' in line:
+            try:
+                norm_code = line.split('hq_str_')[1].split('=')[0]
+                if norm_code in code_map:
+                    data_str = line.split('=')[1].strip().strip('";')
+                    if data_str and ',' in data_str:
+                        parts = data_str.split(',')
+                        if len(parts) >= 4:
+                            price = float(parts[3])
+                            if price > 0:
+                                results[code_map[norm_code]] = (round(price, 2), parts[0].strip(), "新浪财经")
+            except Exception:
+                continue
+    return results
+
+
+def legacy_parse_tencent(text: str, code_map: dict) -> dict:
+    results = {}
+    for line in text.split(';'):
+        if 'v_' in line and '=' in line:
+            try:
+                norm_code = line.split('v_')[1].split('=')[0]
+                if norm_code in code_map:
+                    data_str = line.split('=')[1].strip().strip('"')
+                    if data_str and '~' in data_str:
+                        parts = data_str.split('~')
+                        if len(parts) >= 4:
+                            results[code_map[norm_code]] = (round(float(parts[3]), 2), parts[1].strip(), "腾讯财经")
+            except Exception:
+                continue
+    return results
+
+
+def bench(label: str, func, repeat: int, count: int):
+    elapsed = min(timeit.repeat(func, number=repeat, repeat=3))
+    per_call = elapsed / repeat * 1e6
+    print(f"  {label:<28} {per_call:10.1f} µs/次  {per_call / count:8.3f} µs/代码")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    for vendor, template, prefix, legacy, fast in (
+        ("新浪", SINA_FIXTURE, "sh", legacy_parse_sina, parse_sina),
+        ("腾讯", TENCENT_FIXTURE, "sh", legacy_parse_tencent, parse_tencent),
+    ):
+        body, codes = make_payload(template, count)
+        normalized = [f"{prefix}{code}" for code in codes]
+        str_map = dict(zip(normalized, codes))
+        bytes_map = build_code_map(normalized, codes)
+
+        # 结果一致性校验
+        expected = legacy(body.decode("gbk"), str_map)
+        assert fast(body, bytes_map) == expected, f"{vendor} 解析结果不一致"
+        assert {k: v[0] for k, v in fast(body, bytes_map, with_names=False).items()} == \
+            {k: v[0] for k, v in expected.items()}
+
+        print(f"{vendor}: {count} 个代码, 响应 {len(body)} 字节")
+        bench("旧解析(解码+split)", lambda: legacy(body.decode("gbk"), str_map), repeat, count)
+        bench("字节解析(含名称)", lambda: fast(body, bytes_map), repeat, count)
+        bench("字节解析(仅价格)", lambda: fast(body, bytes_map, with_names=False), repeat, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,9 +24,16 @@ else:
     logger_temp.warning(f"⚠️ 环境变量文件不存在: {env_path}")
 
 from app.database import init_db
-from app.routers import auth, user, trades, positions, analysis, price, forex, admin
+from app.routers import auth, user, trades, positions, analysis, price, forex, admin, realtime
 from app.services.price_monitor import price_monitor
 from app.services.alert_monitor import alert_monitor
+from app.services.email_queue import alert_email_queue
+from app.services.recompute_scheduler import recompute_scheduler
+from app.services.password_hasher import password_hasher
+from app.services.symbol_directory import symbol_directory
+from app.services.push_hub import push_hub
+from app.services.market_data import market_data
+from app.routers.user import rebuild_capital_history_by_beijing_date
 
 # 配置日志
 logging.basicConfig(
@@ -84,29 +91,39 @@ async def lifespan(app: FastAPI):
         except asyncio.TimeoutError as e:
             logger.error(f"❌ [数据库] 数据库初始化超时: {e}", exc_info=True)
             logger.warning("⚠️  [数据库] 数据库初始化失败，但应用将继续运行")
+            return
         except Exception as e:
             logger.error(f"❌ [数据库] 数据库初始化失败: {e}", exc_info=True)
             logger.warning("⚠️  [数据库] 数据库初始化失败，但应用将继续运行")
+            return
+        # 一次性迁移：按北京时间日期重建旧资金曲线（后台执行，不阻塞请求）
+        try:
+            await rebuild_capital_history_by_beijing_date()
+        except Exception as e:
+            logger.error(f"❌ [数据库] 资金曲线重建失败: {e}", exc_info=True)
 
     asyncio.create_task(_init_db_background())
     
-    # 启动价格监控服务（非关键服务，失败不阻止启动）
-    logger.info("📊 [价格监控] 正在启动价格监控服务...")
+    # 启动股票代码表刷新任务（非关键服务，失败不阻止启动）
+    try:
+        await symbol_directory.start()
+    except Exception as e:
+        logger.error(f"❌ [代码表] 股票代码表刷新任务启动失败: {e}", exc_info=True)
+    
+    # 启动闹铃邮件发送队列（非关键服务，失败不阻止启动）
     try:
-        await price_monitor.start()
-        logger.info("✅ [价格监控] 价格监控服务已启动")
+        await alert_email_queue.start()
     except Exception as e:
-        logger.error(f"❌ [价格监控] 价格监控服务启动失败: {e}", exc_info=True)
-        logger.warning("⚠️  [价格监控] 价格监控服务启动失败，但应用将继续运行")
+        logger.error(f"❌ [邮件队列] 邮件发送队列启动失败: {e}", exc_info=True)
     
-    # 启动闹铃监控服务（非关键服务，失败不阻止启动）
-    logger.info("🔔 [闹铃监控] 正在启动闹铃监控服务...")
+    # 启动价格监控和闹铃监控（按 MARKET_DATA_MODE 决定本进程角色；非关键服务，失败不阻止启动）
+    logger.info("📊 [价格监控] 正在启动价格监控和闹铃监控服务...")
     try:
-        await alert_monitor.start()
-        logger.info("✅ [闹铃监控] 闹铃监控服务已启动")
+        await market_data.start()
+        logger.info(f"✅ [价格监控] 行情服务已启动，角色: {market_data.role}")
     except Exception as e:
-        logger.error(f"❌ [闹铃监控] 闹铃监控服务启动失败: {e}", exc_info=True)
-        logger.warning("⚠️  [闹铃监控] 闹铃监控服务启动失败，但应用将继续运行")
+        logger.error(f"❌ [价格监控] 行情服务启动失败: {e}", exc_info=True)
+        logger.warning("⚠️  [价格监控] 行情服务启动失败，但应用将继续运行")
     
     # 检查AI配置
     logger.info("🤖 [AI配置] 正在检查AI配置...")
@@ -131,8 +148,13 @@ async def lifespan(app: FastAPI):
     
     # 关闭时停止服务
     logger.info("🛑 正在停止服务...")
-    await alert_monitor.stop()
-    await price_monitor.stop()
+    await push_hub.close_all()
+    await symbol_directory.stop()
+    await market_data.stop()
+    await alert_email_queue.stop()
+    # 执行完待处理的资金曲线重算，避免丢失写入后的重算
+    await recompute_scheduler.drain()
+    password_hasher.shutdown()
     logger.info("✅ 服务已关闭")
 
 app = FastAPI(
@@ -304,6 +326,7 @@ app.include_router(analysis.router, prefix="/api/analysis", tags=["AI分析"])
 app.include_router(price.router, prefix="/api/price", tags=["价格"])
 app.include_router(forex.router, prefix="/api/forex", tags=["外汇"])
 app.include_router(admin.router, prefix="/api/admin", tags=["管理员"])
+app.include_router(realtime.router, prefix="/api/realtime", tags=["实时推送"])
 logger.info("✅ 路由注册完成")
 
 @app.get("/")
@@ -410,6 +433,11 @@ async def health_check(request: Request):
             "version": "1.0.0",
             "price_monitor": price_monitor_status,
             "alert_monitor": alert_monitor_status,
+            "email_queue": alert_email_queue.get_metrics(),
+            "password_hasher": password_hasher.get_metrics(),
+            "symbols": symbol_directory.get_metrics(),
+            "push": push_hub.get_metrics(),
+            "market_data": market_data.get_status(),
             "environment": env_status,
             "database": db_info,
             "timestamp": datetime.now().isoformat()